@@ -0,0 +1,325 @@
+import argparse
+import contextlib
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import personal_assistant as pa
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Набор замеров personal_assistant.py на синтетических данных.
+#   python benchmark.py run --scales 1000,100000 --output results.json [--storage json] [--memory]
+#   python benchmark.py diff old.json new.json [--threshold 10]
+# Данные генерируются детерминированно (--seed), поэтому результаты разных версий сравнимы
+
+DEFAULT_SCALES = (1000, 100000)
+# Сколько точечных операций (поиск по id, правка, удаление, вычисление) замеряется на каждом масштабе
+POINT_OPERATIONS = 1000
+WORDS = ('отчёт', 'встреча', 'проект', 'бюджет', 'план', 'звонок', 'покупка', 'ремонт', 'отпуск', 'договор',
+         'report', 'meeting', 'budget', 'review', 'release', 'invoice', 'travel', 'doctor', 'school', 'garden')
+FIRST_NAMES = ('Иван', 'Анна', 'Пётр', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга', 'John', 'Kate', 'Alex', 'Nina')
+LAST_NAMES = ('Иванов', 'Петрова', 'Сидоров', 'Смирнова', 'Кузнецов', 'Попова', 'Smith', 'Brown', 'Miller', 'Lee')
+DOMAINS = ('mail.ru', 'gmail.com', 'yandex.ru', 'example.org', 'work.com')
+CATEGORIES = ('Еда', 'Транспорт', 'Жильё', 'Зарплата', 'Здоровье', 'Развлечения', 'Связь', 'Подарки')
+EXPRESSIONS = ('2 * (3 + 4)', '-1.5 ** 2 + 10 / 4', '(100 - 7) % 9', '12.5 * 3 - (4 / 8) ** 0.5', '1 + 2 + 3 + 4 + 5')
+FIRST_DAY = datetime(2020, 1, 1)
+
+
+def random_date(rng):
+    return (FIRST_DAY + timedelta(days=rng.randrange(6 * 365))).strftime('%d-%m-%Y')
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_notes(rng, count):
+    for number in range(count):
+        yield {"title": f"{random_text(rng, 2)} {number}", "content": random_text(rng, rng.randint(5, 40))}
+
+
+def generate_tasks(rng, count):
+    for number in range(count):
+        yield {"title": f"{random_text(rng, 2)} {number}", "description": random_text(rng, 6),
+               "priority": rng.choice(pa.TaskManager.PRIORITIES),
+               "due_date": random_date(rng) if rng.random() < 0.8 else None}
+
+
+def generate_contacts(rng, count):
+    for number in range(count):
+        first = rng.choice(FIRST_NAMES)
+        yield {"name": f"{first} {rng.choice(LAST_NAMES)} {number}", "phone": f"79{rng.randrange(10 ** 9):09d}",
+               "email": f"user{number}@{rng.choice(DOMAINS)}"}
+
+
+def generate_records(rng, count):
+    for _ in range(count):
+        category = rng.choice(CATEGORIES)
+        amount = round(rng.uniform(1000, 150000), 2) if category == 'Зарплата' else -round(rng.uniform(10, 5000), 2)
+        yield {"amount": amount, "category": category, "date": random_date(rng), "description": random_text(rng, 3)}
+
+
+class Benchmark:
+    def __init__(self, directory, storage_mode='json', codec='json', seed=1, memory=False, finance_partitions=None):
+        self.directory = directory
+        self.storage_mode = storage_mode
+        self.codec = codec
+        self.finance_partitions = finance_partitions
+        self.seed = seed
+        self.memory = memory
+        self.results = {}
+        self._devnull = open(os.devnull, 'w', encoding='utf-8')
+
+    def close(self):
+        self._devnull.close()
+
+    def _rng(self, name, scale):
+        return random.Random(f"{self.seed}:{name}:{scale}")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _storage(self, filename):
+        if self.finance_partitions and 'finance' in filename:
+            return pa.PartitionedStorage(self._path(filename), self.finance_partitions, self.codec)
+        return pa.make_storage(self._path(filename), self.storage_mode, self.codec)
+
+    # Замер одной операции: время и, с --memory, пик выделенной памяти Python (tracemalloc замедляет код,
+    # поэтому время и память лучше снимать отдельными запусками). Вывод менеджеров подавляется
+    def measure(self, name, func, ops=1):
+        gc.collect()
+        if self.memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(self._devnull):
+            result = func()
+        elapsed = time.perf_counter() - started
+        entry = {"seconds": round(elapsed, 6), "ops": ops, "per_op_us": round(elapsed / ops * 1e6, 3)}
+        if self.memory:
+            entry["peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        self.results[name] = entry
+        print(f"  {name:<24} {elapsed:10.4f} с  ({entry['per_op_us']:.1f} мкс/оп)"
+              + (f", пик {entry['peak_kb']} КБ" if self.memory else ''))
+        return result
+
+    # Общий сценарий для хранилища: вставка, сохранение, загрузка, точечные операции и CSV.
+    # add/get/edit - функции (менеджер, данные/номер), чтобы сценарий не зависел от сигнатур методов.
+    # Удаление замеряется последним, в finish_store, после операций, специфичных для хранилища
+    def run_store(self, name, filename, factory, rows, add, get, edit):
+        manager = factory(self._storage(filename))
+        self.measure(f"{name}.insert", lambda: self._insert(manager, rows, add), len(rows))
+        self.measure(f"{name}.save", manager._save_items)
+        manager.close()
+        manager = self.measure(f"{name}.load", lambda: factory(self._storage(filename)))
+        rng = self._rng(name, len(rows))
+        ids = [rng.randint(1, len(rows)) for _ in range(min(POINT_OPERATIONS, len(rows)))]
+        self.measure(f"{name}.get", lambda: [get(manager, item_id) for item_id in ids], len(ids))
+        if edit is not None:
+            self.measure(f"{name}.edit", lambda: self._batch(manager, ids, edit), len(ids))
+        csv_path = self._path(f"{name}.csv")
+        self.measure(f"{name}.export_csv", lambda: manager_export(manager, csv_path), len(rows))
+        imported = factory(self._storage(f"imported_{filename}"))
+        self.measure(f"{name}.import_csv", lambda: imported._import_csv(csv_path), len(rows))
+        imported.close()
+        return manager, ids
+
+    def finish_store(self, name, manager, ids, delete):
+        unique = sorted(set(ids))
+        self.measure(f"{name}.delete", lambda: self._batch(manager, unique, delete), len(unique))
+        manager.close()
+
+    @staticmethod
+    def _insert(manager, rows, add):
+        with manager.batch():
+            for row in rows:
+                add(manager, row)
+
+    @staticmethod
+    def _batch(manager, ids, operation):
+        with manager.batch():
+            for item_id in ids:
+                operation(manager, item_id)
+
+    # Листание списка: count страниц подряд, каждая начинается с курсора предыдущей
+    @staticmethod
+    def _pages(show_page, count):
+        cursor = None
+        for _ in range(count):
+            cursor = show_page(cursor)
+            if cursor is None:
+                break
+
+    def run_notes(self, scale):
+        rows = list(generate_notes(self._rng('notes', scale), scale))
+        manager, ids = self.run_store(
+            'notes', 'notes.json', lambda storage: pa.NoteManager(storage.filepath, storage), rows,
+            add=lambda m, row: m.create_note(row["title"], row["content"]),
+            get=lambda m, note_id: m.get_note_by_id(note_id),
+            edit=lambda m, note_id: m.edit_note(note_id, f"правка {note_id}", "новый текст заметки"))
+        queries = ('бюджет', 'проект встреча', 'release invoice', 'отпуск')
+        self.measure('notes.search', lambda: [manager.search_notes(query) for query in queries], len(queries))
+        self.finish_store('notes', manager, ids, lambda m, note_id: m.delete_note(note_id))
+
+    def run_tasks(self, scale):
+        rows = list(generate_tasks(self._rng('tasks', scale), scale))
+        manager, ids = self.run_store(
+            'tasks', 'tasks.json', lambda storage: pa.TaskManager(storage.filepath, storage), rows,
+            add=lambda m, row: m.add_task(row["title"], row["description"], row["priority"], row["due_date"]),
+            get=lambda m, task_id: m.get_task_by_id(task_id),
+            edit=lambda m, task_id: m.edit_task(task_id, f"правка {task_id}", "описание", 'Высокий', '01-06-2024'))
+        filters = [('status', False), ('priority', 'Высокий'), ('due_date', '01-06-2024'),
+                   [('status', False), ('priority', 'Низкий'), ('due_by', '31-12-2021')]]
+        self.measure('tasks.filter', lambda: [manager.list_tasks(filter_by) for filter_by in filters], len(filters))
+        self.measure('tasks.due', lambda: manager.show_due_tasks(10))
+        self.finish_store('tasks', manager, ids, lambda m, task_id: m.delete_task(task_id))
+
+    def run_contacts(self, scale):
+        rows = list(generate_contacts(self._rng('contacts', scale), scale))
+        manager, ids = self.run_store(
+            'contacts', 'contacts.json', lambda storage: pa.ContactManager(storage.filepath, storage), rows,
+            add=lambda m, row: m.add_contact(row["name"], row["phone"], row["email"]),
+            get=lambda m, contact_id: m.get_contact_by_id(contact_id),
+            edit=lambda m, contact_id: m.edit_contact(contact_id, f"Правка {contact_id}", '79000000000',
+                                                      f"edit{contact_id}@mail.ru"))
+        keywords = ('Анна Петрова 1', 'smith', '7912345', 'user42@', '@work.com')
+        self.measure('contacts.search', lambda: [manager.search_contacts(keyword) for keyword in keywords],
+                     len(keywords))
+        self.finish_store('contacts', manager, ids, lambda m, contact_id: m.delete_contact(contact_id))
+
+    def run_finance(self, scale):
+        rows = list(generate_records(self._rng('finance', scale), scale))
+        manager, ids = self.run_store(
+            'finance', 'finance.json', lambda storage: pa.FinanceManager(storage.filepath, storage), rows,
+            add=lambda m, row: m.add_record(row["amount"], row["category"], row["date"], row["description"]),
+            get=lambda m, record_id: m.get_record_by_id(record_id),
+            edit=None)
+        ranges = [('01-01-2021', '31-12-2021'), ('15-03-2022', '20-04-2022'), ('01-01-2020', '31-12-2025')]
+        self.measure('finance.report', lambda: [manager.generate_report(start, end) for start, end in ranges],
+                     len(ranges))
+        self.measure('finance.balance', manager.get_balance)
+        self.measure('finance.top', lambda: manager.top_expenses(10, '01-01-2023', '31-12-2023'))
+        self.measure('finance.pages', lambda: self._pages(
+            lambda cursor: manager.list_records(cursor=cursor, sort='date'), 50), 50)
+        self.finish_store('finance', manager, ids, lambda m, record_id: m.delete_record(record_id))
+
+    def run_calculator(self, scale):
+        app = pa.PersonalAssistantApp.__new__(pa.PersonalAssistantApp)
+        count = min(scale, POINT_OPERATIONS * 10)
+        rng = self._rng('calc', scale)
+        expressions = [f"{rng.choice(EXPRESSIONS)} + {number % 97}" for number in range(count)]
+        pa.compile_expression.cache_clear()
+        self.measure('calc.safe_eval', lambda: [app.safe_eval(expr) for expr in expressions], count)
+        self.measure('calc.safe_eval_cached', lambda: [app.safe_eval(expr) for expr in expressions], count)
+
+
+def manager_export(manager, csv_path):
+    exporters = {pa.NoteManager: 'export_notes_csv', pa.TaskManager: 'export_tasks_csv',
+                 pa.ContactManager: 'export_contacts_csv', pa.FinanceManager: 'export_records_csv'}
+    return getattr(manager, exporters[type(manager)])(csv_path)
+
+
+def source_version():
+    with open(pa.__file__, 'rb') as source:
+        return hashlib.sha1(source.read()).hexdigest()[:12]
+
+
+def run(args):
+    scales = [int(scale) for scale in args.scales.split(',')]
+    report = {"created": datetime.now().isoformat(timespec='seconds'), "label": args.label,
+              "source": source_version(), "python": platform.python_version(),
+              "storage": args.storage, "codec": args.codec, "seed": args.seed, "memory": args.memory,
+              "finance_partitions": args.finance_partitions, "scales": {}}
+    for scale in scales:
+        print(f"Масштаб {scale}:")
+        with tempfile.TemporaryDirectory(prefix='pa-bench-') as directory:
+            benchmark = Benchmark(directory, args.storage, args.codec, args.seed, args.memory,
+                                  args.finance_partitions)
+            try:
+                for section in ('notes', 'tasks', 'contacts', 'finance', 'calculator'):
+                    getattr(benchmark, f"run_{section}")(scale)
+            finally:
+                benchmark.close()
+        # ru_maxrss - пик за всё время процесса, в Linux в КБ
+        if resource is not None:
+            benchmark.results["process.max_rss_mb"] = {
+                "value": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+        report["scales"][str(scale)] = benchmark.results
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+    return 0
+
+
+# Сравнение двух файлов результатов: изменение времени каждой операции в процентах.
+# Изменения меньше min_delta секунд не отмечаются - на малых масштабах это шум.
+# Код завершения 1, если хотя бы одна операция замедлилась больше порога
+def diff(args):
+    with open(args.old, encoding='utf-8') as old_file, open(args.new, encoding='utf-8') as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print(f"Было: {args.old} ({old.get('label') or old['source']}), стало: {args.new} "
+          f"({new.get('label') or new['source']})")
+    regressions = 0
+    for scale in sorted(set(old["scales"]) | set(new["scales"]), key=int):
+        old_results = old["scales"].get(scale, {})
+        new_results = new["scales"].get(scale, {})
+        print(f"\nМасштаб {scale}:")
+        for name in sorted(set(old_results) | set(new_results)):
+            before = old_results.get(name, {}).get("seconds", old_results.get(name, {}).get("value"))
+            after = new_results.get(name, {}).get("seconds", new_results.get(name, {}).get("value"))
+            if before is None or after is None:
+                print(f"  {name:<24} {'только в новом' if before is None else 'только в старом'}")
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            mark = ''
+            if abs(after - before) < args.min_delta:
+                pass
+            elif change > args.threshold:
+                mark = '  МЕДЛЕННЕЕ'
+                regressions += 1
+            elif change < -args.threshold:
+                mark = '  быстрее'
+            print(f"  {name:<24} {before:10.4f} -> {after:10.4f} {change:+7.1f}%{mark}")
+    print(f"\nЗамедлений больше {args.threshold}%: {regressions}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности personal_assistant.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="выполнить замеры")
+    run_parser.add_argument('--scales', default=','.join(str(scale) for scale in DEFAULT_SCALES),
+                            help="размеры данных через запятую, например 1000,100000,1000000")
+    run_parser.add_argument('--storage', default='json', choices=('json', 'journal', 'sqlite'))
+    run_parser.add_argument('--codec', default='json', help="кодек файлов хранилищ, см. PA_CODEC")
+    run_parser.add_argument('--finance-partitions', choices=tuple(pa.PartitionedStorage.PERIODS),
+                            help="хранить финансы секциями по периодам, см. PA_FINANCE_PARTITIONS")
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--memory', action='store_true', help="замерять пик памяти (медленнее)")
+    run_parser.add_argument('--label', default='', help="метка версии в файле результатов")
+    run_parser.add_argument('--output', help="файл JSON для результатов")
+    diff_parser = commands.add_parser('diff', help="сравнить два файла результатов")
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.add_argument('--threshold', type=float, default=10.0, help="порог замедления в процентах")
+    diff_parser.add_argument('--min-delta', type=float, default=0.005,
+                             help="минимальная разница в секундах, которая считается изменением")
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else diff(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
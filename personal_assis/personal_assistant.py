@@ -1,9 +1,47 @@
+import asyncio
 import json
 import csv
 import os
-from datetime import datetime
+import atexit
+import collections
+import contextlib
+import cProfile
+import gzip
+import io
+import lzma
+import marshal
+import mmap
+import itertools
+import shlex
+import sqlite3
+import bisect
+import heapq
+import math
+import functools
+from array import array
+from datetime import datetime, timedelta
 import operator
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 
 # Утилиты для работы с датами
@@ -11,18 +49,2236 @@ def get_current_timestamp():
     return datetime.now().strftime("%d-%m-%Y %H:%M:%S")
 
 
+# Строки точного формата ДД-ММ-ГГГГ[ ЧЧ:ММ:СС] разбираются срезами; strptime остаётся для остальных
+# (например, без ведущих нулей), чтобы принимались те же даты, что и раньше
+def _parse_fixed(date_str, with_time):
+    if len(date_str) != (19 if with_time else 10) or date_str[2] != '-' or date_str[5] != '-':
+        return None
+    parts = [date_str[6:10], date_str[3:5], date_str[0:2]]
+    if with_time:
+        if date_str[10] != ' ' or date_str[13] != ':' or date_str[16] != ':':
+            return None
+        parts += [date_str[11:13], date_str[14:16], date_str[17:19]]
+    if not all(part.isdecimal() for part in parts):
+        return None
+    return datetime(*map(int, parts))
+
+
 def parse_date(date_str, with_time=False):
+    if not with_time:
+        ordinal = date_to_ordinal(date_str)
+        return datetime.fromordinal(ordinal) if ordinal else None
     try:
-        if with_time:
-            return datetime.strptime(date_str, "%d-%m-%Y %H:%M:%S")
-        else:
-            return datetime.strptime(date_str, "%d-%m-%Y")
+        return _parse_fixed(date_str, True) or datetime.strptime(date_str, "%d-%m-%Y %H:%M:%S")
+    except ValueError:
+        return None
+
+
+# Повторяющиеся короткие строки (категории, приоритеты, даты) хранятся в одном экземпляре
+def intern_text(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# Порядковый номер дня (datetime.toordinal) - внутреннее представление даты: записи хранят его рядом
+# со строкой, индексы и фильтры сравнивают числа. Повторяющиеся даты берутся из ограниченного кэша
+@functools.lru_cache(maxsize=16384)
+def date_to_ordinal(date_str):
+    if not date_str or type(date_str) is not str:
+        return None
+    try:
+        date = _parse_fixed(date_str, False) or datetime.strptime(date_str, "%d-%m-%Y")
     except ValueError:
         return None
-        
+    return date.toordinal()
+
+
+# Номер дня для записей без даты в сортировках: после любой настоящей даты
+UNDATED_ORDINAL = datetime.max.toordinal() + 1
+
+
+def ordinal_to_date(ordinal):
+    return datetime.fromordinal(ordinal).strftime("%d-%m-%Y") if ordinal else None
+
+
+@functools.lru_cache(maxsize=4096)
+def month_key(date_str):
+    ordinal = date_to_ordinal(date_str)
+    if not ordinal:
+        return None
+    date = datetime.fromordinal(ordinal)
+    return f"{date.year:04d}-{date.month:02d}"
+
+
+def next_month(date):
+    return datetime(date.year + date.month // 12, date.month % 12 + 1, 1)
+
+
+STORAGE_ERRORS = (IOError, sqlite3.Error)
+
+
+# Метрики горячих путей: по каждой операции - число вызовов и ошибок, гистограмма времени выполнения,
+# байты, прочитанные и записанные хранилищем. По умолчанию выключены: обёртки ставятся на методы только
+# в enable_metrics(), а учёт байтов в хранилищах стоит одной проверки флага
+class Metrics:
+    # Верхние границы корзин гистограммы, секунды
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+    FORMATS = ('json', 'prometheus')
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self._operations = {}
+        self._lock = threading.Lock()
+        # Стек измеряемых операций потока: байты относятся к самой внутренней из них
+        self._local = threading.local()
+
+    def _operation(self, name):
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations[name] = {
+                "calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "buckets": [0] * (len(self.BUCKETS) + 1), "bytes_read": 0, "bytes_written": 0}
+        return operation
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def observe(self, name, seconds, failed=False):
+        with self._lock:
+            operation = self._operation(name)
+            operation["calls"] += 1
+            operation["errors"] += failed
+            operation["seconds"] += seconds
+            operation["max_seconds"] = max(operation["max_seconds"], seconds)
+            operation["buckets"][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def add_bytes(self, read=0, written=0):
+        stack = self._stack()
+        with self._lock:
+            operation = self._operation(stack[-1] if stack else 'other')
+            operation["bytes_read"] += read
+            operation["bytes_written"] += written
+
+    # Обёртка функции, измеряющая каждый её вызов как операцию name
+    def timed(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            stack.append(name)
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                stack.pop()
+                self.observe(name, time.perf_counter() - started, failed)
+        wrapper.metric_name = name
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            operations = {name: dict(operation, buckets=list(operation["buckets"]))
+                          for name, operation in sorted(self._operations.items())}
+        bounds = [str(bound) for bound in self.BUCKETS] + ['+Inf']
+        for operation in operations.values():
+            operation["mean_ms"] = operation["seconds"] / operation["calls"] * 1000 if operation["calls"] else 0.0
+            operation["buckets"] = dict(zip(bounds, operation["buckets"]))
+        cache = calculator_cache_info()
+        return {"enabled": self.enabled, "uptime_seconds": time.time() - self.started,
+                "operations": operations,
+                "calculator_cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize}}
+
+    # Текстовый формат Prometheus: гистограммы с накопленными корзинами и счётчики по операциям
+    def prometheus(self):
+        data = self.snapshot()
+        lines = ["# TYPE pa_operation_seconds histogram"]
+        for name, operation in data["operations"].items():
+            total = 0
+            for bound, count in operation["buckets"].items():
+                total += count
+                lines.append(f'pa_operation_seconds_bucket{{op="{name}",le="{bound}"}} {total}')
+            lines.append(f'pa_operation_seconds_sum{{op="{name}"}} {operation["seconds"]:.6f}')
+            lines.append(f'pa_operation_seconds_count{{op="{name}"}} {operation["calls"]}')
+        for metric, field in (('pa_operation_errors_total', 'errors'), ('pa_bytes_read_total', 'bytes_read'),
+                              ('pa_bytes_written_total', 'bytes_written')):
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f'{metric}{{op="{name}"}} {operation[field]}'
+                         for name, operation in data["operations"].items())
+        for name, value in data["calculator_cache"].items():
+            metric = f"pa_calculator_cache_{name}" + ('' if name == 'size' else '_total')
+            lines.append(f"# TYPE {metric} {'gauge' if name == 'size' else 'counter'}")
+            lines.append(f"{metric} {value}")
+        lines.append("# TYPE pa_uptime_seconds gauge")
+        lines.append(f"pa_uptime_seconds {data['uptime_seconds']:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def render(self, output_format='json'):
+        if output_format == 'prometheus':
+            return self.prometheus()
+        if output_format == 'json':
+            return json.dumps(self.snapshot(), ensure_ascii=False, indent=2) + '\n'
+        raise ValueError(f"Неизвестный формат метрик: {output_format}. Форматы: {', '.join(self.FORMATS)}.")
+
+
+METRICS = Metrics()
+
+
+# Межпроцессная блокировка хранилища на отдельном файле; повторный захват тем же процессом (вложенные
+# вызовы) не блокирует. Без fcntl и msvcrt блокировка действует только между потоками одного процесса
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._depth = 0
+        self._file = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        if not self._depth:
+            try:
+                self._file = open(self.path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+            except OSError:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if not self._depth:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Отпечаток записи для оптимистической проверки: совпадает, только если запись не менялась
+def record_fingerprint(data):
+    return None if data is None else hash(json.dumps(data, ensure_ascii=False, sort_keys=True))
+
+
+# Запись через временный файл и переименование: после сбоя на диске остаётся старая или новая версия целиком
+def atomic_write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if METRICS.enabled:
+            METRICS.add_bytes(written=len(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Записи коллекции для сохранения: имена полей один раз и строки-кортежи, собранные из записей без
+# словаря на каждую. Словари строятся только там, где нужны (JSON, колонки SQLite) - при переборе
+class RecordRows:
+    __slots__ = ('fields', 'rows')
+
+    def __init__(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return map(dict, map(zip, itertools.repeat(self.fields), self.rows))
+
+
+# Кодек файла хранилища: формат (json - с отступами, как раньше; json-compact; marshal - двоичный)
+# и необязательное сжатие через "+": "marshal+gzip", "json-compact+lzma". При чтении формат и сжатие
+# определяются по содержимому, поэтому файлы любого кодека, в том числе старые, открываются всегда
+class Codec:
+    FORMATS = ('json', 'json-compact', 'marshal')
+    COMPRESSIONS = {'gzip': gzip, 'lzma': lzma}
+    MARSHAL_MAGIC = b'PAM\x01'
+    GZIP_MAGIC = b'\x1f\x8b'
+    LZMA_MAGIC = b'\xfd7zXZ\x00'
+
+    def __init__(self, spec='json'):
+        self.spec = spec
+        self.format, _, self.compression = spec.partition('+')
+        if self.format not in self.FORMATS or (self.compression and self.compression not in self.COMPRESSIONS):
+            raise ValueError(f"Неизвестный кодек: {spec}. Форматы: {', '.join(self.FORMATS)}; "
+                             f"сжатие: {', '.join(self.COMPRESSIONS)}.")
+
+    def encode(self, items):
+        if self.format == 'marshal':
+            data = self.MARSHAL_MAGIC + marshal.dumps(self._to_rows(items))
+        elif isinstance(items, RecordRows):
+            return self.encode(list(items))
+        elif self.format == 'json-compact':
+            data = json.dumps(items, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        else:
+            data = json.dumps(items, ensure_ascii=False, indent=4).encode('utf-8')
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == 'lzma':
+            return lzma.compress(data)
+        return data
+
+    @classmethod
+    def decode(cls, data):
+        try:
+            if data.startswith(cls.GZIP_MAGIC):
+                data = gzip.decompress(data)
+            elif data.startswith(cls.LZMA_MAGIC):
+                data = lzma.decompress(data)
+            if data.startswith(cls.MARSHAL_MAGIC):
+                return cls._from_rows(marshal.loads(data[len(cls.MARSHAL_MAGIC):]))
+            return json.loads(data.decode('utf-8'))
+        except (ValueError, EOFError, TypeError, lzma.LZMAError) as e:
+            raise IOError(f"файл повреждён или формат не распознан ({e})") from e
+
+    # Записи одного хранилища имеют одинаковые поля: имена пишутся один раз, записи - кортежами
+    @staticmethod
+    def _to_rows(items):
+        if isinstance(items, RecordRows):
+            return tuple(items.fields), items.rows
+        fields = tuple(items[0]) if items else ()
+        if any(tuple(item) != fields for item in items):
+            return None, items
+        return fields, [tuple(item.values()) for item in items]
+
+    @staticmethod
+    def _from_rows(payload):
+        fields, rows = payload
+        if fields is None:
+            return rows
+        return [dict(zip(fields, row)) for row in rows]
+
+
+# Хранилище: весь список одним JSON-файлом
+class JsonStorage:
+    incremental = False
+    lazy = False
+
+    def __init__(self, filepath, codec='json'):
+        self.filepath = filepath
+        self.codec = Codec(codec)
+        # Служебные данные (счётчик ID и т.п.) хранятся рядом, формат основного файла не меняется
+        self.meta_path = os.path.splitext(filepath)[0] + '.meta.json'
+        self.lock_path = os.path.splitext(filepath)[0] + '.lock'
+
+    # Версия данных на диске: меняется при любой записи, в том числе другим процессом
+    def signature(self):
+        return file_signature(self.filepath), file_signature(self.meta_path)
+
+    def load(self):
+        if not os.path.exists(self.filepath):
+            return []
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+        if METRICS.enabled:
+            METRICS.add_bytes(read=len(data))
+        return Codec.decode(data)
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {}
+        try:
+            with open(self.meta_path, 'rb') as f:
+                data = f.read()
+            if METRICS.enabled:
+                METRICS.add_bytes(read=len(data))
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return {}
+
+    def save(self, items, meta=None):
+        atomic_write(self.filepath, self.codec.encode(items))
+        if meta is not None:
+            atomic_write(self.meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+# Журнальное хранилище: снимок + журнал операций, дописываемый по одной записи
+class JournalStorage(JsonStorage):
+    incremental = True
+
+    def __init__(self, filepath, codec='json', compact_threshold=1000):
+        super().__init__(filepath, codec)
+        self.journal_path = filepath + '.journal'
+        self.compact_threshold = compact_threshold
+        self.journal_size = 0
+        self.max_journal_id = 0
+
+    def load(self):
+        items = {item['id']: item for item in super().load()}
+        self.journal_size = 0
+        self.max_journal_id = 0
+        if not os.path.exists(self.journal_path):
+            return list(items.values())
+        valid_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                # Недописанная последняя строка остаётся после сбоя - отбрасываем её
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                if entry['op'] == 'put':
+                    items[entry['data']['id']] = entry['data']
+                    self.max_journal_id = max(self.max_journal_id, entry['data']['id'])
+                elif entry['op'] == 'delete':
+                    items.pop(entry['id'], None)
+                valid_bytes += len(line)
+                self.journal_size += 1
+        if valid_bytes < os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid_bytes)
+        if METRICS.enabled:
+            METRICS.add_bytes(read=valid_bytes)
+        return list(items.values())
+
+    def signature(self):
+        return super().signature() + (file_signature(self.journal_path),)
+
+    # ID удалённых после последнего снимка записей видны только в журнале
+    def load_meta(self):
+        meta = super().load_meta()
+        if self.max_journal_id:
+            meta['next_id'] = max(meta.get('next_id', 1), self.max_journal_id + 1)
+        # Каждая запись журнала - одно изменение после снимка
+        meta['generation'] = meta.get('generation', 0) + self.journal_size
+        return meta
+
+    def append(self, entries, meta=None):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for op, payload in entries:
+                if op == 'put':
+                    entry = {"op": "put", "data": payload}
+                else:
+                    entry = {"op": "delete", "id": payload}
+                line = json.dumps(entry, ensure_ascii=False) + '\n'
+                f.write(line)
+                self.journal_size += 1
+                if METRICS.enabled:
+                    METRICS.add_bytes(written=len(line.encode('utf-8')))
+
+    def needs_compaction(self):
+        return self.journal_size >= self.compact_threshold
+
+    # Сохранение полного списка = уплотнение: журнал сворачивается в новый снимок
+    def save(self, items, meta=None):
+        super().save(items, meta)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_size = 0
+        self.max_journal_id = 0
+
+
+# SQLite-хранилище: запись целиком лежит в JSON-колонке data, рядом - индексируемые колонки,
+# по которым менеджеры фильтруют прямо в SQL, не загружая коллекцию в память
+class SqliteStorage:
+    incremental = True
+    lazy = True
+    OPERATORS = ('=', '!=', '<', '<=', '>', '>=')
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.db_path = os.path.splitext(filepath)[0] + '.db'
+        self.lock_path = os.path.splitext(filepath)[0] + '.lock'
+        self.connection = None
+        self.table = None
+        self.columns = {}
+
+    def bind(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        extra_columns = ''.join(f', {column}' for column in columns)
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, data TEXT NOT NULL{extra_columns})")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            existing = {row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+            missing = [column for column in columns if column not in existing]
+            for column in missing:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            for column in columns:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+        # Колонки, добавленные в схему позже, заполняются из сохранённых записей
+        if missing and self.count():
+            self.save(self.load(), None)
+        # Первый запуск в режиме SQLite: переносим данные из существующего JSON-файла
+        if not self.count() and os.path.exists(self.filepath):
+            legacy = JsonStorage(self.filepath)
+            self.save(legacy.load(), legacy.load_meta())
+
+    # Байтами SQLite-хранилища в метриках считается длина JSON записей, а не страницы базы
+    def _row(self, data):
+        text = json.dumps(data, ensure_ascii=False)
+        if METRICS.enabled:
+            METRICS.add_bytes(written=len(text))
+        return (data['id'], text, *(extract(data) for extract in self.columns.values()))
+
+    def _where(self, conditions):
+        clauses = []
+        params = []
+        for condition in conditions:
+            # Список условий внутри общего списка объединяется через OR
+            group = condition if isinstance(condition, list) else [condition]
+            parts = []
+            for column, op, value in group:
+                if column != 'id' and column not in self.columns:
+                    raise ValueError(f"Колонка {column} не индексируется.")
+                if op == 'contains':
+                    parts.append(f"instr({column}, ?) > 0")
+                elif op in self.OPERATORS:
+                    parts.append(f"{column} {op} ?")
+                else:
+                    raise ValueError(f"Неизвестная операция: {op}")
+                params.append(value)
+            clauses.append('(' + ' OR '.join(parts) + ')')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def select(self, conditions=(), order_by='id', limit=None):
+        where, params = self._where(conditions)
+        query = f"SELECT data FROM {self.table}{where} ORDER BY {order_by}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        cursor = self.connection.execute(query, params)
+        for (data,) in cursor:
+            if METRICS.enabled:
+                METRICS.add_bytes(read=len(data))
+            yield json.loads(data)
+
+    def get(self, item_id):
+        row = self.connection.execute(f"SELECT data FROM {self.table} WHERE id = ?", (item_id,)).fetchone()
+        if row and METRICS.enabled:
+            METRICS.add_bytes(read=len(row[0]))
+        return json.loads(row[0]) if row else None
+
+    def count(self, conditions=()):
+        where, params = self._where(conditions)
+        return self.connection.execute(f"SELECT COUNT(*) FROM {self.table}{where}", params).fetchone()[0]
+
+    def load(self):
+        return list(self.select())
+
+    # data_version меняется только после фиксаций других соединений
+    def signature(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_meta(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE name = ?", (self.table,)).fetchone()
+        meta = json.loads(row[0]) if row else {}
+        max_id = self.connection.execute(f"SELECT MAX(id) FROM {self.table}").fetchone()[0]
+        if max_id is not None:
+            meta['next_id'] = max(meta.get('next_id', 1), max_id + 1)
+        return meta
+
+    def _write_meta(self, meta):
+        self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                (self.table, json.dumps(meta, ensure_ascii=False)))
+
+    # Все операции пакета и служебные данные фиксируются одной транзакцией
+    def append(self, entries, meta=None):
+        placeholders = ', '.join('?' * (len(self.columns) + 2))
+        column_names = ''.join(f', {column}' for column in self.columns)
+        with self.connection:
+            for op, payload in entries:
+                if op == 'put':
+                    self.connection.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (id, data{column_names}) VALUES ({placeholders})",
+                        self._row(payload))
+                else:
+                    self.connection.execute(f"DELETE FROM {self.table} WHERE id = ?", (payload,))
+            if meta is not None:
+                self._write_meta(meta)
+
+    def needs_compaction(self):
+        return False
+
+    def save(self, items, meta=None):
+        placeholders = ', '.join('?' * (len(self.columns) + 2))
+        column_names = ''.join(f', {column}' for column in self.columns)
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {self.table}")
+            self.connection.executemany(
+                f"INSERT INTO {self.table} (id, data{column_names}) VALUES ({placeholders})",
+                (self._row(item) for item in items))
+            if meta is not None:
+                self._write_meta(meta)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+# Условия и сортировка SqliteStorage, выполняемые в Python над записями-словарями: value(data, column) -
+# значение колонки. Сравнение с отсутствующим значением ложно, а в сортировке оно идёт первым, как NULL в SQL
+CONDITION_OPERATORS = {'=': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+                       '>': operator.gt, '>=': operator.ge}
+
+
+def condition_matcher(conditions, value):
+    groups = [condition if isinstance(condition, list) else [condition] for condition in conditions]
+    for group in groups:
+        for column, op, _ in group:
+            if op != 'contains' and op not in CONDITION_OPERATORS:
+                raise ValueError(f"Неизвестная операция: {op}")
+
+    def test(data, column, op, expected):
+        actual = value(data, column)
+        if actual is None:
+            return False
+        if op == 'contains':
+            return str(expected) in str(actual)
+        return CONDITION_OPERATORS[op](actual, expected)
+
+    return lambda data: all(any(test(data, *condition) for condition in group) for group in groups)
+
+
+def order_key(order_by, value):
+    columns = [column.strip() for column in order_by.split(',')]
+    return lambda data: tuple((actual is not None, actual) for actual in (value(data, column) for column in columns))
+
+
+# Карта ID -> код секции для секционированного хранилища: файл из 4-байтовых кодов по номеру ID
+# (0 - записи нет). Отдельные ID читаются и меняются на месте, без загрузки всей карты
+class PartitionIdMap:
+    ITEM_SIZE = array('i').itemsize
+    BULK_THRESHOLD = 256
+
+    def __init__(self, path):
+        self.path = path
+
+    def _read_all(self):
+        codes = array('i')
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                codes.frombytes(f.read())
+        return codes
+
+    def get_many(self, ids):
+        if len(ids) > self.BULK_THRESHOLD:
+            codes = self._read_all()
+            return {item_id: codes[item_id] if item_id < len(codes) else 0 for item_id in ids}
+        if not os.path.exists(self.path):
+            return dict.fromkeys(ids, 0)
+        found = {}
+        with open(self.path, 'rb') as f:
+            for item_id in ids:
+                f.seek(item_id * self.ITEM_SIZE)
+                data = f.read(self.ITEM_SIZE)
+                found[item_id] = array('i', data)[0] if len(data) == self.ITEM_SIZE else 0
+        return found
+
+    # Много изменений (импорт) - одна перезапись файла, несколько - запись на месте
+    def update(self, changes):
+        if not changes:
+            return
+        if len(changes) <= self.BULK_THRESHOLD and os.path.exists(self.path):
+            with open(self.path, 'r+b') as f:
+                for item_id, code in changes.items():
+                    f.seek(item_id * self.ITEM_SIZE)
+                    f.write(array('i', [code]).tobytes())
+            return
+        codes = self._read_all()
+        self._write(codes, changes)
+
+    def rewrite(self, changes):
+        self._write(array('i'), changes)
+
+    def _write(self, codes, changes):
+        top = max(changes, default=0) + 1
+        if len(codes) < top:
+            codes.extend(array('i', bytes(codes.itemsize * (top - len(codes)))))
+        for item_id, code in changes.items():
+            codes[item_id] = code
+        atomic_write(self.path, codes.tobytes())
+
+
+# Секционированное хранилище финансов: записи разложены по секциям за месяц или год в каталоге
+# <имя>.parts. Секция - снимок и журнал, как в JournalStorage; рядом манифест (число записей в секциях
+# и служебные данные менеджера) и карта ID -> секция. Добавление пишет только в секцию своей даты,
+# выборка по диапазону дат открывает только пересекающиеся с ним секции. Все секции, кроме последних
+# hot_partitions, сжимаются кодеком cold_codec и дальше только читаются (дописываются лишь задним числом)
+class PartitionedStorage:
+    incremental = True
+    lazy = True
+    PERIODS = ('month', 'year')
+    # Код секции записей без даты; коды остальных - ГГГГММ или ГГГГ, по величине кода виден период
+    UNDATED = 1
+    MONTH_CODES = 100000
+    COMPACT_THRESHOLD = 1000
+    # Сколько разобранных секций держать в памяти
+    CACHE_PARTITIONS = 4
+
+    def __init__(self, filepath, period='month', codec='json', cold_codec='json-compact+gzip', hot_partitions=2,
+                 partition_column='date_ord'):
+        if period not in self.PERIODS:
+            raise ValueError(f"Неизвестный период секций: {period}. Доступные: {', '.join(self.PERIODS)}.")
+        self.filepath = filepath
+        self.period = period
+        self.codec = Codec(codec).spec
+        self.cold_codec = Codec(cold_codec).spec
+        self.hot_partitions = hot_partitions
+        self.partition_column = partition_column
+        base = os.path.splitext(filepath)[0]
+        self.directory = base + '.parts'
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.lock_path = base + '.lock'
+        self.ids = PartitionIdMap(os.path.join(self.directory, 'ids.bin'))
+        self.table = None
+        self.columns = {}
+        self._manifest_data = None
+        self._manifest_signature = None
+        # Имя секции -> [сигнатура файлов, записи, словарь ID -> запись или None], от давних к недавним
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def bind(self, table, columns):
+        self.table = table
+        self.columns = columns
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._manifest()
+        # Другой период секций: секции перестраиваются
+        if manifest['partitions'] and manifest['period'] != self.period:
+            self.save(self.load(), manifest['meta'])
+        # Первый запуск с секциями: переносим данные из существующего файла (и его журнала)
+        elif not manifest['partitions']:
+            legacy = JournalStorage(self.filepath)
+            if os.path.exists(self.filepath) or os.path.exists(legacy.journal_path):
+                self.save(legacy.load(), legacy.load_meta())
+
+    def _manifest(self):
+        signature = file_signature(self.manifest_path)
+        if self._manifest_data is None or signature != self._manifest_signature:
+            manifest = {"period": self.period, "partitions": {}, "meta": {}}
+            if signature is not None:
+                with open(self.manifest_path, 'rb') as f:
+                    data = f.read()
+                if METRICS.enabled:
+                    METRICS.add_bytes(read=len(data))
+                manifest = json.loads(data)
+            self._manifest_data = manifest
+            self._manifest_signature = signature
+        return self._manifest_data
+
+    def _write_manifest(self, manifest):
+        atomic_write(self.manifest_path, json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        self._manifest_data = manifest
+        self._manifest_signature = file_signature(self.manifest_path)
+
+    def _code(self, ordinal):
+        if not ordinal:
+            return self.UNDATED
+        date = datetime.fromordinal(ordinal)
+        return date.year * 100 + date.month if self.period == 'month' else date.year
+
+    def _name(self, code):
+        if code == self.UNDATED:
+            return 'undated'
+        return f"{code // 100:04d}-{code % 100:02d}" if code >= self.MONTH_CODES else f"{code:04d}"
+
+    # Первый и последний день секции (порядковые номера); у секции без дат границ нет
+    def _bounds(self, code):
+        if code == self.UNDATED:
+            return None
+        if code < self.MONTH_CODES:
+            return datetime(code, 1, 1).toordinal(), datetime(code, 12, 31).toordinal()
+        first = datetime(code // 100, code % 100, 1)
+        return first.toordinal(), next_month(first).toordinal() - 1
+
+    def _partition(self, name, cold=None):
+        if cold is None:
+            cold = self._manifest()['partitions'].get(name, {}).get('cold', False)
+        return JournalStorage(os.path.join(self.directory, name + '.json'), self.cold_codec if cold else self.codec)
+
+    # Разобранные секции кешируются по сигнатуре их файлов: повторное чтение секции (get по одной
+    # записи, следующая страница списка) не распаковывает её заново, а запись в секцию меняет сигнатуру
+    def _cached(self, name):
+        partition = self._partition(name)
+        signature = partition.signature()
+        with self._cache_lock:
+            entry = self._cache.get(name)
+            if entry is not None and entry[0] == signature:
+                self._cache.move_to_end(name)
+                return entry
+        entry = [signature, partition.load(), None]
+        with self._cache_lock:
+            self._cache[name] = entry
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.CACHE_PARTITIONS:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _value(self, data, column):
+        if column == 'id':
+            return data['id']
+        if column not in self.columns:
+            raise ValueError(f"Колонка {column} не индексируется.")
+        return self.columns[column](data)
+
+    # Диапазон значений колонки из простых условий на неё - по диапазонам дат и ID отбираются секции
+    @staticmethod
+    def _column_range(conditions, target):
+        low = high = None
+        for condition in conditions:
+            if isinstance(condition, list):
+                continue
+            column, op, value = condition
+            if column != target or value is None:
+                continue
+            if op in ('=', '>=', '>'):
+                value_low = value + 1 if op == '>' else value
+                low = value_low if low is None else max(low, value_low)
+            if op in ('=', '<=', '<'):
+                value_high = value - 1 if op == '<' else value
+                high = value_high if high is None else min(high, value_high)
+        return low, high
+
+    # Секции, где могут быть записи под условия: по диапазону дат секции и диапазону ID её записей
+    # (в оглавлении, записанном до появления диапазонов, его нет - такие секции не отсеиваются)
+    def _candidates(self, conditions):
+        low, high = self._column_range(conditions, self.partition_column)
+        first_id, last_id = self._column_range(conditions, 'id')
+        for name, info in sorted(self._manifest()['partitions'].items(), key=lambda entry: entry[1]['code']):
+            bounds = self._bounds(info['code'])
+            if bounds is None:
+                if low is not None or high is not None:
+                    continue
+            elif (low is not None and bounds[1] < low) or (high is not None and bounds[0] > high):
+                continue
+            ids = info.get('ids', [None, None])
+            if (not ids or (first_id is not None and ids[1] is not None and ids[1] < first_id)
+                    or (last_id is not None and ids[0] is not None and ids[0] > last_id)):
+                continue
+            yield name, info
+
+    # Наименьшее значение колонки в секции: первый день для даты, наименьший ID для id;
+    # None - неизвестно (секция без дат, секция без диапазона ID)
+    def _lower_bound(self, info, column):
+        if column == self.partition_column:
+            bounds = self._bounds(info['code'])
+            return bounds and bounds[0]
+        if column == 'id' and info.get('ids'):
+            return info['ids'][0]
+        return None
+
+    def select(self, conditions=(), order_by='id', limit=None):
+        if limit is not None and limit <= 0:
+            return
+        # Условия - как у SqliteStorage: (колонка, операция, значение), список внутри списка - через OR
+        match = condition_matcher(conditions, self._value)
+        key = order_key(order_by, self._value)
+        first = order_by.split(',')[0].strip()
+        partitions = list(self._candidates(conditions))
+        # При сортировке по дате или ID секции обходятся по возрастанию их наименьшего значения: когда
+        # набрано limit записей, а следующая секция начинается позже последней из них, дальше не читаем
+        ordered = limit is not None and first in (self.partition_column, 'id')
+        if ordered:
+            partitions.sort(key=lambda entry: (self._lower_bound(entry[1], first) is not None,
+                                               self._lower_bound(entry[1], first) or 0))
+        found = []
+        for name, info in partitions:
+            if ordered and len(found) >= limit:
+                start = self._lower_bound(info, first)
+                last = self._value(found[-1], first)
+                if start is not None and (last is None or start > last):
+                    break
+            found.extend(data for data in self._cached(name)[1] if match(data))
+            # Между секциями держим только limit первых записей
+            if limit is not None and len(found) >= limit:
+                found = heapq.nsmallest(limit, found, key=key)
+        found.sort(key=key)
+        yield from found
+
+    def get(self, item_id):
+        code = self.ids.get_many([item_id])[item_id]
+        name = self._name(code) if code else None
+        if name not in self._manifest()['partitions']:
+            return None
+        entry = self._cached(name)
+        if entry[2] is None:
+            entry[2] = {data['id']: data for data in entry[1]}
+        return entry[2].get(item_id)
+
+    # Секция, целиком попадающая в диапазон дат, считается по оглавлению, без чтения;
+    # остальные - проходом по записям, без списка найденных и сортировки
+    def count(self, conditions=()):
+        dates_only = all(not isinstance(condition, list) and condition[0] == self.partition_column
+                         and condition[1] in ('=', '<', '<=', '>', '>=') and condition[2] is not None
+                         for condition in conditions)
+        low, high = self._column_range(conditions, self.partition_column)
+        match = condition_matcher(conditions, self._value)
+        total = 0
+        for name, info in self._candidates(conditions):
+            bounds = self._bounds(info['code'])
+            if dates_only and (not conditions or bounds is not None and (low is None or low <= bounds[0])
+                               and (high is None or bounds[1] <= high)):
+                total += info['count']
+            else:
+                total += sum(1 for data in self._cached(name)[1] if match(data))
+        return total
+
+    def load(self):
+        return list(self.select())
+
+    def signature(self):
+        return file_signature(self.manifest_path)
+
+    def load_meta(self):
+        return dict(self._manifest()['meta'])
+
+    # Запись раскладывается по секциям. Карта ID меняется до записи в секцию для добавленных и после -
+    # для удалённых, поэтому после сбоя карта может указать на секцию без записи, но не потерять запись
+    def append(self, entries, meta=None):
+        manifest = self._manifest()
+        partitions = manifest['partitions']
+        known = len(partitions)
+        current = self.ids.get_many({payload['id'] if op == 'put' else payload for op, payload in entries})
+        groups = {}
+        placed = {}
+        cleared = {}
+        counts = collections.Counter()
+        for op, payload in entries:
+            item_id = payload['id'] if op == 'put' else payload
+            old = current[item_id]
+            code = self._code(self._value(payload, self.partition_column)) if op == 'put' else 0
+            if old and old != code:
+                groups.setdefault(old, []).append(('delete', item_id))
+                counts[old] -= 1
+            if op == 'put':
+                groups.setdefault(code, []).append(('put', payload))
+                if old != code:
+                    counts[code] += 1
+                    placed[item_id] = code
+            else:
+                placed.pop(item_id, None)
+                cleared[item_id] = 0
+            current[item_id] = code
+        self.ids.update(placed)
+        for code, group in groups.items():
+            name = self._name(code)
+            info = partitions.setdefault(name, {"code": code, "count": 0, "cold": False, "journal": 0, "ids": []})
+            partition = self._partition(name)
+            partition.append(group)
+            info['count'] += counts[code]
+            # Диапазон ID только расширяется: после удалений он шире записей секции, но не уже
+            put_ids = [payload['id'] for op, payload in group if op == 'put']
+            if put_ids and 'ids' in info:
+                info['ids'] = [min(info['ids'][:1] + put_ids), max(info['ids'][1:] + put_ids)]
+            info['journal'] += len(group)
+            # Уплотнение только этой секции: её журнал сворачивается в снимок
+            if info['journal'] >= self.COMPACT_THRESHOLD:
+                partition.save(partition.load())
+                info['journal'] = 0
+        self.ids.update(cleared)
+        if meta is not None:
+            manifest['meta'] = meta
+        # Появилась новая секция: вышедшие из числа горячих сжимаются
+        if len(partitions) > known:
+            self._compress_cold(partitions)
+        self._write_manifest(manifest)
+
+    def needs_compaction(self):
+        return False
+
+    def _cold_names(self, partitions):
+        dated = sorted((info['code'], name) for name, info in partitions.items() if info['code'] != self.UNDATED)
+        return [name for _, name in dated[:max(len(dated) - self.hot_partitions, 0)]]
+
+    def _compress_cold(self, partitions):
+        for name in self._cold_names(partitions):
+            info = partitions[name]
+            if info['cold']:
+                continue
+            items = self._partition(name, cold=False).load()
+            self._partition(name, cold=True).save(items)
+            info['cold'] = True
+            info['journal'] = 0
+
+    def save(self, items, meta=None):
+        groups = {}
+        for data in items:
+            groups.setdefault(self._code(self._value(data, self.partition_column)), []).append(data)
+        partitions = {self._name(code): {"code": code, "count": len(group), "cold": False, "journal": 0,
+                                         "ids": [min(data['id'] for data in group), max(data['id'] for data in group)]}
+                      for code, group in groups.items()}
+        for name in self._cold_names(partitions):
+            partitions[name]['cold'] = True
+        for name, info in partitions.items():
+            self._partition(name, info['cold']).save(groups[info['code']])
+        for name in set(self._manifest()['partitions']) - set(partitions):
+            stale = self._partition(name)
+            for path in (stale.filepath, stale.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.ids.rewrite({data['id']: code for code, group in groups.items() for data in group})
+        meta = dict(meta or {})
+        meta['next_id'] = max(meta.get('next_id', 1), max((data['id'] for data in items), default=0) + 1)
+        self._write_manifest({"period": self.period, "partitions": partitions, "meta": meta})
+
+    def close(self):
+        pass
+
+
+STORAGE_MODES = {
+    'json': JsonStorage,
+    'journal': JournalStorage,
+    'sqlite': SqliteStorage,
+}
+
+
+# Кодек относится к файлам-снимкам; в режиме SQLite записи лежат в базе, а старый файл читается любым
+def make_storage(filepath, mode='json', codec='json'):
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Неизвестный режим хранения: {mode}. Доступные: {', '.join(STORAGE_MODES)}.")
+    if mode == 'sqlite':
+        return SqliteStorage(filepath)
+    return STORAGE_MODES[mode](filepath, codec)
+
+
+# Разовое преобразование файла хранилища в другой кодек. Журнал, если он есть, сворачивается в снимок;
+# служебные данные (счётчик ID, поколение) сохраняются, так что индексы на диске остаются действительными
+def convert_store(filepath, codec):
+    storage = JournalStorage(filepath, codec)
+    if not os.path.exists(filepath) and not os.path.exists(storage.journal_path):
+        raise IOError(f"файл {filepath} не найден")
+    items = storage.load()
+    meta = storage.load_meta()
+    storage.save(items, meta)
+    return len(items)
+
+
+# Настройка кодеков: один кодек для всех хранилищ ("marshal+gzip")
+# или по хранилищам через запятую ("finance=marshal+lzma,notes=json-compact")
+def parse_codec_setting(value, stores):
+    codecs = dict.fromkeys(stores, 'json')
+    if not value:
+        return codecs
+    if '=' not in value:
+        return dict.fromkeys(stores, value)
+    for part in value.split(','):
+        store, _, codec = part.partition('=')
+        if store.strip() not in codecs:
+            raise ValueError(f"Неизвестное хранилище: {store.strip()}. Доступные: {', '.join(stores)}.")
+        codecs[store.strip()] = codec.strip()
+    return codecs
+
+
+# Отсортированный список ключей (значение, ID). Вставки копятся в буфере и вливаются менеджером на пути записи:
+# несколько штук - бинарной вставкой, много (импорт) - одной сортировкой вместо вставки в середину на каждую.
+# Чтение ничего не меняет (его ведут параллельно несколько потоков API сервера): ключи из буфера
+# учитываются в копии
+class SortedKeys:
+    MERGE_THRESHOLD = 64
+
+    def __init__(self, keys=()):
+        self.keys = sorted(keys)
+        self.pending = []
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+    def add(self, key):
+        self.pending.append(key)
+
+    def merge(self):
+        if not self.pending:
+            return
+        if len(self.pending) <= self.MERGE_THRESHOLD:
+            for key in self.pending:
+                bisect.insort(self.keys, key)
+        else:
+            self.keys.extend(self.pending)
+            self.keys.sort()
+        self.pending = []
+
+    def _view(self):
+        if not self.pending:
+            return self.keys
+        return sorted(self.keys + self.pending)
+
+    def remove(self, key):
+        self.merge()
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def between(self, low, high):
+        keys = self._view()
+        return keys[bisect.bisect_left(keys, (low,)):bisect.bisect_left(keys, (high,))]
+
+    # Не больше limit ключей строго после key (None - с начала): страница списка по курсору
+    def after(self, key, limit):
+        keys = self._view()
+        position = bisect.bisect_right(keys, key) if key is not None else 0
+        return keys[position:position + limit]
+
+
+# Отсортированный индекс по дате (порядковый номер дня): диапазон находится бинарным поиском
+class DateIndex:
+    def __init__(self):
+        self.keys = SortedKeys()
+
+    def build(self, pairs):
+        self.keys = SortedKeys(pair for pair in pairs if pair[0] is not None)
+
+    def add(self, ordinal, item_id):
+        if ordinal is not None:
+            self.keys.add((ordinal, item_id))
+
+    def remove(self, ordinal, item_id):
+        if ordinal is not None:
+            self.keys.remove((ordinal, item_id))
+
+    def range(self, start, end):
+        return [item_id for _, item_id in self.keys.between(start, end + 1)]
+
+    def after(self, key, limit):
+        return self.keys.after(key, limit)
+
+    def merge(self):
+        self.keys.merge()
+
+
+def normalize_phone(text):
+    return ''.join(char for char in text if char.isdigit())
+
+
+# Правила поиска контактов, общие для индекса и SQLite: запрос - подстрока имени без учёта регистра;
+# похожий на номер - его цифры подстрока цифр телефона; запрос без пробелов - ещё и подстрока email,
+# так что домен находится и с "@", и без него ("@gmail.com", "gmail.com").
+# Возвращает [(поле, искомая строка)], None - пустой запрос, подходят все контакты
+def contact_search_terms(keyword):
+    keyword = keyword.strip().lower()
+    if not keyword:
+        return None
+    terms = [('name', keyword)]
+    if set(keyword) <= ContactIndex.PHONE_CHARS:
+        digits = normalize_phone(keyword)
+        if digits:
+            terms.append(('phone', digits))
+    if not any(char.isspace() for char in keyword):
+        terms.append(('email', keyword))
+    return terms
+
+
+# Поисковый индекс контактов: n-граммы из одного, двух и трёх символов для имени, цифр телефона и email.
+# Запрос не длиннее трёх символов сам является n-граммой, и его записи берутся из индекса готовыми -
+# короткие запросы не перебирают все контакты. Более длинный проверяется только на записях,
+# где есть все его триграммы
+class ContactIndex:
+    PHONE_CHARS = frozenset('0123456789+-() ')
+    FIELDS = {'name': 0, 'phone': 1, 'email': 2}
+    GRAM_SIZES = (1, 2, 3)
+
+    def __init__(self):
+        # Поле -> n-грамма -> множество ID
+        self.grams = {field: {} for field in self.FIELDS}
+        # ID -> (имя, цифры телефона, email) в нормализованном виде: по ним проверяется совпадение
+        # и запись удаляется из индекса
+        self.entries = {}
+
+    @staticmethod
+    def _grams(text, sizes=GRAM_SIZES):
+        return {text[i:i + size] for size in sizes for i in range(len(text) - size + 1)}
+
+    def add(self, contact):
+        self.remove(contact.id)
+        entry = (contact.name.lower(), normalize_phone(contact.phone or ''), (contact.email or '').lower())
+        self.entries[contact.id] = entry
+        for field, position in self.FIELDS.items():
+            postings = self.grams[field]
+            for gram in self._grams(entry[position]):
+                ids = postings.get(gram)
+                if ids is None:
+                    postings[gram] = {contact.id}
+                else:
+                    ids.add(contact.id)
+
+    def remove(self, contact_id):
+        entry = self.entries.pop(contact_id, None)
+        if entry is None:
+            return
+        for field, position in self.FIELDS.items():
+            postings = self.grams[field]
+            for gram in self._grams(entry[position]):
+                ids = postings[gram]
+                ids.discard(contact_id)
+                if not ids:
+                    del postings[gram]
+
+    def search(self, keyword):
+        terms = contact_search_terms(keyword)
+        if terms is None:
+            return None
+        found = set()
+        for field, needle in terms:
+            postings = self.grams[field]
+            if len(needle) <= self.GRAM_SIZES[-1]:
+                found.update(postings.get(needle, ()))
+                continue
+            position = self.FIELDS[field]
+            candidates = sorted((postings.get(gram, set()) for gram in self._grams(needle, (3,))), key=len)
+            found.update(contact_id for contact_id in candidates[0].intersection(*candidates[1:])
+                         if needle in self.entries[contact_id][position])
+        return found
+
+
+# Нарастающие итоги по финансам: общий баланс, суммы по категориям и помесячные сводки по категориям.
+# Для категорий хранится [доход, расход, число записей] - по счётчику пустые группы удаляются
+class FinanceAggregates:
+    TOLERANCE = 1e-6
+
+    def __init__(self):
+        self.income = 0.0
+        self.expense = 0.0
+        self.count = 0
+        self.categories = {}
+        self.months = {}
+
+    @staticmethod
+    def _bump(bucket, category, amount, sign):
+        totals = bucket.setdefault(category, [0.0, 0.0, 0])
+        if amount > 0:
+            totals[0] += sign * amount
+        else:
+            totals[1] += sign * amount
+        totals[2] += sign
+        if totals[2] <= 0:
+            del bucket[category]
+
+    def apply(self, record, sign=1):
+        self.add(record.amount, record.category, record.date, sign)
+
+    def add(self, amount, category, date, sign=1):
+        if amount > 0:
+            self.income += sign * amount
+        else:
+            self.expense += sign * amount
+        self.count += sign
+        if self.count <= 0:
+            self.income = self.expense = 0.0
+        self._bump(self.categories, category, amount, sign)
+        month = month_key(date)
+        if month:
+            bucket = self.months.setdefault(month, {})
+            self._bump(bucket, category, amount, sign)
+            if not bucket:
+                del self.months[month]
+
+    def balance(self):
+        return self.income + self.expense
+
+    def to_dict(self):
+        return {
+            "income": self.income,
+            "expense": self.expense,
+            "count": self.count,
+            "categories": self.categories,
+            "months": self.months
+        }
+
+    @staticmethod
+    def from_dict(data):
+        aggregates = FinanceAggregates()
+        aggregates.income = data["income"]
+        aggregates.expense = data["expense"]
+        aggregates.count = data["count"]
+        aggregates.categories = data["categories"]
+        aggregates.months = data["months"]
+        return aggregates
+
+    def _close(self, a, b):
+        return abs(a - b) <= self.TOLERANCE
+
+    def _diff_bucket(self, name, ours, theirs):
+        differences = []
+        for category in set(ours) | set(theirs):
+            left = ours.get(category, [0.0, 0.0, 0])
+            right = theirs.get(category, [0.0, 0.0, 0])
+            if not all(self._close(a, b) for a, b in zip(left, right)):
+                differences.append(f"{name}, категория {category}: {left} != {right}")
+        return differences
+
+    def diff(self, other):
+        differences = []
+        for field in ('income', 'expense', 'count'):
+            if not self._close(getattr(self, field), getattr(other, field)):
+                differences.append(f"{field}: {getattr(self, field)} != {getattr(other, field)}")
+        differences += self._diff_bucket("все время", self.categories, other.categories)
+        for month in sorted(set(self.months) | set(other.months)):
+            differences += self._diff_bucket(month, self.months.get(month, {}), other.months.get(month, {}))
+        return differences
+
+
+# Колоночное хранение финансовых записей: суммы, даты (порядковые номера дней) и коды категорий
+# лежат в компактных массивах, строки категорий и дат закодированы словарём. Строки упорядочены
+# по ID, поиск по ID - бинарный. Аналитика считается векторно через NumPy, если он установлен
+class FinanceColumns:
+    def __init__(self):
+        self.ids = array('q')
+        self.amounts = array('d')
+        self.ordinals = array('i')
+        self.category_codes = array('i')
+        self.date_codes = array('i')
+        self.descriptions = []
+        self.categories = []
+        self.category_lookup = {}
+        self.dates = []
+        self.date_lookup = {}
+
+    @staticmethod
+    def _encode(values, lookup, value):
+        code = lookup.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            lookup[value] = code
+        return code
+
+    def _position(self, item_id):
+        position = bisect.bisect_left(self.ids, item_id)
+        if position < len(self.ids) and self.ids[position] == item_id:
+            return position
+        return None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, item_id):
+        return self._position(item_id) is not None
+
+    def __setitem__(self, item_id, record):
+        row = (
+            record.amount,
+            record.date_ord or 0,
+            self._encode(self.categories, self.category_lookup, record.category),
+            self._encode(self.dates, self.date_lookup, record.date),
+            record.description
+        )
+        columns = (self.amounts, self.ordinals, self.category_codes, self.date_codes, self.descriptions)
+        position = self._position(item_id)
+        if position is not None:
+            for column, value in zip(columns, row):
+                column[position] = value
+            return
+        position = bisect.bisect_left(self.ids, item_id)
+        if position == len(self.ids):
+            self.ids.append(item_id)
+            for column, value in zip(columns, row):
+                column.append(value)
+        else:
+            self.ids.insert(position, item_id)
+            for column, value in zip(columns, row):
+                column.insert(position, value)
+
+    def __delitem__(self, item_id):
+        position = self._position(item_id)
+        if position is None:
+            raise KeyError(item_id)
+        for column in (self.ids, self.amounts, self.ordinals, self.category_codes, self.date_codes,
+                       self.descriptions):
+            del column[position]
+
+    def _record(self, position):
+        return FinanceRecord(
+            id=self.ids[position],
+            amount=self.amounts[position],
+            category=self.categories[self.category_codes[position]],
+            date=self.dates[self.date_codes[position]],
+            description=self.descriptions[position],
+            date_ord=self.ordinals[position]
+        )
+
+    def get(self, item_id, default=None):
+        position = self._position(item_id)
+        return self._record(position) if position is not None else default
+
+    def __getitem__(self, item_id):
+        position = self._position(item_id)
+        if position is None:
+            raise KeyError(item_id)
+        return self._record(position)
+
+    def values(self):
+        return (self._record(position) for position in range(len(self.ids)))
+
+    def rows(self):
+        return zip(self.amounts, (self.categories[code] for code in self.category_codes),
+                   (self.dates[code] for code in self.date_codes))
+
+    # Представления NumPy создаются без копирования и живут только внутри одного вызова,
+    # иначе массивы нельзя было бы расширять
+    def _vectors(self):
+        return (numpy.frombuffer(self.amounts, dtype=numpy.float64),
+                numpy.frombuffer(self.ordinals, dtype=numpy.intc),
+                numpy.frombuffer(self.category_codes, dtype=numpy.intc))
+
+    def _positions(self, start=None, end=None):
+        if start is None and end is None:
+            return range(len(self.ids))
+        start = start if start is not None else 1
+        end = end if end is not None else datetime.max.toordinal()
+        return [position for position, ordinal in enumerate(self.ordinals) if start <= ordinal <= end]
+
+    def _mask(self, ordinals, start, end):
+        mask = numpy.ones(len(ordinals), dtype=bool)
+        if start is not None:
+            mask &= ordinals >= start
+        if end is not None:
+            mask &= ordinals <= end
+        return mask
+
+    def balance(self):
+        if numpy is not None and self.ids:
+            return float(self._vectors()[0].sum())
+        return sum(self.amounts)
+
+    def positions_between(self, start, end):
+        if numpy is not None and self.ids:
+            ordinals = self._vectors()[1]
+            selected = numpy.flatnonzero(self._mask(ordinals, start, end))
+            return selected[numpy.argsort(ordinals[selected], kind='stable')].tolist()
+        positions = self._positions(start, end)
+        return sorted(positions, key=self.ordinals.__getitem__)
+
+    def records_between(self, start, end):
+        return [self._record(position) for position in self.positions_between(start, end)]
+
+    # Не больше limit ключей (дата, ID) после курсора в порядке дат. Индекса по дате в колоночном
+    # режиме нет: ключ сворачивается в одно число и отбирается частичной сортировкой
+    def keys_after(self, cursor, limit):
+        cursor = cursor or (0, 0)
+        if numpy is not None and self.ids:
+            ids = numpy.frombuffer(self.ids, dtype=numpy.int64)
+            keys = self._vectors()[1].astype(numpy.int64) * 2 ** 32 + ids
+            candidates = numpy.flatnonzero(keys > cursor[0] * 2 ** 32 + cursor[1])
+            if len(candidates) > limit:
+                candidates = candidates[numpy.argpartition(keys[candidates], limit)[:limit]]
+            positions = candidates[numpy.argsort(keys[candidates])].tolist()
+            return [(self.ordinals[position], self.ids[position]) for position in positions]
+        return heapq.nsmallest(limit, (key for key in zip(self.ordinals, self.ids) if key > cursor))
+
+    # Доход, расход и суммы по категориям за диапазон порядковых номеров дней за один проход
+    def summarize(self, start=None, end=None):
+        if numpy is not None and self.ids:
+            amounts, ordinals, codes = self._vectors()
+            mask = self._mask(ordinals, start, end)
+            selected = amounts[mask]
+            income = float(selected[selected > 0].sum())
+            expense = float(selected[selected <= 0].sum())
+            totals = numpy.bincount(codes[mask], weights=selected, minlength=len(self.categories))
+            present = numpy.bincount(codes[mask], minlength=len(self.categories))
+            categories = {self.categories[code]: float(totals[code]) for code in numpy.flatnonzero(present)}
+            return income, expense, categories
+        income = 0
+        expense = 0
+        categories = {}
+        for position in self._positions(start, end):
+            amount = self.amounts[position]
+            if amount > 0:
+                income += amount
+            else:
+                expense += amount
+            category = self.categories[self.category_codes[position]]
+            categories[category] = categories.get(category, 0) + amount
+        return income, expense, categories
+
+    def top_expenses(self, count, start=None, end=None):
+        if numpy is not None and self.ids:
+            amounts, ordinals, _ = self._vectors()
+            candidates = numpy.flatnonzero(self._mask(ordinals, start, end) & (amounts < 0))
+            if len(candidates) > count:
+                candidates = candidates[numpy.argpartition(amounts[candidates], count)[:count]]
+            positions = candidates[numpy.argsort(amounts[candidates], kind='stable')].tolist()
+        else:
+            positions = heapq.nsmallest(count, (position for position in self._positions(start, end)
+                                                if self.amounts[position] < 0), key=self.amounts.__getitem__)
+        return [self._record(position) for position in positions]
+
+
+WORD_PATTERN = re.compile(r'\w+')
+# Лёгкий стемминг: отбрасывается самое длинное подходящее окончание (русское или английское)
+STEM_SUFFIXES = frozenset((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией', 'ия', 'ие', 'ий', 'ый', 'ой',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ов', 'ев', 'ей', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й', 'ing', 'ed', 'es', 's'
+))
+STEM_SUFFIX_LENGTHS = sorted({len(suffix) for suffix in STEM_SUFFIXES}, reverse=True)
+
+
+@functools.lru_cache(maxsize=65536)
+def stem_word(word):
+    for length in STEM_SUFFIX_LENGTHS:
+        if len(word) - length >= 3 and word[-length:] in STEM_SUFFIXES:
+            return word[:-length]
+    return word
+
+
+def tokenize(text, stem=False):
+    words = WORD_PATTERN.findall(text.lower())
+    return [stem_word(word) for word in words] if stem else words
+
+
+# Полнотекстовый индекс: термин -> {ID документа: вес}, ранжирование по BM25.
+# Слова заголовка весят больше слов содержимого
+class TextIndex:
+    K1 = 1.5
+    B = 0.75
+    TITLE_WEIGHT = 2
+
+    def __init__(self, stem=True):
+        self.stem = stem
+        self.postings = {}
+        self.lengths = {}
+        self.terms = {}
+        self.total_length = 0
+        # Поколение данных, которому соответствует сохранённый индекс
+        self.generation = None
+        self.dirty = False
+
+    def add(self, doc_id, title, content):
+        self.remove(doc_id)
+        counts = {}
+        for term in tokenize(title, self.stem):
+            counts[term] = counts.get(term, 0) + self.TITLE_WEIGHT
+        for term in tokenize(content, self.stem):
+            counts[term] = counts.get(term, 0) + 1
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(counts.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+        self.terms[doc_id] = tuple(counts)
+        self.dirty = True
+
+    def remove(self, doc_id):
+        terms = self.terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+        self.dirty = True
+
+    def query_terms(self, query):
+        return set(tokenize(query, self.stem))
+
+    def search(self, query, limit=10):
+        terms = self.query_terms(query)
+        if not terms or not self.lengths:
+            return []
+        doc_count = len(self.lengths)
+        average_length = self.total_length / doc_count or 1
+        scores = {}
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, frequency in docs.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        return heapq.nlargest(limit, scores.items(), key=operator.itemgetter(1))
+
+    def to_dict(self):
+        return {
+            "stem": self.stem,
+            "generation": self.generation,
+            "lengths": list(self.lengths.items()),
+            "postings": {term: list(docs.items()) for term, docs in self.postings.items()}
+        }
+
+    @staticmethod
+    def from_dict(data):
+        index = TextIndex(data["stem"])
+        index.generation = data["generation"]
+        index.lengths = dict(data["lengths"])
+        index.total_length = sum(index.lengths.values())
+        terms = {doc_id: [] for doc_id in index.lengths}
+        for term, docs in data["postings"].items():
+            index.postings[term] = dict(docs)
+            for doc_id, _ in docs:
+                terms[doc_id].append(term)
+        index.terms = {doc_id: tuple(doc_terms) for doc_id, doc_terms in terms.items()}
+        return index
+
+
+# Тексты заметок вне основного файла: тела дописываются подряд в отдельный файл (UTF-8),
+# в записи заметки остаётся ссылка (смещение, длина); чтение - через mmap
+class BodyStore:
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+        # Отображение файла для чтения; пересоздаётся под блокировкой, читатели берут его в локальную переменную
+        self._map = None
+        self._map_lock = threading.Lock()
+
+    def put(self, text):
+        if self._writer is None:
+            self._writer = open(self.path, 'ab')
+        data = text.encode('utf-8')
+        self._writer.write(data)
+        if METRICS.enabled:
+            METRICS.add_bytes(written=len(data))
+        # Текст должен оказаться в файле раньше, чем ссылка на него попадёт в снимок или журнал.
+        # Файл открыт на дозапись, и другие процессы тоже могут дописывать в него: смещение берётся
+        # из позиции после записи, а не до неё
+        self._writer.flush()
+        return self._writer.tell() - len(data), len(data)
+
+    def get(self, ref):
+        offset, length = ref
+        if not length:
+            return ''
+        # Отображение пересоздаётся, только когда ссылка указывает за его конец (файл дописан)
+        mapping = self._map
+        if mapping is None or offset + length > len(mapping):
+            mapping = self._remap(offset + length)
+        if METRICS.enabled:
+            METRICS.add_bytes(read=length)
+        return mapping[offset:offset + length].decode('utf-8')
+
+    # Заметки читают параллельно несколько потоков API сервера: новое отображение подменяет старое,
+    # а старое не закрывается - его ещё могут читать другие потоки, оно освободится вместе с последней ссылкой
+    def _remap(self, end):
+        with self._map_lock:
+            mapping = self._map
+            if mapping is None or end > len(mapping):
+                if os.path.getsize(self.path) >= end:
+                    with open(self.path, 'rb') as f:
+                        mapping = self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapping is None or end > len(mapping):
+                raise IOError(f"ссылка за пределами файла {self.path}")
+            return mapping
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+# Итоги массового импорта из CSV
+class ImportResult:
+    MAX_SKIPPED_ROWS = 100
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.skip_reasons = {}
+        # Номера пропущенных строк хранятся выборочно, чтобы память не росла с размером файла
+        self.skipped_rows = []
+        self.chunks = []
+        self.error = None
+
+    def skip(self, row_number, reason):
+        self.skipped += 1
+        self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+        if len(self.skipped_rows) < self.MAX_SKIPPED_ROWS:
+            self.skipped_rows.append((row_number, reason))
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "skip_reasons": self.skip_reasons,
+            "skipped_rows": self.skipped_rows,
+            "chunks": self.chunks,
+            "error": self.error
+        }
+
+
+# Страница списка: записи и курсор - ключ сортировки последней записи, с которого начнётся следующая
+# страница (None - страница последняя). В командах и API курсор передаётся строкой вида "738000:15"
+class Page:
+    def __init__(self, items, cursor):
+        self.items = items
+        self.cursor = cursor
+
+    @property
+    def token(self):
+        return None if self.cursor is None else ':'.join(map(str, self.cursor))
+
+    @staticmethod
+    def parse_cursor(token):
+        try:
+            return tuple(int(part) for part in token.split(':'))
+        except ValueError:
+            raise ValueError(f"Неверный курсор: {token}") from None
+
+
+# Строки списка выводятся одной записью в stdout, а не print на каждую строку
+def render_lines(lines):
+    sys.stdout.write(''.join(f"{line}\n" for line in lines))
+
+
+# Базовый менеджер: коллекция с индексом по ID, загрузка и сохранение через хранилище
+class BaseManager:
+    model = None
+    entity_name = ''
+    IMPORT_CHUNK_SIZE = 1000
+    # Таблица и индексируемые колонки (имя -> извлечение значения из to_dict) для SQLite
+    sql_table = None
+    sql_columns = {}
+    # Сортировки постраничных списков: имя -> (колонка SQLite, ключ записи). Ключ заканчивается ID,
+    # поэтому порядок однозначен и курсор не сдвигается при добавлении и удалении записей
+    SORT_KEYS = {'id': ('id', lambda item: (item.id,))}
+    PAGE_SIZE = 20
+
+    def __init__(self, filepath, storage=None):
+        self.filepath = filepath
+        self.storage = storage if storage is not None else JsonStorage(filepath)
+        self._items = {}
+        self._next_id = 1
+        # Счётчик изменений: по нему производные индексы на диске сверяются с данными
+        self._generation = 0
+        # Отложенные изменения (ID -> последняя операция): копятся внутри batch() и при отложенной записи
+        self._pending = {}
+        self._batch_depth = 0
+        self._write_behind = 0
+        self._flush_timer = None
+        # Отложенная запись идёт из потока таймера: изменения коллекции и запись не должны пересекаться
+        self._flush_lock = threading.RLock()
+        # Общий каталог данных для нескольких процессов: запись и чтение - под блокировкой файла,
+        # версия файлов на диске запоминается после каждого чтения и записи
+        self._file_lock = FileLock(self.storage.lock_path)
+        self._signature = None
+        # Отпечатки записей в том виде, в каком их прочитали перед изменением (ID -> отпечаток),
+        # и граница ID, ниже которой записи уже были на диске при последней синхронизации
+        self._bases = {}
+        self._synced_next_id = 1
+        if self.storage.lazy:
+            self.storage.bind(self.sql_table, self.sql_columns)
+
+    # В ленивом режиме (SQLite) коллекция в памяти не держится, записи читаются из хранилища
+    def _new_container(self):
+        return {}
+
+    # Ленивое хранилище отвечает на запросы с диска; отложенные изменения накладываются на ответ
+    # (см. _select), чтение внутри пакета их не записывает
+    def _all_items(self):
+        if not self.storage.lazy:
+            return self._items.values()
+        if self._pending:
+            return iter(self._select(()))
+        return (self.model.from_dict(data) for data in self.storage.select())
+
+    def _count(self):
+        if not self.storage.lazy:
+            return len(self._items)
+        with self._flush_lock:
+            count = self.storage.count()
+            # Отложенная запись добавляет к числу на диске новую запись, удаление убирает существующую
+            for item_id, (op, _) in self._pending.items():
+                count += (op == 'put') - (self.storage.get(item_id) is not None)
+        return count
+
+    # Значение индексируемой колонки записи-словаря - то же, что хранилище пишет в колонку
+    def _column_value(self, data, column):
+        return data['id'] if column == 'id' else self.sql_columns[column](data)
+
+    # Внутри пакета изменения ещё не в хранилище: отложенные записи накладываются на его ответ
+    # (заменяют прочитанные, удалённые выбрасываются), а не записываются перед каждым чтением
+    def _select(self, conditions, order_by='id', limit=None):
+        with self._flush_lock:
+            pending = dict(self._pending)
+            # Запас на отложенные: столько прочитанных записей могут оказаться заменёнными или удалёнными
+            found = [data for data in self.storage.select(
+                conditions, order_by, limit if limit is None or not pending else limit + len(pending))
+                if data['id'] not in pending]
+        if not pending:
+            return self.model.from_dicts(found)
+        match = condition_matcher(conditions, self._column_value)
+        found.extend(data for data in self._to_dicts([item for op, item in pending.values() if op == 'put'])
+                     if match(data))
+        found.sort(key=order_key(order_by, self._column_value))
+        return self.model.from_dicts(found[:limit])
+
+    # Страница списка после курсора. Вся коллекция читается по индексу (в SQLite - запросом с LIMIT),
+    # так что стоимость пропорциональна странице, а не числу записей; items - уже отобранные фильтром
+    # записи, из которых выбирается страница, conditions - условия фильтра для ленивого хранилища,
+    # они уходят в запрос вместе с курсором. Записи без значения ключа не попадают; у задач без срока
+    # ключ есть - UNDATED_ORDINAL, они идут последними
+    def page(self, cursor=None, limit=None, sort='id', items=None, conditions=()):
+        if sort not in self.SORT_KEYS:
+            raise ValueError(f"Неизвестная сортировка: {sort}. Доступны: {', '.join(self.SORT_KEYS)}.")
+        column, sort_key = self.SORT_KEYS[sort]
+        limit = self.PAGE_SIZE if limit is None else limit
+        if limit <= 0:
+            raise ValueError("Размер страницы должен быть положительным.")
+        if cursor is not None and len(cursor) != (1 if sort == 'id' else 2):
+            raise ValueError("Курсор не подходит к сортировке.")
+        # На одну запись больше страницы: так видно, есть ли следующая
+        if items is not None:
+            keyed = ((sort_key(item), item) for item in items)
+            candidates = ((key, item) for key, item in keyed if key[0] is not None and (cursor is None or key > cursor))
+            found = [item for _, item in heapq.nsmallest(limit + 1, candidates, key=operator.itemgetter(0))]
+        elif self.storage.lazy:
+            order_by = 'id' if sort == 'id' else f'{column}, id'
+            found = self._select(list(conditions) + self._cursor_conditions(sort, cursor), order_by, limit + 1)
+        else:
+            found = [self._items[key[-1]] for key in self._keys_after(sort, cursor, limit + 1)]
+        if len(found) <= limit:
+            return Page(found, None)
+        found = found[:limit]
+        return Page(found, sort_key(found[-1]))
+
+    # Страница с фильтром filter_by в формате фильтра менеджера (_filter_items и _filter_conditions
+    # менеджера): в ленивом хранилище фильтр, курсор и LIMIT - один запрос, без выборки всех
+    # отфильтрованных записей; в памяти страница выбирается из записей, отобранных индексами
+    def filtered_page(self, filter_by, cursor=None, limit=None, sort='id'):
+        if not filter_by:
+            return self.page(cursor, limit, sort)
+        if self.storage.lazy:
+            return self.page(cursor, limit, sort, conditions=self._filter_conditions(filter_by))
+        return self.page(cursor, limit, sort, self._filter_items(filter_by))
+
+    # Ключ (значение, ID) после курсора в SQL: значение больше, или равно при большем ID
+    def _cursor_conditions(self, sort, cursor):
+        column = self.SORT_KEYS[sort][0]
+        if sort == 'id':
+            return [('id', '>', cursor[0])] if cursor else []
+        if cursor is None:
+            return [(column, '>', 0)]
+        return [[(column, '>', cursor[0]), ('id', '>', cursor[1])], (column, '>=', cursor[0])]
+
+    # Ключи следующей страницы в памяти; менеджеры с другими сортировками берут их из своих индексов
+    def _keys_after(self, sort, cursor, limit):
+        return [(item_id,) for item_id in self._ids_after(cursor[0] if cursor else 0, limit)]
+
+    # ID выдаются по возрастанию: перебор от курсора стоит O(страница + удалённые в ней ID).
+    # Если удалённых слишком много, один проход по коллекции дешевле
+    def _ids_after(self, after, limit):
+        ids = []
+        budget = len(self._items) + limit
+        item_id = after
+        while len(ids) < limit and item_id < self._next_id:
+            item_id += 1
+            budget -= 1
+            if budget < 0:
+                return heapq.nsmallest(limit, (item_id for item_id in self._items if item_id > after))
+            if item_id in self._items:
+                ids.append(item_id)
+        return ids
+
+    def _load_items(self):
+        with self._file_lock:
+            try:
+                items_data = [] if self.storage.lazy else self.storage.load()
+                meta = self.storage.load_meta()
+            except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+                print(f"Ошибка загрузки {self.entity_name}: {e}")
+                items_data, meta = [], {}
+            self._signature = self.storage.signature()
+            self._items = self._new_container()
+            for item in self._from_dicts(items_data):
+                self._items[item.id] = item
+            self._apply_meta(meta)
+            self._bases = {}
+            self._synced_next_id = self._next_id
+        self._rebuild_indexes()
+
+    def _synced(self):
+        self._signature = self.storage.signature()
+        self._synced_next_id = self._next_id
+
+    def _changed_on_disk(self):
+        return self.storage.signature() != self._signature
+
+    # Перечитывание, только если файлы хранилища изменились (например, другим процессом)
+    def refresh(self):
+        with self._flush_lock:
+            if self._pending or self._batch_depth:
+                return False
+            with self._file_lock:
+                if not self._changed_on_disk():
+                    return False
+                self._load_items()
+        return True
+
+    # Преобразование записей для хранилища; менеджер может хранить запись не в том виде, что модель
+    def _from_dicts(self, items_data):
+        return self.model.from_dicts(items_data)
+
+    def _to_rows(self, items):
+        return self.model.to_rows(items)
+
+    def _to_dicts(self, items):
+        return list(self._to_rows(items))
+
+    def _apply_meta(self, meta):
+        # Счётчик только растёт: ID удалённых записей повторно не выдаются
+        self._next_id = max(meta.get('next_id', 1), max(self._items, default=0) + 1)
+        self._generation = meta.get('generation', 0)
+
+    def _meta(self):
+        return {"next_id": self._next_id, "generation": self._generation}
+
+    def _new_id(self):
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    # Вторичные индексы менеджеров обновляются вместе с коллекцией (только в памяти)
+    def _index_item(self, item):
+        pass
+
+    def _unindex_item(self, item):
+        pass
+
+    def _rebuild_indexes(self):
+        for item in self._items.values():
+            self._index_item(item)
+        self._merge_indexes()
+
+    # Вливание накопленных ключей отсортированных индексов; вызывается только при изменении данных
+    def _merge_indexes(self):
+        pass
+
+    # Повторная индексация изменённой записи; индексы заменяют прежние ключи записи по её ID
+    def _reindex(self, item):
+        if not self.storage.lazy:
+            self._index_item(item)
+
+    def _get(self, item_id):
+        if self.storage.lazy:
+            with self._flush_lock:
+                op, item = self._pending.get(item_id, (None, None))
+                data = self.storage.get(item_id) if op is None else None
+            if op is None:
+                item = self.model.from_dict(data) if data else None
+            elif op == 'delete':
+                item = None
+        else:
+            item = self._items.get(item_id)
+        return item
+
+    # Запись, прочитанная для изменения: запоминаем, какой она была, чтобы при записи заметить чужую правку.
+    # Отпечатки снимаются только здесь, на пути записи, и сбрасываются после неё
+    def _get_for_update(self, item_id):
+        item = self._get(item_id)
+        if item is not None and item_id < self._synced_next_id and item_id not in self._bases:
+            self._bases[item_id] = record_fingerprint(self._to_dicts([item])[0])
+        return item
+
+    # В ленивом режиме изменения попадают в хранилище только через _persist
+    def _add(self, item):
+        if not self.storage.lazy:
+            with self._flush_lock:
+                self._items[item.id] = item
+                self._index_item(item)
+
+    def _remove(self, item):
+        if not self.storage.lazy:
+            with self._flush_lock:
+                self._unindex_item(item)
+                del self._items[item.id]
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        self.storage.close()
+
+    # Полный снимок покрывает все отложенные изменения; в режиме SQLite снимка нет - они дописываются.
+    # Если файлы успели измениться другим процессом, изменения сливаются с ними, а не затирают их.
+    # False - не всё записано: ошибка записи или конфликт с другим процессом. Отложенные изменения
+    # снимаются только после записи, при ошибке остаются и пишутся следующей записью
+    def _save_items(self):
+        with self._flush_lock, self._file_lock:
+            changes = list(self._pending.values())
+            if self._changed_on_disk():
+                return self._write_merged(changes)
+            try:
+                if self.storage.lazy:
+                    self.storage.append(self._entries(changes), self._meta())
+                else:
+                    self.storage.save(self._to_rows(list(self._all_items())), self._meta())
+            except STORAGE_ERRORS as e:
+                print(f"Ошибка сохранения {self.entity_name}: {e}")
+                return False
+            self._written(changes)
+            return True
+
+    # Потоковый импорт: CSV читается порциями, ID выдаются счётчиком, запись - один раз в конце
+    # или каждые checkpoint строк, так что время и память линейны по размеру файла.
+    # Строку разбирает _parse_import_row менеджера: поля модели или ValueError с причиной пропуска
+    def _import_csv(self, csv_filepath, chunk_size=None, checkpoint=None, progress=None):
+        chunk_size = chunk_size or self.IMPORT_CHUNK_SIZE
+        result = ImportResult()
+        pending = []
+        try:
+            with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
+                reader = csv.DictReader(csvfile)
+                while True:
+                    chunk = list(itertools.islice(reader, chunk_size))
+                    if not chunk:
+                        break
+                    new_items = []
+                    for row_number, row in enumerate(chunk, start=result.rows + 1):
+                        try:
+                            fields = self._parse_import_row(row)
+                        except ValueError as ve:
+                            result.skip(row_number, str(ve))
+                            continue
+                        new_items.append(self.model(id=self._new_id(), **fields))
+                    for item in new_items:
+                        self._add(item)
+                    pending.extend(new_items)
+                    result.rows += len(chunk)
+                    result.imported += len(new_items)
+                    if checkpoint and len(pending) >= checkpoint:
+                        self._persist_many('put', pending)
+                        pending = []
+                    chunk_stats = {"rows": result.rows, "imported": result.imported, "skipped": result.skipped}
+                    result.chunks.append(chunk_stats)
+                    if progress:
+                        progress(chunk_stats)
+        except (IOError, csv.Error) as e:
+            # Незафиксированная часть импорта откатывается, уже записанные контрольные точки остаются
+            for item in pending:
+                self._remove(item)
+            result.imported -= len(pending)
+            result.error = str(e)
+            return result
+        if pending:
+            self._persist_many('put', pending)
+        return result
+
+    def _report_import(self, result):
+        if result.error:
+            print(f"Ошибка импорта {self.entity_name}: {result.error}")
+            return
+        print(f"Импорт {self.entity_name} завершен успешно. "
+              f"Импортировано: {result.imported}, пропущено: {result.skipped}.")
+        for reason, count in result.skip_reasons.items():
+            print(f"Пропущено ({reason}): {count}")
+
+    def _persist(self, op, item):
+        return self._persist_many(op, [item])
+
+    # В журнальном режиме каждая операция стоит O(1): дописывается одна строка журнала.
+    # False - изменение не записано (конфликт или ошибка записи, причина уже выведена). Отложенные
+    # изменения считаются принятыми: их конфликты выводятся при записи пакета
+    def _persist_many(self, op, items):
+        self._generation += len(items)
+        # В пакете ключи индексов вливаются один раз при выходе из него
+        if not self._batch_depth:
+            self._merge_indexes()
+        if self._batch_depth or self._write_behind:
+            with self._flush_lock:
+                for item in items:
+                    self._pending[item.id] = (op, item)
+                self._schedule_flush()
+            return True
+        return self._write([(op, item) for item in items])
+
+    def _entries(self, changes):
+        payloads = iter(self._to_dicts([item for op, item in changes if op == 'put']))
+        return [(op, next(payloads) if op == 'put' else item.id) for op, item in changes]
+
+    # Изменения пишутся вместе с оставшимися от неудачной записи: они тоже ждут в _pending
+    def _write(self, changes):
+        with self._flush_lock, self._file_lock:
+            self._pending.update((item.id, (op, item)) for op, item in changes)
+            changes = list(self._pending.values())
+            if self._changed_on_disk():
+                return self._write_merged(changes)
+            if not self.storage.incremental:
+                return self._save_items()
+            try:
+                self.storage.append(self._entries(changes), self._meta())
+            except STORAGE_ERRORS as e:
+                print(f"Ошибка сохранения {self.entity_name}: {e}")
+                return False
+            self._written(changes)
+            if self.storage.needs_compaction():
+                self._save_items()
+            return True
+
+    # Записанные изменения снимаются с ожидания, если их не сменило более новое изменение той же записи
+    def _written(self, changes):
+        for change in changes:
+            item_id = change[1].id
+            self._bases.pop(item_id, None)
+            if self._pending.get(item_id) is change:
+                del self._pending[item_id]
+        self._synced()
+
+    # Слияние с изменениями другого процесса (вызывается под блокировкой файла). Изменение записи,
+    # которую после прочтения поменяли на диске, не записывается (оптимистическая проверка), и результат
+    # тогда False; новые записи, чей ID уже занят на диске, получают следующий свободный ID - он же
+    # становится ID объекта записи. Затем данные перечитываются
+    def _write_merged(self, changes):
+        try:
+            disk_meta = self.storage.load_meta()
+            if self.storage.lazy:
+                disk = {item.id: self.storage.get(item.id) for _, item in changes}
+            else:
+                disk = {data['id']: data for data in self.storage.load()}
+        except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+            print(f"Ошибка сохранения {self.entity_name}: {e}")
+            return False
+        next_id = max(self._next_id, disk_meta.get('next_id', 1), max(disk, default=0) + 1)
+        accepted = []
+        conflicts = []
+        renumbered = []
+        for (op, item), (_, payload) in zip(changes, self._entries(changes)):
+            base = self._bases.get(item.id)
+            current = disk.get(item.id)
+            if base is not None:
+                if record_fingerprint(current) != base:
+                    conflicts.append(item.id)
+                    continue
+            elif item.id >= self._synced_next_id and current is not None:
+                if op == 'delete':
+                    continue
+                payload = dict(payload, id=next_id)
+                renumbered.append((item, next_id))
+                next_id += 1
+            accepted.append((op, payload))
+        meta = self._meta()
+        meta['next_id'] = next_id
+        meta['generation'] = max(disk_meta.get('generation', 0), self._generation) + 1
+        try:
+            if self.storage.incremental:
+                self.storage.append(accepted, meta)
+            else:
+                for op, payload in accepted:
+                    if op == 'put':
+                        disk[payload['id']] = payload
+                    else:
+                        disk.pop(payload, None)
+                self.storage.save(list(disk.values()), meta)
+        except STORAGE_ERRORS as e:
+            print(f"Ошибка сохранения {self.entity_name}: {e}")
+            return False
+        # Отклонённые из-за конфликта изменения тоже снимаются: на их месте перечитанные с диска данные
+        self._written(changes)
+        if conflicts:
+            print(f"Конфликт: {self.entity_name} с ID {', '.join(map(str, conflicts))} изменены другим "
+                  f"процессом, ваши изменения этих записей не сохранены.")
+        for item, new_id in renumbered:
+            print(f"ID {item.id} уже занят другим процессом, запись сохранена с ID {new_id}.")
+            item.id = new_id
+        # Коллекция и индексы перестраиваются с диска - уже с новыми ID и без отклонённых изменений
+        self._load_items()
+        self._after_merge()
+        return not conflicts
+
+    def _after_merge(self):
+        pass
+
+    # Накопленные изменения пишутся одной операцией: один снимок, одна порция журнала или одна транзакция;
+    # для каждой записи - только последнее состояние
+    def flush(self):
+        with self._flush_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending:
+                return True
+            return self._write([])
+
+    # Пакет изменений: запись откладывается до выхода из самого внешнего batch(). Отката нет -
+    # при исключении уже сделанные изменения тоже записываются, чтобы диск совпадал с памятью
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._merge_indexes()
+                self.flush()
+
+    # Отложенная запись: изменения пишутся не позже чем через delay секунд после первого из них,
+    # все вместе; при завершении программы несохранённое записывается обязательно
+    def set_write_behind(self, delay):
+        self.flush()
+        self._write_behind = delay
+        if delay:
+            atexit.register(self.flush)
+        else:
+            atexit.unregister(self.flush)
+
+    def _schedule_flush(self):
+        if self._batch_depth or self._flush_timer is not None:
+            return
+        self._flush_timer = threading.Timer(self._write_behind, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+
+# Базовый класс моделей: поля в __slots__ (без словаря атрибутов у каждой записи). fields - сохраняемые
+# поля в порядке аргументов конструктора, остальные слоты вычисляются из них (например, порядковый номер даты)
+class Record:
+    __slots__ = ()
+    fields = ()
+
+    # Пакетный разбор: все поля записи достаются одним itemgetter, без именованных аргументов
+    @classmethod
+    def from_dicts(cls, items_data):
+        getter = operator.itemgetter(*cls.fields)
+        try:
+            return [cls(*values) for values in map(getter, items_data)]
+        except KeyError:
+            # В старых файлах необязательных полей может не быть - такие списки разбираются по записи
+            return [cls.from_dict(data) for data in items_data]
+
+    # Пакетная сериализация: поля всех записей достаются одним attrgetter сразу кортежем
+    @classmethod
+    def to_rows(cls, items):
+        return RecordRows(cls.fields, list(map(operator.attrgetter(*cls.fields), items)))
+
 
 # Модель Заметки
-class Note:
+class Note(Record):
+    __slots__ = fields = ('id', 'title', 'content', 'timestamp')
+
     def __init__(self, id, title, content, timestamp=None):
         self.id = id
         self.title = title
@@ -48,50 +2304,228 @@ class Note:
 
 
 # Менеджер Заметок
-class NoteManager:
-    def __init__(self, filepath='notes.json'):
-        self.filepath = filepath
-        self.notes = []
+class NoteManager(BaseManager):
+    model = Note
+    entity_name = 'заметок'
+    sql_table = 'notes'
+
+    # Мусор в файле текстов (старые версии и удалённые заметки), после которого файл переписывается
+    BODY_COMPACT_MIN = 1 << 20
+
+    def __init__(self, filepath='notes.json', storage=None, stemming=True, external_bodies=True):
+        self._text_index = TextIndex(stemming)
+        self._body_refs = {}
+        self._bodies = None
+        self._bodies_garbage = 0
+        super().__init__(filepath, storage)
+        # Тексты выносятся из основного файла в режимах со снимком; SQLite и так читает записи по требованию
+        self.external_bodies = external_bodies and not self.storage.lazy
+        self.index_path = os.path.splitext(filepath)[0] + '.index.json'
         self.load_notes()
 
+    @property
+    def notes(self):
+        return self._all_items()
+
     def load_notes(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    notes_data = json.load(f)
-                    self.notes = [Note.from_dict(note) for note in notes_data]
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Ошибка загрузки заметок: {e}")
-                self.notes = []
-        else:
-            self.notes = []
+        self._load_items()
 
     def save_notes(self):
+        self._save_items()
+        self.save_index()
+
+    # В памяти держится только заголовок заметки (content = None), в файле - ссылка на текст
+    def _to_rows(self, notes):
+        if not self.external_bodies:
+            return Note.to_rows([self._full_note(note) for note in notes])
+        refs = self._body_refs
+        return RecordRows(('id', 'title', 'timestamp', 'body'),
+                          [(note.id, note.title, note.timestamp, refs[note.id]) for note in notes])
+
+    def _from_dicts(self, items_data):
+        self._body_refs = {}
+        notes = []
+        for data in items_data:
+            if 'body' in data:
+                self._body_refs[data['id']] = tuple(data['body'])
+                notes.append(Note(data['id'], data['title'], None, data['timestamp']))
+            else:
+                notes.append(Note.from_dict(data))
+        return notes
+
+    def _meta(self):
+        meta = super()._meta()
+        if self._bodies is not None:
+            meta['bodies'] = {"file": os.path.basename(self._bodies.path), "garbage": self._bodies_garbage}
+        return meta
+
+    def _apply_meta(self, meta):
+        super()._apply_meta(meta)
+        if self._bodies is not None:
+            self._bodies.close()
+            self._bodies = None
+        if self.storage.lazy:
+            return
+        bodies = meta.get('bodies', {})
+        default_name = os.path.basename(os.path.splitext(self.filepath)[0]) + '.bodies'
+        self._bodies = BodyStore(os.path.join(os.path.dirname(self.filepath), bodies.get('file', default_name)))
+        self._bodies_garbage = bodies.get('garbage', 0)
+
+    # Файл в старом формате (тексты внутри) или с выключенным выносом текстов переводится один раз
+    def _load_items(self):
+        super()._load_items()
+        if self.storage.lazy:
+            return
+        if self.external_bodies:
+            moved = [note for note in self._items.values() if note.content is not None]
+            for note in moved:
+                self._store_body(note)
+        else:
+            moved = [note for note in self._items.values() if note.content is None]
+            for note in moved:
+                note.content = self._read_body(note.id)
+            self._body_refs = {}
+        if moved:
+            self._save_items()
+
+    def _store_body(self, note):
+        old_ref = self._body_refs.get(note.id)
+        if old_ref:
+            self._bodies_garbage += old_ref[1]
+        self._body_refs[note.id] = self._bodies.put(note.content)
+        note.content = None
+
+    def _read_body(self, note_id):
+        ref = self._body_refs.get(note_id)
+        if ref is None:
+            return ''
+        try:
+            return self._bodies.get(ref)
+        except (IOError, ValueError) as e:
+            print(f"Ошибка чтения текста заметки {note_id}: {e}")
+            return ''
+
+    # Полная заметка - отдельный объект, чтобы прочитанный текст не оставался в памяти
+    def _full_note(self, note):
+        if note.content is not None:
+            return note
+        return Note(note.id, note.title, self._read_body(note.id), note.timestamp)
+
+    # Поисковый индекс ведётся во всех режимах хранения и обновляется вместе с заметками
+    def _add(self, note):
+        with self._flush_lock:
+            content = note.content
+            if self.external_bodies and content is not None:
+                self._store_body(note)
+            super()._add(note)
+            self._text_index.add(note.id, note.title, content if content is not None else self._read_body(note.id))
+
+    def _remove(self, note):
+        with self._flush_lock:
+            super()._remove(note)
+            self._text_index.remove(note.id)
+            ref = self._body_refs.pop(note.id, None)
+            if ref:
+                self._bodies_garbage += ref[1]
+
+    # Файл текстов переписывается только с живыми текстами, когда мусора больше, чем данных.
+    # Если файлы изменены другим процессом, его записи ссылаются на старый файл текстов - тогда
+    # изменения только сливаются, без уплотнения. Старый файл удаляется лишь после записи снимка
+    # со ссылками в новый; при ошибке остаются старый файл и старые ссылки
+    def _save_items(self):
+        with self._flush_lock, self._file_lock:
+            if (not self.external_bodies or self._bodies_garbage <= self.BODY_COMPACT_MIN
+                    or self._bodies_garbage <= sum(length for _, length in self._body_refs.values())
+                    or self._changed_on_disk()):
+                return super()._save_items()
+            previous = self._bodies, self._body_refs, self._bodies_garbage
+            self._compact_bodies()
+            if not super()._save_items():
+                self._bodies.close()
+                if os.path.exists(self._bodies.path):
+                    os.remove(self._bodies.path)
+                self._bodies, self._body_refs, self._bodies_garbage = previous
+                return False
+            if os.path.exists(previous[0].path):
+                os.remove(previous[0].path)
+            return True
+
+    def _compact_bodies(self):
+        old = self._bodies
+        stem = os.path.splitext(self.filepath)[0]
+        new_path = f"{stem}.{self._generation}.bodies"
+        if new_path == old.path:
+            new_path = f"{stem}.{self._generation}.1.bodies"
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        new = BodyStore(new_path)
+        self._body_refs = {note_id: new.put(old.get(ref)) for note_id, ref in self._body_refs.items()}
+        old.close()
+        self._bodies = new
+        self._bodies_garbage = 0
+
+    # Сохранённый индекс используется, если он построен для того же поколения данных
+    def _rebuild_indexes(self):
+        super()._rebuild_indexes()
+        index = self._load_index()
+        if index is None:
+            index = TextIndex(self._text_index.stem)
+            for note in self.notes:
+                index.add(note.id, note.title, self._full_note(note).content)
+        self._text_index = index
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = TextIndex.from_dict(json.load(f))
+        except (json.JSONDecodeError, IOError, KeyError, TypeError, ValueError):
+            return None
+        if index.stem != self._text_index.stem or index.generation != self._generation:
+            return None
+        return index
+
+    def save_index(self):
+        if not self._text_index.dirty:
+            return
+        self._text_index.generation = self._generation
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump([note.to_dict() for note in self.notes], f, ensure_ascii=False, indent=4)
+            atomic_write(self.index_path, json.dumps(self._text_index.to_dict(), ensure_ascii=False).encode('utf-8'))
+            self._text_index.dirty = False
         except IOError as e:
-            print(f"Ошибка сохранения заметок: {e}")
+            print(f"Ошибка сохранения поискового индекса: {e}")
+
+    def close(self):
+        self.flush()
+        self.save_index()
+        if self._bodies is not None:
+            self._bodies.close()
+        super().close()
 
     def create_note(self, title, content):
         try:
             if not title.strip():
                 raise ValueError("Заголовок заметки не может быть пустым.")
-            new_id = max([note.id for note in self.notes], default=0) + 1
+            new_id = self._new_id()
             new_note = Note(id=new_id, title=title, content=content)
-            self.notes.append(new_note)
-            self.save_notes()
+            self._add(new_note)
+            self._persist('put', new_note)
             print("Заметка успешно создана.")
+            return new_note
         except ValueError as ve:
             print(f"Ошибка: {ve}")
 
-    def list_notes(self):
-        if not self.notes:
-            print("Заметок нет.")
-            return
-        print("\nСписок заметок:")
-        for note in self.notes:
-            print(f"ID: {note.id}, Заголовок: {note.title}, Дата: {note.timestamp}")
+    # Одна страница списка; возвращает курсор следующей страницы или None, если она последняя
+    def list_notes(self, cursor=None, limit=None):
+        page = self.page(cursor, limit)
+        if not page.items:
+            print("Заметок нет." if cursor is None else "Больше заметок нет.")
+            return None
+        header = ["\nСписок заметок:"] if cursor is None else []
+        render_lines(header + [f"ID: {note.id}, Заголовок: {note.title}, Дата: {note.timestamp}"
+                               for note in page.items])
+        return page.cursor
 
     def view_note_details(self, note_id):
         note = self.get_note_by_id(note_id)
@@ -104,7 +2538,7 @@ class NoteManager:
             print("Заметка не найдена.")
 
     def edit_note(self, note_id, new_title, new_content):
-        note = self.get_note_by_id(note_id)
+        note = self._get_for_update(note_id)
         if note:
             try:
                 if not new_title.strip():
@@ -112,46 +2546,76 @@ class NoteManager:
                 note.title = new_title
                 note.content = new_content
                 note.timestamp = get_current_timestamp()
-                self.save_notes()
+                self._add(note)
+                if not self._persist('put', note):
+                    return None
                 print("Заметка успешно обновлена.")
+                return note
             except ValueError as ve:
                 print(f"Ошибка: {ve}")
         else:
             print("Заметка не найдена.")
 
     def delete_note(self, note_id):
-        note = self.get_note_by_id(note_id)
+        note = self._get_for_update(note_id)
         if note:
-            self.notes.remove(note)
-            self.save_notes()
+            self._remove(note)
+            if not self._persist('delete', note):
+                return None
             print("Заметка успешно удалена.")
+            return note
         else:
             print("Заметка не найдена.")
 
     def get_note_by_id(self, note_id):
-        for note in self.notes:
-            if note.id == note_id:
-                return note
-        return None
+        note = self._get(note_id)
+        return self._full_note(note) if note else None
 
-    def import_notes_csv(self, csv_filepath):
-        try:
-            with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    title = row.get('title', '').strip()
-                    content = row.get('content', '').strip()
-                    timestamp = row.get('timestamp', get_current_timestamp()).strip()
-                    if not title:
-                        print("Пропуск записи без заголовка.")
-                        continue
-                    new_id = max([note.id for note in self.notes], default=0) + 1
-                    new_note = Note(id=new_id, title=title, content=content, timestamp=timestamp)
-                    self.notes.append(new_note)
-            self.save_notes()
-            print("Импорт заметок завершен успешно.")
-        except (IOError, csv.Error) as e:
-            print(f"Ошибка импорта заметок: {e}")
+    def _snippet(self, content, terms, width=40):
+        for match in WORD_PATTERN.finditer(content):
+            word = match.group().lower()
+            if (stem_word(word) if self._text_index.stem else word) in terms:
+                start = max(0, match.start() - width)
+                end = min(len(content), match.end() + width)
+                return ('...' if start else '') + content[start:end] + ('...' if end < len(content) else '')
+        return content[:2 * width] + ('...' if len(content) > 2 * width else '')
+
+    # Найденные заметки без вывода: (заметка, релевантность, фрагмент)
+    def _search_notes(self, query, limit=10):
+        hits = self._text_index.search(query, limit)
+        terms = self._text_index.query_terms(query)
+        results = []
+        for note_id, score in hits:
+            note = self.get_note_by_id(note_id)
+            if note:
+                results.append((note, score, self._snippet(note.content, terms)))
+        return results
+
+    def search_notes(self, query, limit=10):
+        results = self._search_notes(query, limit)
+        if not results:
+            print("Заметки не найдены.")
+            return results
+        print("\nРезультаты поиска:")
+        for note, score, snippet in results:
+            print(f"ID: {note.id}, Заголовок: {note.title}, Дата: {note.timestamp}, Релевантность: {score:.2f}")
+            print(f"    {snippet}")
+        return results
+
+    def _parse_import_row(self, row):
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise ValueError("запись без заголовка")
+        return {
+            "title": title,
+            "content": (row.get('content') or '').strip(),
+            "timestamp": (row.get('timestamp') or '').strip() or None
+        }
+
+    def import_notes_csv(self, csv_filepath, chunk_size=None, checkpoint=None, progress=None):
+        result = self._import_csv(csv_filepath, chunk_size, checkpoint, progress)
+        self._report_import(result)
+        return result
 
     def export_notes_csv(self, csv_filepath):
         try:
@@ -160,21 +2624,31 @@ class NoteManager:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
                 for note in self.notes:
-                    writer.writerow(note.to_dict())
+                    writer.writerow(self._full_note(note).to_dict())
             print("Экспорт заметок завершен успешно.")
+            return True
         except IOError as e:
             print(f"Ошибка экспорта заметок: {e}")
+            return False
 
 
 # Модель Задачи
-class Task:
+class Task(Record):
+    fields = ('id', 'title', 'description', 'done', 'priority', 'due_date')
+    __slots__ = fields + ('due_ord',)
+
     def __init__(self, id, title, description, done=False, priority='Средний', due_date=None):
         self.id = id
         self.title = title
         self.description = description
         self.done = done
-        self.priority = priority
-        self.due_date = due_date
+        self.priority = intern_text(priority)
+        self.set_due_date(due_date)
+
+    # Срок хранится строкой (как в файле) и порядковым номером дня для сравнений
+    def set_due_date(self, due_date):
+        self.due_date = intern_text(due_date)
+        self.due_ord = date_to_ordinal(due_date)
 
     def to_dict(self):
         return {
@@ -199,32 +2673,95 @@ class Task:
 
 
 # Менеджер Задач
-class TaskManager:
+class TaskManager(BaseManager):
     PRIORITIES = ['Высокий', 'Средний', 'Низкий']
+    model = Task
+    entity_name = 'задач'
+    sql_table = 'tasks'
+    sql_columns = {
+        'done': operator.itemgetter('done'),
+        'priority': operator.itemgetter('priority'),
+        'due_ord': lambda data: date_to_ordinal(data.get('due_date')),
+        'due_key': lambda data: date_to_ordinal(data.get('due_date')) or UNDATED_ORDINAL
+    }
+    # Условия фильтрации: ключ -> (колонка SQLite, операция). Даты сравниваются по номеру дня, как в индексе
+    FILTER_COLUMNS = {
+        'status': ('done', '='),
+        'priority': ('priority', '='),
+        'due_date': ('due_ord', '='),
+        'due_from': ('due_ord', '>='),
+        'due_by': ('due_ord', '<='),
+    }
+    # due - задачи в порядке срока, задачи без срока - после всех задач со сроком
+    SORT_KEYS = dict(BaseManager.SORT_KEYS, due=('due_key', lambda task: (task.due_ord or UNDATED_ORDINAL, task.id)))
 
-    def __init__(self, filepath='tasks.json'):
-        self.filepath = filepath
-        self.tasks = []
+    def __init__(self, filepath='tasks.json', storage=None):
+        self._reset_indexes()
+        super().__init__(filepath, storage)
         self.load_tasks()
 
+    # Индексы по статусу, приоритету и сроку, плюс куча (срок, ID) невыполненных задач для "ближайших".
+    # Из кучи записи не удаляются: устаревшие пропускаются при чтении и выбрасываются при перестройке
+    def _reset_indexes(self):
+        self._by_status = {False: set(), True: set()}
+        self._by_priority = {}
+        self._due_index = DateIndex()
+        self._due_heap = []
+        # ID -> (выполнена, приоритет, порядковый номер срока) - ключи, под которыми задача лежит в индексах
+        self._task_keys = {}
+
+    def _index_item(self, task):
+        keys = (bool(task.done), task.priority, task.due_ord)
+        old_keys = self._task_keys.get(task.id)
+        if old_keys == keys:
+            return
+        if old_keys is not None:
+            self._unindex_item(task)
+        self._task_keys[task.id] = keys
+        done, priority, ordinal = keys
+        self._by_status[done].add(task.id)
+        self._by_priority.setdefault(priority, set()).add(task.id)
+        # Задачи без срока лежат в индексе в конце: по нему идут страницы в порядке срока
+        self._due_index.add(ordinal or UNDATED_ORDINAL, task.id)
+        if not done and ordinal is not None:
+            heapq.heappush(self._due_heap, (ordinal, task.id))
+            if len(self._due_heap) > 2 * len(self._task_keys) + 64:
+                self._rebuild_due_heap()
+
+    def _unindex_item(self, task):
+        keys = self._task_keys.pop(task.id, None)
+        if keys is None:
+            return
+        done, priority, ordinal = keys
+        self._by_status[done].discard(task.id)
+        self._by_priority[priority].discard(task.id)
+        self._due_index.remove(ordinal or UNDATED_ORDINAL, task.id)
+
+    def _rebuild_indexes(self):
+        self._reset_indexes()
+        super()._rebuild_indexes()
+
+    def _merge_indexes(self):
+        self._due_index.merge()
+
+    def _rebuild_due_heap(self):
+        self._due_heap = [(ordinal, task_id) for task_id, (done, _, ordinal) in self._task_keys.items()
+                          if not done and ordinal is not None]
+        heapq.heapify(self._due_heap)
+
+    def _is_pending(self, task_id, ordinal):
+        keys = self._task_keys.get(task_id)
+        return keys is not None and not keys[0] and keys[2] == ordinal
+
+    @property
+    def tasks(self):
+        return self._all_items()
+
     def load_tasks(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    tasks_data = json.load(f)
-                    self.tasks = [Task.from_dict(task) for task in tasks_data]
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Ошибка загрузки задач: {e}")
-                self.tasks = []
-        else:
-            self.tasks = []
+        self._load_items()
 
     def save_tasks(self):
-        try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump([task.to_dict() for task in self.tasks], f, ensure_ascii=False, indent=4)
-        except IOError as e:
-            print(f"Ошибка сохранения задач: {e}")
+        self._save_items()
 
     def add_task(self, title, description, priority, due_date):
         try:
@@ -234,46 +2771,134 @@ class TaskManager:
                 raise ValueError(f"Приоритет должен быть одним из: {', '.join(self.PRIORITIES)}.")
             if due_date and not parse_date(due_date):
                 raise ValueError("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
-            new_id = max([task.id for task in self.tasks], default=0) + 1
+            new_id = self._new_id()
             new_task = Task(id=new_id, title=title, description=description,
                             priority=priority, due_date=due_date)
-            self.tasks.append(new_task)
-            self.save_tasks()
+            self._add(new_task)
+            self._persist('put', new_task)
             print("Задача успешно добавлена.")
+            return new_task
         except ValueError as ve:
             print(f"Ошибка: {ve}")
 
-    def list_tasks(self, filter_by=None):
-        filtered_tasks = self.tasks
-        if filter_by:
-            key, value = filter_by
-            if key == 'status':
-                filtered_tasks = [task for task in self.tasks if task.done == value]
-            elif key == 'priority':
-                filtered_tasks = [task for task in self.tasks if task.priority == value]
-            elif key == 'due_date':
-                filtered_tasks = [task for task in self.tasks if task.due_date == value]
-        if not filtered_tasks:
-            print("Задач нет.")
+    def _matching_ids(self, key, value):
+        if key == 'status':
+            return self._by_status[bool(value)]
+        if key == 'priority':
+            return self._by_priority.get(value, set())
+        ordinal = date_to_ordinal(value)
+        if ordinal is None:
+            return set()
+        if key == 'due_date':
+            return set(self._due_index.range(ordinal, ordinal))
+        if key == 'due_from':
+            return set(self._due_index.range(ordinal, datetime.max.toordinal()))
+        return set(self._due_index.range(1, ordinal))
+
+    # filter_by - одно условие (ключ, значение) или список условий, объединяемых через AND
+    def _filter_tasks(self, filter_by):
+        if not filter_by:
+            return list(self.tasks)
+        if self.storage.lazy:
+            return self._select(self._filter_conditions(filter_by))
+        conditions = self._filter_list(filter_by)
+        # Пересечение начинается с самого маленького множества
+        matches = sorted((self._matching_ids(key, value) for key, value in conditions), key=len)
+        ids = matches[0].intersection(*matches[1:])
+        return [self._items[task_id] for task_id in sorted(ids)]
+
+    def _filter_items(self, filter_by):
+        return self._filter_tasks(filter_by)
+
+    def _filter_list(self, filter_by):
+        conditions = [filter_by] if isinstance(filter_by, tuple) else list(filter_by)
+        unknown = [key for key, _ in conditions if key not in self.FILTER_COLUMNS]
+        if unknown:
+            raise ValueError(f"Неизвестный критерий фильтрации: {unknown[0]}")
+        return conditions
+
+    # Фильтр в условиях хранилища: (колонка, операция, значение)
+    def _filter_conditions(self, filter_by):
+        return [(self.FILTER_COLUMNS[key][0], self.FILTER_COLUMNS[key][1],
+                 value if key in ('status', 'priority') else date_to_ordinal(value))
+                for key, value in self._filter_list(filter_by)]
+
+    # Невыполненные задачи со сроком в порядке срока; before - порядковый номер дня, до которого смотреть
+    def _due_tasks(self, limit=None, before=None):
+        if self.storage.lazy:
+            conditions = [('done', '=', False), ('due_ord', '>', 0)]
+            if before is not None:
+                conditions.append(('due_ord', '<', before))
+            return self._select(conditions, order_by='due_ord, id', limit=limit)
+        found = []
+        seen = set()
+        while self._due_heap and (limit is None or len(found) < limit):
+            ordinal, task_id = self._due_heap[0]
+            if before is not None and ordinal >= before:
+                break
+            heapq.heappop(self._due_heap)
+            if task_id in seen or not self._is_pending(task_id, ordinal):
+                continue
+            seen.add(task_id)
+            found.append((ordinal, task_id))
+        for entry in found:
+            heapq.heappush(self._due_heap, entry)
+        return [self._items[task_id] for _, task_id in found]
+
+    def overdue_tasks(self, today=None):
+        today = (today or datetime.now()).toordinal()
+        return self._due_tasks(before=today)
+
+    def next_due_tasks(self, count=5, today=None):
+        today = (today or datetime.now()).toordinal()
+        overdue = len(self._due_tasks(before=today))
+        return self._due_tasks(limit=overdue + count)[overdue:]
+
+    def _keys_after(self, sort, cursor, limit):
+        if sort == 'due':
+            return self._due_index.after(cursor, limit)
+        return super()._keys_after(sort, cursor, limit)
+
+    def _print_tasks(self, tasks, header=()):
+        render_lines(list(header) + [
+            f"ID: {task.id}, Заголовок: {task.title}, Статус: {'Выполнено' if task.done else 'В процессе'},"
+            f" Приоритет: {task.priority}, Срок: {task.due_date}" for task in tasks])
+
+    # Одна страница списка (с фильтром - из отобранных задач); возвращает курсор следующей страницы
+    def list_tasks(self, filter_by=None, cursor=None, limit=None, sort='id'):
+        page = self.filtered_page(filter_by, cursor, limit, sort)
+        if not page.items:
+            print("Задач нет." if cursor is None else "Больше задач нет.")
+            return None
+        self._print_tasks(page.items, ["\nСписок задач:"] if cursor is None else [])
+        return page.cursor
+
+    def show_due_tasks(self, count=5):
+        overdue = self.overdue_tasks()
+        upcoming = self.next_due_tasks(count)
+        if not overdue and not upcoming:
+            print("Задач со сроком нет.")
             return
-        print("\nСписок задач:")
-        for task in filtered_tasks:
-            status = "Выполнено" if task.done else "В процессе"
-            print(
-                f"ID: {task.id}, Заголовок: {task.title}, Статус: {status}, Приоритет: {task.priority},"
-                f" Срок: {task.due_date}")
+        if overdue:
+            self._print_tasks(overdue, [f"\nПросроченные задачи ({len(overdue)}):"])
+        if upcoming:
+            self._print_tasks(upcoming, ["\nБлижайшие задачи:"])
 
     def mark_task_done(self, task_id):
-        task = self.get_task_by_id(task_id)
+        task = self._get_for_update(task_id)
         if task:
             task.done = True
-            self.save_tasks()
+            self._reindex(task)
+            if not self._persist('put', task):
+                return None
             print("Задача отмечена как выполненная.")
+            return task
         else:
             print("Задача не найдена.")
 
-    def edit_task(self, task_id, title, description, priority, due_date):
-        task = self.get_task_by_id(task_id)
+    # done=None - статус не меняется
+    def edit_task(self, task_id, title, description, priority, due_date, done=None):
+        task = self._get_for_update(task_id)
         if task:
             try:
                 if not title.strip():
@@ -284,56 +2909,56 @@ class TaskManager:
                     raise ValueError("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
                 task.title = title
                 task.description = description
-                task.priority = priority
-                task.due_date = due_date
-                self.save_tasks()
+                task.priority = intern_text(priority)
+                task.set_due_date(due_date)
+                if done is not None:
+                    task.done = bool(done)
+                self._reindex(task)
+                if not self._persist('put', task):
+                    return None
                 print("Задача успешно обновлена.")
+                return task
             except ValueError as ve:
                 print(f"Ошибка: {ve}")
         else:
             print("Задача не найдена.")
 
     def delete_task(self, task_id):
-        task = self.get_task_by_id(task_id)
+        task = self._get_for_update(task_id)
         if task:
-            self.tasks.remove(task)
-            self.save_tasks()
+            self._remove(task)
+            if not self._persist('delete', task):
+                return None
             print("Задача успешно удалена.")
+            return task
         else:
             print("Задача не найдена.")
 
     def get_task_by_id(self, task_id):
-        for task in self.tasks:
-            if task.id == task_id:
-                return task
-        return None
+        return self._get(task_id)
 
-    def import_tasks_csv(self, csv_filepath):
-        try:
-            with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    title = row.get('title', '').strip()
-                    description = row.get('description', '').strip()
-                    priority = row.get('priority', 'Средний').strip()
-                    due_date = row.get('due_date', '').strip()
-                    done = row.get('done', 'False').strip().lower() == 'true'
-                    if not title:
-                        print("Пропуск задачи без заголовка.")
-                        continue
-                    if priority not in self.PRIORITIES:
-                        priority = 'Средний'
-                    if due_date and not parse_date(due_date):
-                        due_date = None
-                    new_id = max([task.id for task in self.tasks], default=0) + 1
-                    new_task = Task(id=new_id, title=title, description=description,
-                                    priority=priority, due_date=due_date)
-                    new_task.done = done
-                    self.tasks.append(new_task)
-            self.save_tasks()
-            print("Импорт задач завершен успешно.")
-        except (IOError, csv.Error) as e:
-            print(f"Ошибка импорта задач: {e}")
+    def _parse_import_row(self, row):
+        title = (row.get('title') or '').strip()
+        if not title:
+            raise ValueError("задача без заголовка")
+        priority = (row.get('priority') or '').strip()
+        if priority not in self.PRIORITIES:
+            priority = 'Средний'
+        due_date = (row.get('due_date') or '').strip()
+        if due_date and not date_to_ordinal(due_date):
+            due_date = None
+        return {
+            "title": title,
+            "description": (row.get('description') or '').strip(),
+            "done": (row.get('done') or '').strip().lower() == 'true',
+            "priority": priority,
+            "due_date": due_date
+        }
+
+    def import_tasks_csv(self, csv_filepath, chunk_size=None, checkpoint=None, progress=None):
+        result = self._import_csv(csv_filepath, chunk_size, checkpoint, progress)
+        self._report_import(result)
+        return result
 
     def export_tasks_csv(self, csv_filepath):
         try:
@@ -344,29 +2969,50 @@ class TaskManager:
                 for task in self.tasks:
                     writer.writerow(task.to_dict())
             print("Экспорт задач завершен успешно.")
+            return True
         except IOError as e:
             print(f"Ошибка экспорта задач: {e}")
+            return False
 
-    def filter_tasks(self, key, value):
+    def filter_tasks(self, key, value, cursor=None):
         if key == 'status':
             done = True if value.lower() in ['выполнено', 'done', 'true', '1'] else False
-            self.list_tasks(filter_by=('status', done))
+            return self.list_tasks(filter_by=('status', done), cursor=cursor)
         elif key == 'priority':
             if value not in self.PRIORITIES:
                 print(f"Неверный приоритет. Доступные: {', '.join(self.PRIORITIES)}.")
-                return
-            self.list_tasks(filter_by=('priority', value))
+                return None
+            return self.list_tasks(filter_by=('priority', value), cursor=cursor)
         elif key == 'due_date':
             if not parse_date(value):
                 print("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
-                return
-            self.list_tasks(filter_by=('due_date', value))
+                return None
+            return self.list_tasks(filter_by=('due_date', value), cursor=cursor)
         else:
             print("Неверный критерий фильтрации.")
 
+    # Несколько условий сразу; пустое значение означает, что условие не задано
+    def filter_tasks_combined(self, status='', priority='', due_by='', cursor=None):
+        conditions = []
+        if status:
+            conditions.append(('status', status.lower() in ['выполнено', 'done', 'true', '1']))
+        if priority:
+            if priority not in self.PRIORITIES:
+                print(f"Неверный приоритет. Доступные: {', '.join(self.PRIORITIES)}.")
+                return None
+            conditions.append(('priority', priority))
+        if due_by:
+            if not parse_date(due_by):
+                print("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
+                return None
+            conditions.append(('due_by', due_by))
+        return self.list_tasks(filter_by=conditions, cursor=cursor)
+
 
 # Модель Контакта
-class Contact:
+class Contact(Record):
+    __slots__ = fields = ('id', 'name', 'phone', 'email')
+
     def __init__(self, id, name, phone, email):
         self.id = id
         self.name = name
@@ -392,30 +3038,42 @@ class Contact:
 
 
 # Менеджер Контактов
-class ContactManager:
-    def __init__(self, filepath='contacts.json'):
-        self.filepath = filepath
-        self.contacts = []
+class ContactManager(BaseManager):
+    model = Contact
+    entity_name = 'контактов'
+    sql_table = 'contacts'
+    sql_columns = {
+        'name_key': lambda data: data['name'].lower(),
+        'phone_digits': lambda data: normalize_phone(data['phone'] or ''),
+        'email_key': lambda data: (data['email'] or '').lower()
+    }
+    # Поле поиска -> колонка SQLite с тем же нормализованным значением, что и в ContactIndex
+    SEARCH_COLUMNS = {'name': 'name_key', 'phone': 'phone_digits', 'email': 'email_key'}
+
+    def __init__(self, filepath='contacts.json', storage=None):
+        self._search_index = ContactIndex()
+        super().__init__(filepath, storage)
         self.load_contacts()
 
+    def _index_item(self, contact):
+        self._search_index.add(contact)
+
+    def _unindex_item(self, contact):
+        self._search_index.remove(contact.id)
+
+    def _rebuild_indexes(self):
+        self._search_index = ContactIndex()
+        super()._rebuild_indexes()
+
+    @property
+    def contacts(self):
+        return self._all_items()
+
     def load_contacts(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    contacts_data = json.load(f)
-                    self.contacts = [Contact.from_dict(contact) for contact in contacts_data]
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Ошибка загрузки контактов: {e}")
-                self.contacts = []
-        else:
-            self.contacts = []
+        self._load_items()
 
     def save_contacts(self):
-        try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump([contact.to_dict() for contact in self.contacts], f, ensure_ascii=False, indent=4)
-        except IOError as e:
-            print(f"Ошибка сохранения контактов: {e}")
+        self._save_items()
 
     def add_contact(self, name, phone, email):
         try:
@@ -425,26 +3083,38 @@ class ContactManager:
                 raise ValueError("Номер телефона должен содержать только цифры.")
             if email and "@" not in email:
                 raise ValueError("Неверный формат электронной почты.")
-            new_id = max([contact.id for contact in self.contacts], default=0) + 1
+            new_id = self._new_id()
             new_contact = Contact(id=new_id, name=name, phone=phone, email=email)
-            self.contacts.append(new_contact)
-            self.save_contacts()
+            self._add(new_contact)
+            self._persist('put', new_contact)
             print("Контакт успешно добавлен.")
+            return new_contact
         except ValueError as ve:
             print(f"Ошибка: {ve}")
 
+    def _search_contacts(self, keyword):
+        if self.storage.lazy:
+            terms = contact_search_terms(keyword)
+            if terms is None:
+                return list(self.contacts)
+            return self._select([[(self.SEARCH_COLUMNS[field], 'contains', needle) for field, needle in terms]])
+        found = self._search_index.search(keyword)
+        if found is None:
+            return list(self.contacts)
+        return [self._items[contact_id] for contact_id in sorted(found)]
+
     def search_contacts(self, keyword):
-        results = [contact for contact in self.contacts if
-                   keyword.lower() in contact.name.lower() or keyword in contact.phone]
+        results = self._search_contacts(keyword)
         if not results:
             print("Контакты не найдены.")
-            return
+            return results
         print("\nРезультаты поиска:")
         for contact in results:
             print(f"ID: {contact.id}, Имя: {contact.name}, Телефон: {contact.phone}, Email: {contact.email}")
+        return results
 
     def edit_contact(self, contact_id, name, phone, email):
-        contact = self.get_contact_by_id(contact_id)
+        contact = self._get_for_update(contact_id)
         if contact:
             try:
                 if not name.strip():
@@ -456,52 +3126,46 @@ class ContactManager:
                 contact.name = name
                 contact.phone = phone
                 contact.email = email
-                self.save_contacts()
+                self._reindex(contact)
+                if not self._persist('put', contact):
+                    return None
                 print("Контакт успешно обновлен.")
+                return contact
             except ValueError as ve:
                 print(f"Ошибка: {ve}")
         else:
             print("Контакт не найден.")
 
     def delete_contact(self, contact_id):
-        contact = self.get_contact_by_id(contact_id)
+        contact = self._get_for_update(contact_id)
         if contact:
-            self.contacts.remove(contact)
-            self.save_contacts()
+            self._remove(contact)
+            if not self._persist('delete', contact):
+                return None
             print("Контакт успешно удален.")
+            return contact
         else:
             print("Контакт не найден.")
 
     def get_contact_by_id(self, contact_id):
-        for contact in self.contacts:
-            if contact.id == contact_id:
-                return contact
-        return None
+        return self._get(contact_id)
 
-    def import_contacts_csv(self, csv_filepath):
-        try:
-            with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    name = row.get('name', '').strip()
-                    phone = row.get('phone', '').strip()
-                    email = row.get('email', '').strip()
-                    if not name:
-                        print("Пропуск контакта без имени.")
-                        continue
-                    if phone and not phone.isdigit():
-                        print(f"Пропуск контакта с неверным телефоном: {phone}")
-                        continue
-                    if email and "@" not in email:
-                        print(f"Пропуск контакта с неверным email: {email}")
-                        continue
-                    new_id = max([contact.id for contact in self.contacts], default=0) + 1
-                    new_contact = Contact(id=new_id, name=name, phone=phone, email=email)
-                    self.contacts.append(new_contact)
-            self.save_contacts()
-            print("Импорт контактов завершен успешно.")
-        except (IOError, csv.Error) as e:
-            print(f"Ошибка импорта контактов: {e}")
+    def _parse_import_row(self, row):
+        name = (row.get('name') or '').strip()
+        phone = (row.get('phone') or '').strip()
+        email = (row.get('email') or '').strip()
+        if not name:
+            raise ValueError("контакт без имени")
+        if phone and not phone.isdigit():
+            raise ValueError("неверный телефон")
+        if email and "@" not in email:
+            raise ValueError("неверный email")
+        return {"name": name, "phone": phone, "email": email}
+
+    def import_contacts_csv(self, csv_filepath, chunk_size=None, checkpoint=None, progress=None):
+        result = self._import_csv(csv_filepath, chunk_size, checkpoint, progress)
+        self._report_import(result)
+        return result
 
     def export_contacts_csv(self, csv_filepath):
         try:
@@ -512,17 +3176,23 @@ class ContactManager:
                 for contact in self.contacts:
                     writer.writerow(contact.to_dict())
             print("Экспорт контактов завершен успешно.")
+            return True
         except IOError as e:
             print(f"Ошибка экспорта контактов: {e}")
+            return False
 
 
 # Модель Финансовой Записи
-class FinanceRecord:
-    def __init__(self, id, amount, category, date, description):
+class FinanceRecord(Record):
+    fields = ('id', 'amount', 'category', 'date', 'description')
+    __slots__ = fields + ('date_ord',)
+
+    def __init__(self, id, amount, category, date, description, date_ord=None):
         self.id = id
         self.amount = amount
-        self.category = category
-        self.date = date
+        self.category = intern_text(category)
+        self.date = intern_text(date)
+        self.date_ord = date_ord or date_to_ordinal(date)
         self.description = description
 
     def to_dict(self):
@@ -545,31 +3215,99 @@ class FinanceRecord:
         )
 
 
-# Менеджер Финансовых Записей
-class FinanceManager:
-    def __init__(self, filepath='finance.json'):
-        self.filepath = filepath
-        self.records = []
-        self.load_records()
+# Менеджер Финансовых Записей
+class FinanceManager(BaseManager):
+    model = FinanceRecord
+    entity_name = 'финансовых записей'
+    sql_table = 'finance'
+    sql_columns = {
+        'date_ord': lambda data: date_to_ordinal(data['date']),
+        'category_key': lambda data: data['category'].lower(),
+        'amount': operator.itemgetter('amount')
+    }
+    SORT_KEYS = dict(BaseManager.SORT_KEYS, date=('date_ord', lambda record: (record.date_ord, record.id)))
+
+    # columnar=True хранит записи в FinanceColumns вместо объектов (не действует в ленивом режиме)
+    def __init__(self, filepath='finance.json', storage=None, columnar=False):
+        self._date_index = DateIndex()
+        self._aggregates = FinanceAggregates()
+        super().__init__(filepath, storage)
+        self.columnar = columnar and not self.storage.lazy
+        self.load_records()
+
+    def _new_container(self):
+        return FinanceColumns() if self.columnar else {}
+
+    # В колоночном режиме диапазоны дат считаются по массиву дат, отдельный индекс не нужен
+    def _index_item(self, record):
+        if not self.columnar:
+            self._date_index.add(record.date_ord, record.id)
+
+    def _unindex_item(self, record):
+        if not self.columnar:
+            self._date_index.remove(record.date_ord, record.id)
+
+    def _rebuild_indexes(self):
+        if not self.columnar:
+            self._date_index.build((record.date_ord, record.id) for record in self._items.values())
+        if not self.storage.lazy:
+            self._aggregates = self._compute_aggregates()
+
+    def _merge_indexes(self):
+        self._date_index.merge()
+
+    # Итоги ведутся во всех режимах хранения, в том числе ленивом, где записей нет в памяти
+    def _add(self, record):
+        with self._flush_lock:
+            super()._add(record)
+            self._aggregates.apply(record)
+
+    def _remove(self, record):
+        with self._flush_lock:
+            super()._remove(record)
+            self._aggregates.apply(record, -1)
 
-    def load_records(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    records_data = json.load(f)
-                    self.records = [FinanceRecord.from_dict(record) for record in records_data]
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Ошибка загрузки финансовых записей: {e}")
-                self.records = []
+    def _compute_aggregates(self):
+        aggregates = FinanceAggregates()
+        if self.columnar:
+            for amount, category, date in self._items.rows():
+                aggregates.add(amount, category, date)
+            return aggregates
+        for record in self.records:
+            aggregates.apply(record)
+        return aggregates
+
+    # В ленивом режиме итоги читаются из служебных данных, иначе пересчитываются при загрузке
+    def _apply_meta(self, meta):
+        super()._apply_meta(meta)
+        if not self.storage.lazy:
+            return
+        if 'aggregates' in meta:
+            self._aggregates = FinanceAggregates.from_dict(meta['aggregates'])
         else:
-            self.records = []
+            self._aggregates = self._compute_aggregates()
+            self._save_items()
+
+    def _meta(self):
+        meta = super()._meta()
+        meta['aggregates'] = self._aggregates.to_dict()
+        return meta
+
+    # Итоги в служебных данных SQLite после слияния с чужими изменениями пересчитываются по базе
+    def _after_merge(self):
+        if self.storage.lazy:
+            self._aggregates = self._compute_aggregates()
+            self._save_items()
+
+    @property
+    def records(self):
+        return self._all_items()
+
+    def load_records(self):
+        self._load_items()
 
     def save_records(self):
-        try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump([record.to_dict() for record in self.records], f, ensure_ascii=False, indent=4)
-        except IOError as e:
-            print(f"Ошибка сохранения финансовых записей: {e}")
+        self._save_items()
 
     def add_record(self, amount, category, date, description):
         try:
@@ -580,31 +3318,139 @@ class FinanceManager:
                 raise ValueError("Категория операции не может быть пустой.")
             if not parse_date(date):
                 raise ValueError("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
-            new_id = max([record.id for record in self.records], default=0) + 1
+            new_id = self._new_id()
             new_record = FinanceRecord(id=new_id, amount=amount, category=category, date=date, description=description)
-            self.records.append(new_record)
-            self.save_records()
+            self._add(new_record)
+            self._persist('put', new_record)
             print("Финансовая запись успешно добавлена.")
+            return new_record
         except ValueError as ve:
             print(f"Ошибка: {ve}")
 
-    def list_records(self, filter_by=None):
-        filtered_records = self.records
-        if filter_by:
-            key, value = filter_by
-            if key == 'date':
-                filtered_records = [record for record in self.records if record.date == value]
-            elif key == 'category':
-                filtered_records = [record for record in self.records if record.category.lower() == value.lower()]
-        if not filtered_records:
-            print("Финансовых записей нет.")
-            return
-        print("\nСписок финансовых записей:")
-        for record in filtered_records:
-            type_op = "Доход" if record.amount > 0 else "Расход"
-            print(
-                f"ID: {record.id}, Тип: {type_op}, Сумма: {record.amount}, Категория: {record.category},"
-                f" Дата: {record.date}, Описание: {record.description}")
+    def _filter_records(self, filter_by):
+        if not filter_by:
+            return list(self.records)
+        if self.storage.lazy:
+            return self._select(self._filter_conditions(filter_by))
+        key, value = filter_by
+        if key == 'date':
+            ordinal = date_to_ordinal(value)
+            if ordinal is None:
+                return []
+            if self.columnar:
+                return self._items.records_between(ordinal, ordinal)
+            return [self._items[record_id] for record_id in self._date_index.range(ordinal, ordinal)]
+        elif key == 'category':
+            return [record for record in self.records if record.category.lower() == value.lower()]
+        return list(self.records)
+
+    def _filter_items(self, filter_by):
+        return self._filter_records(filter_by)
+
+    # Фильтр в условиях хранилища; неизвестный ключ не фильтрует
+    def _filter_conditions(self, filter_by):
+        key, value = filter_by
+        if key == 'date':
+            return [('date_ord', '=', date_to_ordinal(value))]
+        if key == 'category':
+            return [('category_key', '=', value.lower())]
+        return []
+
+    # Полные месяцы диапазона берутся из помесячных сводок, неполные края - из записей
+    def _report_totals(self, start, end):
+        total_income = 0
+        total_expense = 0
+        categories = {}
+        first_full = start if start.day == 1 else next_month(start)
+        after_full = next_month(end) if (end + timedelta(days=1)).day == 1 else datetime(end.year, end.month, 1)
+        if first_full < after_full:
+            parts = [self._summarize_between(start, first_full - timedelta(days=1)),
+                     self._summarize_between(after_full, end)]
+            month = first_full
+            while month < after_full:
+                rollup = self._aggregates.months.get(f"{month.year:04d}-{month.month:02d}", {})
+                for category, (income, expense, _) in rollup.items():
+                    total_income += income
+                    total_expense += expense
+                    categories[category] = categories.get(category, 0) + income + expense
+                month = next_month(month)
+        else:
+            parts = [self._summarize_between(start, end)]
+        for income, expense, part_categories in parts:
+            total_income += income
+            total_expense += expense
+            for category, amount in part_categories.items():
+                categories[category] = categories.get(category, 0) + amount
+        return total_income, total_expense, categories
+
+    def _summarize_between(self, start, end):
+        if start > end:
+            return 0, 0, {}
+        if self.columnar:
+            return self._items.summarize(start.toordinal(), end.toordinal())
+        income = 0
+        expense = 0
+        categories = {}
+        for record in self._records_between(start, end):
+            if record.amount > 0:
+                income += record.amount
+            else:
+                expense += record.amount
+            categories[record.category] = categories.get(record.category, 0) + record.amount
+        return income, expense, categories
+
+    def _records_between(self, start, end):
+        if start > end:
+            return []
+        if self.storage.lazy:
+            return self._select([('date_ord', '>=', start.toordinal()), ('date_ord', '<=', end.toordinal())],
+                                order_by='date_ord')
+        if self.columnar:
+            return self._items.records_between(start.toordinal(), end.toordinal())
+        return [self._items[record_id] for record_id in self._date_index.range(start.toordinal(), end.toordinal())]
+
+    def _top_expenses(self, count, start, end):
+        if self.columnar:
+            return self._items.top_expenses(count, start.toordinal(), end.toordinal())
+        if self.storage.lazy:
+            return self._select([('amount', '<', 0), ('date_ord', '>=', start.toordinal()),
+                                 ('date_ord', '<=', end.toordinal())], order_by='amount', limit=count)
+        return heapq.nsmallest(count, (record for record in self._records_between(start, end) if record.amount < 0),
+                               key=operator.attrgetter('amount'))
+
+    def _keys_after(self, sort, cursor, limit):
+        if sort != 'date':
+            return super()._keys_after(sort, cursor, limit)
+        if self.columnar:
+            return self._items.keys_after(cursor, limit)
+        return self._date_index.after(cursor, limit)
+
+    # Одна страница списка (с фильтром - из отобранных записей); возвращает курсор следующей страницы
+    def list_records(self, filter_by=None, cursor=None, limit=None, sort='id'):
+        page = self.filtered_page(filter_by, cursor, limit, sort)
+        if not page.items:
+            print("Финансовых записей нет." if cursor is None else "Больше финансовых записей нет.")
+            return None
+        header = ["\nСписок финансовых записей:"] if cursor is None else []
+        render_lines(header + [
+            f"ID: {record.id}, Тип: {'Доход' if record.amount > 0 else 'Расход'}, Сумма: {record.amount},"
+            f" Категория: {record.category}, Дата: {record.date}, Описание: {record.description}"
+            for record in page.items])
+        return page.cursor
+
+    def get_record_by_id(self, record_id):
+        return self._get(record_id)
+
+    def delete_record(self, record_id):
+        record = self._get_for_update(record_id)
+        if record:
+            self._remove(record)
+            if not self._persist('delete', record):
+                return None
+            print("Финансовая запись успешно удалена.")
+            return record
+        else:
+            print("Финансовая запись не найдена.")
 
     def generate_report(self, start_date, end_date):
         try:
@@ -614,20 +3460,13 @@ class FinanceManager:
                 raise ValueError("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
             if start > end:
                 raise ValueError("Начальная дата не может быть позже конечной.")
-            relevant_records = [record for record in self.records if
-                                start.strftime("%d-%m-%Y") <= record.date <= end.strftime("%d-%m-%Y")]
-            total_income = sum(record.amount for record in relevant_records if record.amount > 0)
-            total_expense = sum(record.amount for record in relevant_records if record.amount < 0)
+            total_income, total_expense, categories = self._report_totals(start, end)
             balance = total_income + total_expense
             print(f"\nОтчёт с {start_date} по {end_date}:")
             print(f"Общий доход: {total_income}")
             print(f"Общий расход: {total_expense}")
             print(f"Баланс: {balance}")
 
-            categories = {}
-            for record in relevant_records:
-                cat = record.category
-                categories[cat] = categories.get(cat, 0) + record.amount
             print("\nГруппировка по категориям:")
             for cat, amt in categories.items():
                 type_op = "Доход" if amt > 0 else "Расход"
@@ -635,41 +3474,71 @@ class FinanceManager:
         except ValueError as ve:
             print(f"Ошибка: {ve}")
 
+    def top_expenses(self, count=10, start_date=None, end_date=None):
+        try:
+            start = parse_date(start_date) if start_date else datetime.min
+            end = parse_date(end_date) if end_date else datetime.max
+            if not start or not end:
+                raise ValueError("Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
+            if count <= 0:
+                raise ValueError("Количество записей должно быть положительным.")
+            records = self._top_expenses(count, start, end)
+            if not records:
+                print("Расходов нет.")
+                return records
+            print(f"\nКрупнейшие расходы (до {count}):")
+            for record in records:
+                print(f"ID: {record.id}, Сумма: {record.amount}, Категория: {record.category},"
+                      f" Дата: {record.date}, Описание: {record.description}")
+            return records
+        except ValueError as ve:
+            print(f"Ошибка: {ve}")
+            return []
+
     def get_balance(self):
-        balance = sum(record.amount for record in self.records)
+        balance = self._aggregates.balance()
         print(f"\nОбщий баланс: {balance}")
 
-    def import_records_csv(self, csv_filepath):
-        try:
-            with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    amount = row.get('amount', '').strip()
-                    category = row.get('category', '').strip()
-                    date = row.get('date', '').strip()
-                    description = row.get('description', '').strip()
-                    if not amount:
-                        print("Пропуск записи без суммы.")
-                        continue
-                    try:
-                        amount = float(amount)
-                        if not category:
-                            print("Пропуск записи без категории.")
-                            continue
-                        if not parse_date(date):
-                            print(f"Пропуск записи с неверной датой: {date}")
-                            continue
-                        new_id = max([record.id for record in self.records], default=0) + 1
-                        new_record = FinanceRecord(id=new_id, amount=amount, category=category, date=date,
-                                                   description=description)
-                        self.records.append(new_record)
-                    except ValueError:
-                        print(f"Пропуск записи с неверной суммой: {amount}")
-                        continue
+    # Пересчёт итогов с нуля и сверка с нарастающими; при расхождении итоги заменяются пересчитанными
+    def check_aggregates(self):
+        rebuilt = self._compute_aggregates()
+        differences = self._aggregates.diff(rebuilt)
+        self._aggregates = rebuilt
+        if differences:
+            print("Найдены расхождения в итогах:")
+            for difference in differences:
+                print(difference)
             self.save_records()
-            print("Импорт финансовых записей завершен успешно.")
-        except (IOError, csv.Error) as e:
-            print(f"Ошибка импорта финансовых записей: {e}")
+            print("Итоги пересчитаны и сохранены.")
+        else:
+            print("Итоги согласованы с записями.")
+        return not differences
+
+    def _parse_import_row(self, row):
+        amount = (row.get('amount') or '').strip()
+        category = (row.get('category') or '').strip()
+        date = (row.get('date') or '').strip()
+        if not amount:
+            raise ValueError("запись без суммы")
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise ValueError("неверная сумма")
+        if not category:
+            raise ValueError("запись без категории")
+        if not date_to_ordinal(date):
+            raise ValueError("неверная дата")
+        return {
+            "amount": amount,
+            "category": category,
+            "date": date,
+            "description": (row.get('description') or '').strip()
+        }
+
+    def import_records_csv(self, csv_filepath, chunk_size=None, checkpoint=None, progress=None):
+        result = self._import_csv(csv_filepath, chunk_size, checkpoint, progress)
+        self._report_import(result)
+        return result
 
     def export_records_csv(self, csv_filepath):
         try:
@@ -680,17 +3549,466 @@ class FinanceManager:
                 for record in self.records:
                     writer.writerow(record.to_dict())
             print("Экспорт финансовых записей завершен успешно.")
+            return True
         except IOError as e:
             print(f"Ошибка экспорта финансовых записей: {e}")
+            return False
+
+
+# Вычислитель калькулятора: выражение разбирается один раз в дерево, константные части сворачиваются,
+# а результат компилируется в список операций для стековой машины
+CALC_TOKEN_PATTERN = re.compile(r'\s*(?:(\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)'
+                                r'|([^\W\d]\w*)|(\*\*|[-+*/%()])|(\S))')
+CALC_CONST, CALC_LOAD, CALC_UNARY, CALC_BINARY = range(4)
+
+
+def calc_power(base, exponent):
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ValueError("Дробная степень отрицательного числа не определена.")
+    return result
+
+
+CALC_BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '**': calc_power
+}
+CALC_UNARY_OPERATORS = {'-': operator.neg, '+': operator.pos}
+
+
+# Весь текст разбирается одним проходом; любой другой непробельный символ - ошибка
+def tokenize_expression(text):
+    tokens = []
+    for number, name, symbol, invalid in CALC_TOKEN_PATTERN.findall(text):
+        if number:
+            tokens.append(('num', float(number)))
+        elif name:
+            tokens.append(('name', name))
+        elif symbol:
+            tokens.append(('op', symbol))
+        else:
+            raise ValueError(f"Недопустимый символ в выражении: {invalid}")
+    if not tokens:
+        raise ValueError("Пустое выражение.")
+    return tokens
+
+
+# Разбор с приоритетами: +- < */% < унарные +- < ** (правоассоциативная, -2**2 = -4).
+# Список токенов заканчивается меткой (None, None), чтобы не проверять выход за границу
+class ExpressionParser:
+    def __init__(self, tokens):
+        self.tokens = tokens + [(None, None)]
+        self.index = 0
+
+    def _peek(self):
+        return self.tokens[self.index]
+
+    def _take(self, *symbols):
+        kind, value = self.tokens[self.index]
+        if kind == 'op' and value in symbols:
+            self.index += 1
+            return value
+        return None
+
+    def parse(self):
+        node = self._expression()
+        kind, value = self._peek()
+        if kind is not None:
+            raise ValueError(f"Неожиданный токен: {value}")
+        return node
+
+    def _expression(self):
+        node = self._term()
+        while True:
+            symbol = self._take('+', '-')
+            if symbol is None:
+                return node
+            node = ('binary', symbol, node, self._term())
+
+    def _term(self):
+        node = self._unary()
+        while True:
+            symbol = self._take('*', '/', '%')
+            if symbol is None:
+                return node
+            node = ('binary', symbol, node, self._unary())
+
+    def _unary(self):
+        symbol = self._take('-', '+')
+        if symbol is not None:
+            return ('unary', symbol, self._unary())
+        return self._power()
+
+    def _power(self):
+        node = self._atom()
+        if self._take('**') is not None:
+            return ('binary', '**', node, self._unary())
+        return node
+
+    def _atom(self):
+        kind, value = self._peek()
+        if kind is None:
+            raise ValueError("Неожиданный конец выражения.")
+        self.index += 1
+        if kind == 'num':
+            return ('const', value)
+        if kind == 'name':
+            return ('load', value)
+        if value == '(':
+            node = self._expression()
+            if self._take(')') is None:
+                raise ValueError("Не хватает закрывающей скобки.")
+            return node
+        raise ValueError(f"Неожиданный токен: {value}")
+
+
+class CompiledExpression:
+    # Меньше строк вектором не считаем: подготовка столбцов numpy дороже построчного вычисления
+    VECTOR_MIN = 64
+
+    def __init__(self, text):
+        self.text = text
+        self.variables = []
+        self.program = []
+        # Разбор и свёртка рекурсивны: слишком глубокое дерево - ошибка выражения, а не падение программы
+        try:
+            self._emit(self._fold(ExpressionParser(tokenize_expression(text)).parse()))
+        except RecursionError:
+            raise ValueError("Выражение слишком глубоко вложено или слишком длинное.") from None
+
+    # Поддеревья без переменных вычисляются при компиляции; ошибку (например, деление на ноль)
+    # откладываем до вычисления, чтобы сообщение было тем же
+    def _fold(self, node):
+        if node[0] == 'unary':
+            operand = self._fold(node[2])
+            if operand[0] == 'const':
+                return ('const', CALC_UNARY_OPERATORS[node[1]](operand[1]))
+            return ('unary', node[1], operand)
+        if node[0] == 'binary':
+            left = self._fold(node[2])
+            right = self._fold(node[3])
+            if left[0] == 'const' and right[0] == 'const':
+                try:
+                    return ('const', CALC_BINARY_OPERATORS[node[1]](left[1], right[1]))
+                except (ArithmeticError, ValueError):
+                    pass
+            return ('binary', node[1], left, right)
+        return node
+
+    def _emit(self, node):
+        if node[0] == 'const':
+            self.program.append((CALC_CONST, node[1]))
+        elif node[0] == 'load':
+            if node[1] not in self.variables:
+                self.variables.append(node[1])
+            self.program.append((CALC_LOAD, node[1]))
+        elif node[0] == 'unary':
+            self._emit(node[2])
+            self.program.append((CALC_UNARY, CALC_UNARY_OPERATORS[node[1]]))
+        else:
+            self._emit(node[2])
+            self._emit(node[3])
+            self.program.append((CALC_BINARY, CALC_BINARY_OPERATORS[node[1]]))
+
+    def _run(self, variables):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for kind, argument in self.program:
+            if kind == CALC_CONST:
+                push(argument)
+            elif kind == CALC_LOAD:
+                push(variables[argument])
+            elif kind == CALC_UNARY:
+                push(argument(pop()))
+            else:
+                right = pop()
+                push(argument(pop(), right))
+        return stack[0]
+
+    def _bind(self, bindings):
+        missing = [name for name in self.variables if name not in bindings]
+        if missing:
+            raise ValueError(f"Не задано значение переменной: {missing[0]}")
+        try:
+            return {name: float(bindings[name]) for name in self.variables}
+        except (TypeError, ValueError):
+            raise ValueError("Значения переменных должны быть числами.")
+
+    def evaluate(self, bindings=None):
+        return self._run(self._bind(bindings or {}) if self.variables else {})
+
+    # Одно выражение для многих наборов значений переменных; с numpy считается столбцами сразу,
+    # а при любой ошибке - построчно, чтобы сообщение указывало на конкретный набор
+    def evaluate_many(self, bindings_list):
+        bindings_list = list(bindings_list)
+        if not self.variables:
+            return [self.evaluate()] * len(bindings_list)
+        if numpy is not None and len(bindings_list) >= self.VECTOR_MIN:
+            try:
+                columns = {name: numpy.array([bindings[name] for bindings in bindings_list], dtype=numpy.float64)
+                           for name in self.variables}
+                with numpy.errstate(all='raise'):
+                    return self._run(columns).tolist()
+            except (ArithmeticError, LookupError, TypeError, ValueError):
+                pass
+        return [self.evaluate(bindings) for bindings in bindings_list]
+
+
+# Скомпилированные выражения кэшируются: повторный расчёт той же формулы не разбирает её заново
+@functools.lru_cache(maxsize=1024)
+def compile_expression(text):
+    return CompiledExpression(text)
+
+
+# Пакетный калькулятор: одно выражение в строке, результат - в той же строке вывода.
+# Функция верхнего уровня, чтобы её можно было передать в пул процессов
+def evaluate_lines(lines, variables=None):
+    results = []
+    errors = 0
+    for line in lines:
+        text = line.strip()
+        if not text:
+            results.append('')
+            continue
+        try:
+            results.append(str(compile_expression(text).evaluate(variables)))
+        except (ArithmeticError, ValueError) as e:
+            results.append(f"Ошибка: {e}")
+            errors += 1
+        # Непредвиденная ошибка одной строки не должна останавливать обработку всего файла
+        except Exception as e:
+            results.append(f"Ошибка: {type(e).__name__}: {e}")
+            errors += 1
+    return results, errors
+
+
+# Выражения читаются и считаются порциями по chunk_size строк; в работе одновременно не больше
+# 2 * workers порций, поэтому память не зависит от размера файла, а вывод идёт в исходном порядке.
+# Статистика печатается в stderr, чтобы не смешиваться с результатами при выводе в stdout
+def run_batch_calculator(source, destination, workers=None, chunk_size=10000, variables=None):
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    total = 0
+    errors = 0
+    chunks = iter(lambda: list(itertools.islice(source, chunk_size)), [])
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            pending = None
+            results = (evaluate_lines(chunk, variables) for chunk in chunks)
+        else:
+            pending = collections.deque()
+            results = _ordered_results(executor, chunks, pending, 2 * workers, variables)
+        for lines, chunk_errors in results:
+            destination.write('\n'.join(lines) + '\n')
+            total += len(lines)
+            errors += chunk_errors
+    finally:
+        if executor is not None:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    print(f"Вычислено выражений: {total}, ошибок: {errors}, время: {elapsed:.2f} с, "
+          f"скорость: {total / elapsed if elapsed else 0:.0f} выражений/с, процессов: {workers}", file=sys.stderr)
+    return {"expressions": total, "errors": errors, "seconds": elapsed, "workers": workers}
+
+
+def _ordered_results(executor, chunks, pending, window, variables):
+    for chunk in chunks:
+        pending.append(executor.submit(evaluate_lines, chunk, variables))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Статистика кеша скомпилированных выражений; при включённых метриках compile_expression обёрнута
+def calculator_cache_info():
+    func = compile_expression
+    while not hasattr(func, 'cache_info'):
+        func = func.__wrapped__
+    return func.cache_info()
+
+
+# Измеряемые операции: имя метрики -> метод. Общие операции хранилища есть у всех менеджеров;
+# обёртка ставится на сам класс менеджера, поэтому вызовы через super() не считаются дважды
+INSTRUMENTED_STORAGE = {'load': '_load_items', 'refresh': 'refresh', 'write': '_write', 'save': '_save_items',
+                        'merge': '_write_merged', 'import': '_import_csv'}
+INSTRUMENTED_OPERATIONS = {
+    'notes': ('NoteManager', {'create': 'create_note', 'edit': 'edit_note', 'delete': 'delete_note',
+                              'search': '_search_notes', 'export': 'export_notes_csv'}),
+    'tasks': ('TaskManager', {'add': 'add_task', 'edit': 'edit_task', 'done': 'mark_task_done',
+                              'delete': 'delete_task', 'filter': '_filter_tasks', 'due': '_due_tasks',
+                              'export': 'export_tasks_csv'}),
+    'contacts': ('ContactManager', {'add': 'add_contact', 'edit': 'edit_contact', 'delete': 'delete_contact',
+                                    'search': '_search_contacts', 'export': 'export_contacts_csv'}),
+    'finance': ('FinanceManager', {'add': 'add_record', 'delete': 'delete_record', 'filter': '_filter_records',
+                                   'report': '_report_totals', 'top': '_top_expenses',
+                                   'export': 'export_records_csv'}),
+    'calc': (None, {'compile': 'compile_expression', 'lines': 'evaluate_lines'}),
+    'calc.expression': ('CompiledExpression', {'evaluate': 'evaluate', 'evaluate_many': 'evaluate_many'}),
+}
+
+
+# Включение метрик: методы из таблицы заменяются измеряющими обёртками (повторный вызов ничего не меняет)
+def enable_metrics():
+    if METRICS.enabled:
+        return
+    namespace = globals()
+    for prefix, (class_name, operations) in INSTRUMENTED_OPERATIONS.items():
+        owner = namespace[class_name] if class_name else None
+        if owner is not None and issubclass(owner, BaseManager):
+            operations = dict(INSTRUMENTED_STORAGE, **operations)
+        for operation, attribute in operations.items():
+            name = f"{prefix}.{operation}"
+            if owner is None:
+                namespace[attribute] = METRICS.timed(name, namespace[attribute])
+            else:
+                setattr(owner, attribute, METRICS.timed(name, getattr(owner, attribute)))
+    METRICS.reset()
+    METRICS.enabled = True
+
+
+# Вывод метрик в stdout, stderr или файл
+def write_metrics(output_format='json', destination='-'):
+    text = METRICS.render(output_format)
+    if destination in ('-', 'stdout'):
+        sys.stdout.write(text)
+    elif destination == 'stderr':
+        sys.stderr.write(text)
+    else:
+        atomic_write(destination, text.encode('utf-8'))
+
+
+# PA_METRICS / --metrics: "json" или "prometheus", через ":" - куда вывести при завершении
+# (по умолчанию stderr): PA_METRICS=prometheus:metrics.prom
+def parse_metrics_setting(value):
+    output_format, _, destination = (value or '').partition(':')
+    output_format = output_format or 'json'
+    if output_format not in Metrics.FORMATS:
+        raise ValueError(f"Неизвестный формат метрик: {output_format}. Форматы: {', '.join(Metrics.FORMATS)}.")
+    return output_format, destination or 'stderr'
+
+
+# Профилирование сеанса cProfile: статистика сохраняется при завершении в файл (для pstats/snakeviz),
+# самые затратные функции печатаются в stderr. Профилируется только основной поток
+def start_profiler(path, top=25):
+    profiler = cProfile.Profile()
+
+    def finish():
+        profiler.disable()
+        # pstats нужен только здесь: обычный запуск его не импортирует
+        import pstats
+        profiler.dump_stats(path)
+        print(f"Профиль сохранён в {path}", file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(top)
+
+    atexit.register(finish)
+    profiler.enable()
+    return profiler
 
 
 # Основное Приложение
+# Отложенная загрузка менеджеров: менеджер создаётся при первом обращении к нему
+# или заранее в пуле потоков, пока пользователь смотрит на меню
+class ManagerLoader:
+    def __init__(self, factories, prefetch=False, show_timings=False):
+        self.factories = factories
+        self.show_timings = show_timings
+        self.timings = {}
+        self._managers = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        if prefetch:
+            self._executor = ThreadPoolExecutor(max_workers=len(factories), thread_name_prefix='loader')
+            for name in factories:
+                self._futures[name] = self._executor.submit(self._load, name)
+
+    def _load(self, name):
+        started = time.perf_counter()
+        manager = self.factories[name]()
+        self.timings[name] = time.perf_counter() - started
+        if self.show_timings:
+            # Одной записью, чтобы строки из разных потоков не перемешивались
+            print(f"Загрузка {manager.entity_name}: {self.timings[name]:.3f} с\n", end='')
+        return manager
+
+    def get(self, name):
+        manager = self._managers.get(name)
+        if manager is None:
+            with self._lock:
+                if name not in self._managers:
+                    future = self._futures.get(name)
+                    self._managers[name] = future.result() if future else self._load(name)
+                manager = self._managers[name]
+        return manager
+
+    # Закрываются только загруженные менеджеры; фоновая загрузка сначала дожидается завершения
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            for name, future in self._futures.items():
+                if name not in self._managers and future.exception() is None:
+                    self._managers[name] = future.result()
+        for manager in self._managers.values():
+            manager.close()
+        self._managers = {}
+
+
 class PersonalAssistantApp:
-    def __init__(self):
-        self.note_manager = NoteManager()
-        self.task_manager = TaskManager()
-        self.contact_manager = ContactManager()
-        self.finance_manager = FinanceManager()
+    STORES = ('notes', 'tasks', 'contacts', 'finance')
+
+    def __init__(self, storage_mode='json', columnar_finance=False, prefetch=False, show_timings=False,
+                 codecs=None, write_behind=0, finance_partitions=None):
+        started = time.perf_counter()
+        codecs = codecs or {}
+        storages = {name: make_storage(f'{name}.json', storage_mode, codecs.get(name, 'json'))
+                    for name in self.STORES}
+        # Финансы по секциям за месяц или год - независимо от режима хранения остальных данных
+        if finance_partitions:
+            storages['finance'] = PartitionedStorage('finance.json', finance_partitions, codecs.get('finance', 'json'))
+        self.write_behind = write_behind
+        self._loader = ManagerLoader({
+            'notes': lambda: self._configure(NoteManager(storage=storages['notes'])),
+            'tasks': lambda: self._configure(TaskManager(storage=storages['tasks'])),
+            'contacts': lambda: self._configure(ContactManager(storage=storages['contacts'])),
+            'finance': lambda: self._configure(FinanceManager(storage=storages['finance'], columnar=columnar_finance)),
+        }, prefetch=prefetch, show_timings=show_timings)
+        if show_timings:
+            print(f"Запуск приложения: {time.perf_counter() - started:.3f} с")
+
+    # Данные могли измениться другим процессом: при каждом обращении сверяется только версия файлов
+    def _refreshed(self, manager):
+        manager.refresh()
+        return manager
+
+    def _configure(self, manager):
+        if self.write_behind:
+            manager.set_write_behind(self.write_behind)
+        return manager
+
+    @property
+    def note_manager(self):
+        return self._refreshed(self._loader.get('notes'))
+
+    @property
+    def task_manager(self):
+        return self._refreshed(self._loader.get('tasks'))
+
+    @property
+    def contact_manager(self):
+        return self._refreshed(self._loader.get('contacts'))
+
+    @property
+    def finance_manager(self):
+        return self._refreshed(self._loader.get('finance'))
 
     def run(self):
         while True:
@@ -707,11 +4025,23 @@ class PersonalAssistantApp:
             elif choice == '5':
                 self.run_calculator()
             elif choice == '6':
+                self.close()
                 print("Выход из приложения. До свидания!")
                 break
             else:
                 print("Неверный выбор. Пожалуйста, попробуйте снова.")
 
+    def close(self):
+        self._loader.close()
+
+    # Постраничный просмотр: show_page(cursor) печатает страницу и возвращает курсор следующей
+    def _show_pages(self, show_page):
+        cursor = show_page(None)
+        while cursor is not None:
+            if input("Enter - следующая страница, 0 - закончить просмотр: ").strip() == '0':
+                break
+            cursor = show_page(cursor)
+
     def show_main_menu(self):
         print("\nДобро пожаловать в Персональный помощник!")
         print("Выберите действие:")
@@ -733,14 +4063,15 @@ class PersonalAssistantApp:
             print("5. Удалить заметку")
             print("6. Импорт заметок из CSV")
             print("7. Экспорт заметок в CSV")
-            print("8. Вернуться в главное меню")
+            print("8. Поиск по заметкам")
+            print("9. Вернуться в главное меню")
             choice = input("Введите ваш выбор: ").strip()
             if choice == '1':
                 title = input("Введите заголовок заметки: ")
                 content = input("Введите содержимое заметки: ")
                 self.note_manager.create_note(title, content)
             elif choice == '2':
-                self.note_manager.list_notes()
+                self._show_pages(self.note_manager.list_notes)
             elif choice == '3':
                 try:
                     note_id = int(input("Введите ID заметки: "))
@@ -768,6 +4099,9 @@ class PersonalAssistantApp:
                 csv_path = input("Введите путь для сохранения CSV файла: ")
                 self.note_manager.export_notes_csv(csv_path)
             elif choice == '8':
+                query = input("Введите слова для поиска: ")
+                self.note_manager.search_notes(query)
+            elif choice == '9':
                 break
             else:
                 print("Неверный выбор. Пожалуйста, попробуйте снова.")
@@ -784,7 +4118,8 @@ class PersonalAssistantApp:
             print("6. Импорт задач из CSV")
             print("7. Экспорт задач в CSV")
             print("8. Фильтрация задач")
-            print("9. Вернуться в главное меню")
+            print("9. Просроченные и ближайшие задачи")
+            print("10. Вернуться в главное меню")
             choice = input("Введите ваш выбор: ").strip()
             if choice == '1':
                 title = input("Введите заголовок задачи: ")
@@ -804,7 +4139,7 @@ class PersonalAssistantApp:
                 due_date = input("Введите срок выполнения (ДД-ММ-ГГГГ): ")
                 self.task_manager.add_task(title, description, priority, due_date)
             elif choice == '2':
-                self.task_manager.list_tasks()
+                self._show_pages(lambda cursor: self.task_manager.list_tasks(cursor=cursor))
             elif choice == '3':
                 try:
                     task_id = int(input("Введите ID задачи для отметки: "))
@@ -849,19 +4184,29 @@ class PersonalAssistantApp:
                 print("1. Статусу")
                 print("2. Приоритету")
                 print("3. Сроку выполнения")
+                print("4. Нескольким условиям")
                 filter_choice = input("Введите ваш выбор: ").strip()
                 if filter_choice == '1':
                     status = input("Введите статус (Выполнено/В процессе): ").strip()
-                    self.task_manager.filter_tasks('status', status)
+                    self._show_pages(functools.partial(self.task_manager.filter_tasks, 'status', status))
                 elif filter_choice == '2':
                     priority = input("Введите приоритет (Высокий/Средний/Низкий): ").strip()
-                    self.task_manager.filter_tasks('priority', priority)
+                    self._show_pages(functools.partial(self.task_manager.filter_tasks, 'priority', priority))
                 elif filter_choice == '3':
                     due_date = input("Введите срок выполнения (ДД-ММ-ГГГГ): ").strip()
-                    self.task_manager.filter_tasks('due_date', due_date)
+                    self._show_pages(functools.partial(self.task_manager.filter_tasks, 'due_date', due_date))
+                elif filter_choice == '4':
+                    print("Оставьте поле пустым, чтобы не учитывать условие.")
+                    status = input("Статус (Выполнено/В процессе): ").strip()
+                    priority = input("Приоритет (Высокий/Средний/Низкий): ").strip()
+                    due_by = input("Срок не позже (ДД-ММ-ГГГГ): ").strip()
+                    self._show_pages(functools.partial(self.task_manager.filter_tasks_combined,
+                                                       status, priority, due_by))
                 else:
                     print("Неверный выбор фильтра.")
             elif choice == '9':
+                self.task_manager.show_due_tasks()
+            elif choice == '10':
                 break
             else:
                 print("Неверный выбор. Пожалуйста, попробуйте снова.")
@@ -922,7 +4267,10 @@ class PersonalAssistantApp:
             print("4. Подсчитать общий баланс")
             print("5. Импорт финансовых записей из CSV")
             print("6. Экспорт финансовых записей в CSV")
-            print("7. Вернуться в главное меню")
+            print("7. Удалить финансовую запись")
+            print("8. Проверить и пересчитать итоги")
+            print("9. Крупнейшие расходы")
+            print("10. Вернуться в главное меню")
             choice = input("Введите ваш выбор: ").strip()
             if choice == '1':
                 amount = input("Введите сумму операции (положительное для доходов, отрицательное для расходов): ")
@@ -935,15 +4283,19 @@ class PersonalAssistantApp:
                 print("1. Без фильтрации")
                 print("2. По дате")
                 print("3. По категории")
+                print("4. Все записи в порядке дат")
                 filter_choice = input("Введите ваш выбор: ").strip()
+                records = self.finance_manager.list_records
                 if filter_choice == '1':
-                    self.finance_manager.list_records()
+                    self._show_pages(lambda cursor: records(cursor=cursor))
                 elif filter_choice == '2':
                     date = input("Введите дату для фильтрации (ДД-ММ-ГГГГ): ")
-                    self.finance_manager.list_records(filter_by=('date', date))
+                    self._show_pages(lambda cursor: records(filter_by=('date', date), cursor=cursor))
                 elif filter_choice == '3':
                     category = input("Введите категорию для фильтрации: ")
-                    self.finance_manager.list_records(filter_by=('category', category))
+                    self._show_pages(lambda cursor: records(filter_by=('category', category), cursor=cursor))
+                elif filter_choice == '4':
+                    self._show_pages(lambda cursor: records(cursor=cursor, sort='date'))
                 else:
                     print("Неверный выбор фильтра.")
             elif choice == '3':
@@ -959,83 +4311,883 @@ class PersonalAssistantApp:
                 csv_path = input("Введите путь для сохранения CSV файла: ")
                 self.finance_manager.export_records_csv(csv_path)
             elif choice == '7':
+                try:
+                    record_id = int(input("Введите ID записи для удаления: "))
+                    self.finance_manager.delete_record(record_id)
+                except ValueError:
+                    print("Неверный ID.")
+            elif choice == '8':
+                self.finance_manager.check_aggregates()
+            elif choice == '9':
+                try:
+                    count = int(input("Сколько записей показать: ") or 10)
+                    start_date = input("Начальная дата (ДД-ММ-ГГГГ, пусто - без ограничения): ").strip()
+                    end_date = input("Конечная дата (ДД-ММ-ГГГГ, пусто - без ограничения): ").strip()
+                    self.finance_manager.top_expenses(count, start_date, end_date)
+                except ValueError:
+                    print("Неверное количество.")
+            elif choice == '10':
                 break
             else:
                 print("Неверный выбор. Пожалуйста, попробуйте снова.")
 
-    # Калькулятор
+    # Калькулятор; переменные живут до выхода из калькулятора
     def run_calculator(self):
-        print("\nКалькулятор. Выполняет базовые арифметические операции: сложение, вычитание, умножение, деление.")
-        print("Введите 'exit' для выхода.")
+        print("\nКалькулятор. Операции: + - * / % ** и скобки, десятичные числа и унарный минус.")
+        print("Переменные задаются так: x = 2 * 3. Введите 'exit' для выхода.")
+        print("Пакетный расчёт: file <файл с выражениями> <файл результатов>.")
+        variables = {}
         while True:
             expr = input("Введите выражение: ").strip()
             if expr.lower() == 'exit':
                 break
+            name, separator, value = expr.partition('=')
             try:
-                result = self.safe_eval(expr)
-                print(f"Результат: {result}")
+                if expr.startswith('file '):
+                    self.run_calculator_file(*shlex.split(expr)[1:], variables=variables)
+                elif separator and re.fullmatch(r'[^\W\d]\w*', name.strip()):
+                    variables[name.strip()] = self.safe_eval(value, variables)
+                    print(f"{name.strip()} = {variables[name.strip()]}")
+                else:
+                    result = self.safe_eval(expr, variables)
+                    print(f"Результат: {result}")
             except Exception as e:
                 print(f"Ошибка вычисления: {e}")
 
-    def safe_eval(self, expr):
-        if not re.match(r'^[\d\s\+\-\*\/\(\)]+$', expr):
-            raise ValueError("Недопустимые символы в выражении.")
+    def run_calculator_file(self, input_path, output_path, variables=None):
+        try:
+            with open(input_path, encoding='utf-8') as source, open(output_path, 'w', encoding='utf-8') as destination:
+                stats = run_batch_calculator(source, destination, variables=variables)
+            print(f"Результаты записаны в {output_path}: выражений {stats['expressions']},"
+                  f" ошибок {stats['errors']}, {stats['seconds']:.2f} с.")
+        except IOError as e:
+            print(f"Ошибка пакетного вычисления: {e}")
+
+    def safe_eval(self, expr, variables=None):
+        return compile_expression(expr.strip()).evaluate(variables)
+
+
+# Блокировка для сервера: чтения идут одновременно, запись - одна и без чтений.
+# Читатели и писатели проходят через общую очередь (asyncio.Lock выдаёт её по порядку),
+# поэтому поток записей не задерживает чтения бесконечно, и наоборот
+class ReadWriteLock:
+    def __init__(self):
+        self._readers = 0
+        self._queue = asyncio.Lock()
+        self._idle = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def reading(self):
+        async with self._queue:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._idle:
+                self._readers -= 1
+                self._idle.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def writing(self):
+        async with self._queue:
+            async with self._idle:
+                await self._idle.wait_for(lambda: not self._readers)
+            yield
+
+
+class CommandError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Перехват stdout одного потока. На время перехватов sys.stdout заменяется посредником: вывод
+# перехватывающих потоков идёт в их буферы, остальных (например, чтений API сервера) - в прежний поток.
+# Под блокировкой только подмена и возврат sys.stdout, сами обработчики выполняются параллельно
+class ThreadOutput:
+    _lock = threading.Lock()
+    _proxy = None
+    _users = 0
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, 'buffer', None) or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @classmethod
+    @contextlib.contextmanager
+    def capture(cls):
+        with cls._lock:
+            if not cls._users:
+                cls._proxy = cls(sys.stdout)
+                sys.stdout = cls._proxy
+            cls._users += 1
+            proxy = cls._proxy
+        outer = getattr(proxy._local, 'buffer', None)
+        buffer = proxy._local.buffer = io.StringIO()
+        try:
+            yield buffer
+        finally:
+            proxy._local.buffer = outer
+            with cls._lock:
+                cls._users -= 1
+                if not cls._users:
+                    if sys.stdout is proxy:
+                        sys.stdout = proxy.stream
+                    cls._proxy = None
+
+
+# Команды над менеджерами с результатом в виде данных для JSON; общие для API сервера и командной строки.
+# Обработчик получает менеджер, параметры запроса, тело и номер записи и возвращает (статус, данные)
+class AppCommands:
+    def __init__(self, app):
+        self.app = app
+
+    # Вывод менеджера (сообщения об успехе и ошибках) возвращается в поле "message" или "error".
+    # Перехватывается только вывод этого потока: записи в другие хранилища идут параллельно
+    def run_captured(self, handler, manager, query, data, args):
+        with ThreadOutput.capture() as output:
+            status, payload = handler(manager, query, data, *args)
+        message = output.getvalue().strip()
+        if message:
+            payload = dict(payload, **{'error' if status >= 400 else 'message': message})
+        return status, payload
+
+    @staticmethod
+    def _text(data, key, default=''):
+        value = data.get(key, default)
+        if value is None:
+            return default
+        if not isinstance(value, str):
+            raise CommandError(400, f"Поле {key} должно быть строкой.")
+        return value
+
+    @staticmethod
+    def _number(query, key, default):
+        if key not in query:
+            return default
+        try:
+            return int(query[key])
+        except ValueError:
+            raise CommandError(400, f"Параметр {key} должен быть целым числом.")
+
+    @staticmethod
+    def _changed(item, status=201):
+        if item is None:
+            return 400, {}
+        return status, {"item": item.to_dict()}
+
+    @staticmethod
+    def _items(items, limit=None):
+        return 200, {"count": len(items), "items": [item.to_dict() for item in items[:limit]]}
+
+    # Постраничный режим списков включается параметром sort или cursor (next_cursor предыдущей
+    # страницы), limit - размер страницы; count - число записей на странице
+    @staticmethod
+    def _paging(query):
+        return 'cursor' in query or 'sort' in query
+
+    def _page(self, manager, query, filter_by=None, render=None):
+        cursor = Page.parse_cursor(query['cursor']) if query.get('cursor') else None
+        page = manager.filtered_page(filter_by, cursor, self._number(query, 'limit', None), query.get('sort', 'id'))
+        render = render or (lambda item: item.to_dict())
+        return 200, {"count": len(page.items), "items": [render(item) for item in page.items],
+                     "next_cursor": page.token}
+
+    def _existing(self, manager, item_id, get=None):
+        item = (get or manager._get)(item_id)
+        if item is None:
+            raise CommandError(404, "Запись не найдена.")
+        return item
+
+    def get_item(self, manager, query, data, item_id):
+        item = self._existing(manager, item_id)
+        if isinstance(manager, NoteManager):
+            item = manager._full_note(item)
+        return 200, {"item": item.to_dict()}
+
+    def delete_item(self, manager, query, data, item_id):
+        item = self._existing(manager, item_id, manager._get_for_update)
+        manager._remove(item)
+        if not manager._persist('delete', item):
+            return 400, {}
+        return 200, {"item": {"id": item.id}}
+
+    def list_notes(self, manager, query, data):
+        if self._paging(query):
+            return self._page(manager, query, render=lambda note: {"id": note.id, "title": note.title,
+                                                                   "timestamp": note.timestamp})
+        notes = list(manager.notes)
+        limit = self._number(query, 'limit', len(notes))
+        return 200, {"count": len(notes),
+                     "items": [{"id": note.id, "title": note.title, "timestamp": note.timestamp}
+                               for note in notes[:limit]]}
+
+    def search_notes(self, manager, query, data):
+        results = manager._search_notes(query.get('q', ''), self._number(query, 'limit', 10))
+        return 200, {"count": len(results),
+                     "items": [{"id": note.id, "title": note.title, "timestamp": note.timestamp,
+                                "score": round(score, 4), "snippet": snippet}
+                               for note, score, snippet in results]}
+
+    def create_note(self, manager, query, data):
+        note = manager.create_note(self._text(data, 'title'), self._text(data, 'content'))
+        return self._changed(manager._full_note(note) if note else None)
+
+    def edit_note(self, manager, query, data, note_id):
+        note = manager.get_note_by_id(note_id)
+        if note is None:
+            raise CommandError(404, "Заметка не найдена.")
+        note = manager.edit_note(note_id, self._text(data, 'title', note.title),
+                                 self._text(data, 'content', note.content))
+        return self._changed(manager._full_note(note) if note else None, 200)
+
+    # Условия фильтра берутся из параметров запроса: status, priority, due_date, due_from, due_by
+    def list_tasks(self, manager, query, data):
+        conditions = []
+        for key in TaskManager.FILTER_COLUMNS:
+            if key not in query:
+                continue
+            value = query[key]
+            if key == 'status':
+                value = value.lower() in ['выполнено', 'done', 'true', '1']
+            elif key == 'priority' and value not in manager.PRIORITIES:
+                raise CommandError(400, f"Приоритет должен быть одним из: {', '.join(manager.PRIORITIES)}.")
+            elif key not in ('status', 'priority') and not parse_date(value):
+                raise CommandError(400, "Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
+            conditions.append((key, value))
+        if self._paging(query):
+            return self._page(manager, query, conditions)
+        return self._items(manager._filter_tasks(conditions), self._number(query, 'limit', None))
+
+    def due_tasks(self, manager, query, data):
+        return 200, {"overdue": [task.to_dict() for task in manager.overdue_tasks()],
+                     "upcoming": [task.to_dict() for task in manager.next_due_tasks(self._number(query, 'count', 5))]}
+
+    def add_task(self, manager, query, data):
+        return self._changed(manager.add_task(self._text(data, 'title'), self._text(data, 'description'),
+                                              self._text(data, 'priority', 'Средний'),
+                                              self._text(data, 'due_date') or None))
+
+    def edit_task(self, manager, query, data, task_id):
+        task = manager.get_task_by_id(task_id)
+        if task is None:
+            raise CommandError(404, "Задача не найдена.")
+        done = data.get('done')
+        if isinstance(done, str):
+            done = done.lower() in ['выполнено', 'done', 'true', '1']
+        return self._changed(manager.edit_task(
+            task_id, self._text(data, 'title', task.title), self._text(data, 'description', task.description),
+            self._text(data, 'priority', task.priority), self._text(data, 'due_date', task.due_date or '') or None,
+            done), 200)
+
+    def mark_task_done(self, manager, query, data, task_id):
+        self._existing(manager, task_id)
+        return self._changed(manager.mark_task_done(task_id), 200)
+
+    def list_contacts(self, manager, query, data):
+        if self._paging(query):
+            return self._page(manager, query)
+        return self._items(list(manager.contacts), self._number(query, 'limit', None))
+
+    def search_contacts(self, manager, query, data):
+        return self._items(manager._search_contacts(query.get('q', '')), self._number(query, 'limit', None))
+
+    def add_contact(self, manager, query, data):
+        return self._changed(manager.add_contact(self._text(data, 'name'), self._text(data, 'phone'),
+                                                 self._text(data, 'email')))
 
-        allowed_operators = {
-            '+': operator.add,
-            '-': operator.sub,
-            '*': operator.mul,
-            '/': operator.truediv
+    def edit_contact(self, manager, query, data, contact_id):
+        contact = self._existing(manager, contact_id)
+        return self._changed(manager.edit_contact(
+            contact_id, self._text(data, 'name', contact.name), self._text(data, 'phone', contact.phone),
+            self._text(data, 'email', contact.email)), 200)
+
+    def list_records(self, manager, query, data):
+        filter_by = None
+        if 'category' in query:
+            filter_by = ('category', query['category'])
+        elif 'date' in query:
+            filter_by = ('date', query['date'])
+        if self._paging(query):
+            return self._page(manager, query, filter_by)
+        return self._items(manager._filter_records(filter_by), self._number(query, 'limit', None))
+
+    def add_record(self, manager, query, data):
+        amount = data.get('amount')
+        if isinstance(amount, bool) or not isinstance(amount, (int, float, str)):
+            raise CommandError(400, "Поле amount должно быть числом.")
+        return self._changed(manager.add_record(amount, self._text(data, 'category'), self._text(data, 'date'),
+                                                self._text(data, 'description')))
+
+    def balance(self, manager, query, data):
+        return 200, {"balance": manager._aggregates.balance()}
+
+    @staticmethod
+    def _date_range(query, required):
+        start = parse_date(query['start']) if query.get('start') else (None if required else datetime.min)
+        end = parse_date(query['end']) if query.get('end') else (None if required else datetime.max)
+        if not start or not end:
+            raise CommandError(400, "Неверный формат даты. Используйте ДД-ММ-ГГГГ.")
+        if start > end:
+            raise CommandError(400, "Начальная дата не может быть позже конечной.")
+        return start, end
+
+    def report(self, manager, query, data):
+        start, end = self._date_range(query, required=True)
+        total_income, total_expense, categories = manager._report_totals(start, end)
+        return 200, {"start": query['start'], "end": query['end'], "income": total_income,
+                     "expense": total_expense, "balance": total_income + total_expense, "categories": categories}
+
+    def top_expenses(self, manager, query, data):
+        count = self._number(query, 'count', 10)
+        if count <= 0:
+            raise CommandError(400, "Количество записей должно быть положительным.")
+        start, end = self._date_range(query, required=False)
+        return self._items(list(manager._top_expenses(count, start, end)))
+
+    # Значения переменных - объект "variables"; "bindings" - список таких объектов для расчёта пакетом
+    def calculate(self, manager, query, data):
+        expr = self._text(data, 'expr') or query.get('expr', '')
+        bindings = data.get('bindings')
+        if bindings is not None and not (isinstance(bindings, list) and all(isinstance(b, dict) for b in bindings)):
+            raise CommandError(400, "Поле bindings должно быть списком объектов.")
+        variables = data.get('variables')
+        if variables is None:
+            variables = {key: value for key, value in query.items() if key != 'expr'}
+        elif not isinstance(variables, dict):
+            raise CommandError(400, "Поле variables должно быть объектом.")
+        try:
+            expression = compile_expression(expr.strip())
+            if bindings is not None:
+                return 200, {"expr": expr, "results": expression.evaluate_many(bindings)}
+            return 200, {"expr": expr, "result": expression.evaluate(variables)}
+        except ArithmeticError as e:
+            raise CommandError(400, f"Ошибка вычисления: {e}")
+
+    # Метрики процесса по запросу: format=json (по умолчанию) или format=prometheus - текстом
+    def metrics(self, manager, query, data):
+        output_format = query.get('format', 'json')
+        if output_format not in Metrics.FORMATS:
+            raise CommandError(400, f"Формат метрик должен быть одним из: {', '.join(Metrics.FORMATS)}.")
+        if output_format == 'prometheus':
+            return 200, METRICS.prometheus()
+        return 200, METRICS.snapshot()
+
+    # Импорт и экспорт CSV: method - имя метода менеджера, например import_notes_csv
+    def import_csv(self, method, manager, query, data):
+        path = self._text(data, 'file')
+        if not path:
+            raise CommandError(400, "Не указан файл: file=<путь>.")
+        result = getattr(manager, method)(path, self._number(query, 'chunk', None),
+                                          self._number(query, 'checkpoint', None))
+        return (400 if result.error else 200), {"result": result.to_dict()}
+
+    def export_csv(self, method, manager, query, data):
+        path = self._text(data, 'file')
+        if not path:
+            raise CommandError(400, "Не указан файл: file=<путь>.")
+        return (200 if getattr(manager, method)(path) else 400), {"file": path}
+
+
+# Локальный HTTP/JSON сервер поверх менеджеров приложения (asyncio, HTTP/1.1 с keep-alive).
+# Обработчики команд выполняются в пуле потоков
+class ApiServer:
+    STATUS_TEXT = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+                   405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+    MAX_BODY = 1024 * 1024
+
+    def __init__(self, app, host='127.0.0.1', port=8765, workers=8):
+        self.app = app
+        self.host = host
+        self.port = port
+        # Блокировки по хранилищам: запись задач не задерживает чтение финансов
+        self._locks = {name: ReadWriteLock() for name in app.STORES}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        # (метод, путь, хранилище, запись?, обработчик); более частные пути идут раньше общих
+        commands = self.commands = AppCommands(app)
+        self.routes = [(method, re.compile(f'^{path}$'), store, writes, handler)
+                       for method, path, store, writes, handler in [
+            ('GET', '/notes', 'notes', False, commands.list_notes),
+            ('GET', '/notes/search', 'notes', False, commands.search_notes),
+            ('GET', r'/notes/(\d+)', 'notes', False, commands.get_item),
+            ('POST', '/notes', 'notes', True, commands.create_note),
+            ('PUT', r'/notes/(\d+)', 'notes', True, commands.edit_note),
+            ('DELETE', r'/notes/(\d+)', 'notes', True, commands.delete_item),
+            ('GET', '/tasks', 'tasks', False, commands.list_tasks),
+            # Просмотр сроков перестраивает кучу сроков, поэтому выполняется как запись
+            ('GET', '/tasks/due', 'tasks', True, commands.due_tasks),
+            ('GET', r'/tasks/(\d+)', 'tasks', False, commands.get_item),
+            ('POST', '/tasks', 'tasks', True, commands.add_task),
+            ('PUT', r'/tasks/(\d+)', 'tasks', True, commands.edit_task),
+            ('POST', r'/tasks/(\d+)/done', 'tasks', True, commands.mark_task_done),
+            ('DELETE', r'/tasks/(\d+)', 'tasks', True, commands.delete_item),
+            ('GET', '/contacts', 'contacts', False, commands.list_contacts),
+            ('GET', '/contacts/search', 'contacts', False, commands.search_contacts),
+            ('GET', r'/contacts/(\d+)', 'contacts', False, commands.get_item),
+            ('POST', '/contacts', 'contacts', True, commands.add_contact),
+            ('PUT', r'/contacts/(\d+)', 'contacts', True, commands.edit_contact),
+            ('DELETE', r'/contacts/(\d+)', 'contacts', True, commands.delete_item),
+            ('GET', '/finance', 'finance', False, commands.list_records),
+            ('GET', '/finance/balance', 'finance', False, commands.balance),
+            ('GET', '/finance/report', 'finance', False, commands.report),
+            ('GET', '/finance/top', 'finance', False, commands.top_expenses),
+            ('GET', r'/finance/(\d+)', 'finance', False, commands.get_item),
+            ('POST', '/finance', 'finance', True, commands.add_record),
+            ('DELETE', r'/finance/(\d+)', 'finance', True, commands.delete_item),
+            ('GET', '/calc', None, False, commands.calculate),
+            ('POST', '/calc', None, False, commands.calculate),
+            ('GET', '/metrics', None, False, commands.metrics),
+        ]]
+
+    # Все хранилища загружаются до приёма соединений, чтобы первые запросы не ждали загрузки
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, self.app._loader.get, name)
+                               for name in self.app.STORES))
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"API сервер запущен: http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, payload = await self._dispatch(method, target, body)
+                # Текстовый ответ (метрики в формате Prometheus) отдаётся как есть
+                if isinstance(payload, str):
+                    content_type = 'text/plain; version=0.0.4'
+                    data = payload.encode('utf-8')
+                else:
+                    content_type = 'application/json'
+                    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {self.STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > self.MAX_BODY:
+            raise ConnectionError("слишком большое тело запроса")
+        body = await reader.readexactly(length) if length else b''
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method.upper(), target, body, keep_alive
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, store, writes, handler in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                query = dict(parse_qsl(url.query))
+                data = json.loads(body.decode('utf-8')) if body else {}
+                if not isinstance(data, dict):
+                    raise CommandError(400, "Тело запроса должно быть JSON-объектом.")
+                args = [int(group) for group in match.groups()]
+                return await self._call(store, writes, handler, query, data, args)
+            except CommandError as e:
+                return e.status, {"error": str(e)}
+            except (ValueError, UnicodeDecodeError) as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+        if allowed:
+            return 405, {"error": "Метод не поддерживается."}
+        return 404, {"error": "Неизвестный путь."}
+
+    async def _call(self, store, writes, handler, query, data, args):
+        loop = asyncio.get_running_loop()
+        if store is None:
+            return await loop.run_in_executor(self._executor, handler, None, query, data, *args)
+        manager = await loop.run_in_executor(self._executor, self.app._loader.get, store)
+        lock = self._locks[store]
+        # Файлы изменены другим процессом: перечитываем до обработки запроса
+        if manager._changed_on_disk():
+            async with lock.writing():
+                await loop.run_in_executor(self._executor, manager.refresh)
+        if writes:
+            async with lock.writing():
+                return await loop.run_in_executor(self._executor, self.commands.run_captured,
+                                                  handler, manager, query, data, args)
+        async with lock.reading():
+            return await loop.run_in_executor(self._executor, handler, manager, query, data, *args)
+
+
+# Неинтерактивный режим: personal_assistant.py <раздел> <действие> [номер] [ключ=значение ...]
+# или script <файл|-> - команды из файла (по одной в строке) за один запуск. Все команды запуска идут
+# в одном пакете записи: каждое хранилище загружается и сохраняется один раз.
+# На каждую команду печатается строка JSON: {"command": ..., "status": ..., ...}
+class CommandLine:
+    USAGE = ("Использование:\n"
+             "personal_assistant.py <notes|tasks|contacts|finance> <действие> [номер] [ключ=значение ...]\n"
+             "  notes: add title= content= | list | get N | edit N | delete N | search q="
+             " | import file= | export file=\n"
+             "  tasks: add title= description= priority= due_date= | list | filter status= priority="
+             " due_date= due_from= due_by= | get N | edit N | done N | delete N | due count="
+             " | import file= | export file=\n"
+             "  contacts: add name= phone= email= | list | search q= | get N | edit N | delete N"
+             " | import file= | export file=\n"
+             "  finance: add amount= category= date= description= | list | filter category=|date= | get N"
+             " | delete N | balance | report start= end= | top count= start= end= | import file= | export file=\n"
+             "  list, filter: постранично - sort=id (finance: date, tasks: due) cursor=<next_cursor> limit=\n"
+             "personal_assistant.py calc <выражение> [имя=значение ...]\n"
+             "personal_assistant.py calcfile <вход|-> [выход|-] [workers=N] [chunk=N] [имя=значение ...]\n"
+             "personal_assistant.py script <файл|->\n"
+             "personal_assistant.py metrics [format=json|prometheus]\n"
+             "personal_assistant.py convert <файл> <кодек>\n"
+             "personal_assistant.py serve [порт]\n"
+             "personal_assistant.py loadtest [запросов] [соединений] [порт]\n"
+             "Перед командой: --metrics[=json|prometheus[:файл]] - метрики при завершении,"
+             " --profile[=файл] - профиль cProfile (или PA_METRICS, PA_PROFILE)")
+
+    def __init__(self, app):
+        self.app = app
+        self.commands = commands = AppCommands(app)
+        csv_methods = {'notes': 'notes', 'tasks': 'tasks', 'contacts': 'contacts', 'finance': 'records'}
+        # (раздел, действие) -> (обработчик, нужен ли номер записи)
+        self.table = {
+            ('notes', 'add'): (commands.create_note, False),
+            ('notes', 'list'): (commands.list_notes, False),
+            ('notes', 'edit'): (commands.edit_note, True),
+            ('notes', 'search'): (commands.search_notes, False),
+            ('tasks', 'add'): (commands.add_task, False),
+            ('tasks', 'list'): (commands.list_tasks, False),
+            ('tasks', 'filter'): (commands.list_tasks, False),
+            ('tasks', 'edit'): (commands.edit_task, True),
+            ('tasks', 'done'): (commands.mark_task_done, True),
+            ('tasks', 'due'): (commands.due_tasks, False),
+            ('contacts', 'add'): (commands.add_contact, False),
+            ('contacts', 'list'): (commands.list_contacts, False),
+            ('contacts', 'search'): (commands.search_contacts, False),
+            ('contacts', 'edit'): (commands.edit_contact, True),
+            ('finance', 'add'): (commands.add_record, False),
+            ('finance', 'list'): (commands.list_records, False),
+            ('finance', 'filter'): (commands.list_records, False),
+            ('finance', 'balance'): (commands.balance, False),
+            ('finance', 'report'): (commands.report, False),
+            ('finance', 'top'): (commands.top_expenses, False),
         }
+        for section, name in csv_methods.items():
+            self.table[(section, 'get')] = (commands.get_item, True)
+            self.table[(section, 'delete')] = (commands.delete_item, True)
+            self.table[(section, 'import')] = (functools.partial(commands.import_csv, f'import_{name}_csv'), False)
+            self.table[(section, 'export')] = (functools.partial(commands.export_csv, f'export_{name}_csv'), False)
+        self._batches = contextlib.ExitStack()
+        self._batched = {}
 
-        def parse(tokens):
-            def parse_expression(index):
-                values = []
-                ops = []
-
-                def apply_ops():
-                    right = values.pop()
-                    left = values.pop()
-                    op = ops.pop()
-                    values.append(allowed_operators[op](left, right))
-
-                while index < len(tokens):
-                    token = tokens[index]
-                    if token.isdigit() or ('.' in token and token.replace('.', '', 1).isdigit()):
-                        values.append(float(token))
-                        index += 1
-                    elif token in allowed_operators:
-                        while ops and precedence(ops[-1]) >= precedence(token):
-                            apply_ops()
-                        ops.append(token)
-                        index += 1
-                    elif token == '(':
-                        sub_result, index = parse_expression(index + 1)
-                        values.append(sub_result)
-                    elif token == ')':
-                        break
-                    else:
-                        raise ValueError(f"Неизвестный токен: {token}")
-                while ops:
-                    apply_ops()
-                return values[0], index + 1
-
-            def precedence(op):
-                if op in ('+', '-'):
-                    return 1
-                elif op in ('*', '/'):
-                    return 2
-                return 0
-
-            result, _ = parse_expression(0)
-            return result
+    # Менеджер загружается при первой команде раздела и остаётся в пакете записи до конца запуска
+    def _manager(self, section):
+        manager = self.app._loader.get(section)
+        if section not in self._batched:
+            self._batches.enter_context(manager.batch())
+            self._batched[section] = manager
+        return manager
+
+    # Запись пакетов в конце запуска. Сообщения менеджеров идут в stderr, чтобы не смешиваться со строками JSON;
+    # возвращает разделы, изменения которых не записаны
+    def _finish(self):
+        with contextlib.redirect_stdout(sys.stderr):
+            failed = [section for section, manager in self._batched.items() if not manager.flush()]
+            self._batches.close()
+        return failed
+
+    def _parse(self, tokens):
+        # calc <выражение> [имя=значение ...]: аргументы вида имя=значение задают переменные
+        if tokens[0] == 'calc':
+            params = {}
+            expr = []
+            for token in tokens[1:]:
+                name, separator, value = token.partition('=')
+                if separator and re.fullmatch(r'[^\W\d]\w*', name):
+                    params[name] = value
+                else:
+                    expr.append(token)
+            params["expr"] = ' '.join(expr)
+            return None, self.commands.calculate, params, []
+        # metrics [format=json|prometheus]: метрики текущего запуска
+        if tokens[0] == 'metrics':
+            return None, self.commands.metrics, self._params(tokens[1:]), []
+        entry = self.table.get((tokens[0], tokens[1] if len(tokens) > 1 else ''))
+        if entry is None:
+            raise CommandError(404, f"Неизвестная команда: {' '.join(tokens[:2])}. Справка: help")
+        handler, takes_id = entry
+        rest = tokens[2:]
+        args = []
+        if takes_id:
+            if not rest or not rest[0].isdigit():
+                raise CommandError(400, "Не указан номер записи.")
+            args = [int(rest[0])]
+            rest = rest[1:]
+        return tokens[0], handler, self._params(rest), args
+
+    @staticmethod
+    def _params(tokens):
+        params = {}
+        for token in tokens:
+            key, separator, value = token.partition('=')
+            if not separator:
+                raise CommandError(400, f"Ожидался аргумент вида ключ=значение: {token}")
+            params[key] = value
+        return params
+
+    def execute(self, tokens):
+        try:
+            section, handler, params, args = self._parse(tokens)
+            manager = self._manager(section) if section else None
+            return self.commands.run_captured(handler, manager, params, params, args)
+        except CommandError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+    def _report(self, command, status, payload):
+        if isinstance(payload, str):
+            print(payload, end='')
+            return status < 400
+        print(json.dumps(dict({"command": command, "status": status}, **payload), ensure_ascii=False))
+        return status < 400
+
+    def run_script(self, lines):
+        ok = True
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                tokens = shlex.split(line)
+            except ValueError as e:
+                ok = self._report(line, 400, {"error": str(e)}) and ok
+                continue
+            ok = self._report(line, *self.execute(tokens)) and ok
+        return ok
+
+    # Возвращает код завершения процесса: 0 - все команды выполнены, 1 - была ошибка
+    def main(self, argv):
+        if argv[0] in ('help', '-h', '--help'):
+            print(self.USAGE)
+            return 0
+        try:
+            if argv[0] == 'script':
+                if len(argv) < 2 or argv[1] == '-':
+                    ok = self.run_script(sys.stdin)
+                else:
+                    try:
+                        with open(argv[1], encoding='utf-8') as script:
+                            ok = self.run_script(script)
+                    except IOError as e:
+                        ok = self._report(shlex.join(argv), 400, {"error": f"Ошибка чтения сценария: {e}"})
+            else:
+                ok = self._report(shlex.join(argv), *self.execute(argv))
+        finally:
+            failed = self._finish()
+        # Команды уже отчитались об успехе, но на диск их изменения не попали: запуск завершается ошибкой
+        if failed:
+            ok = self._report(shlex.join(argv), 500, {"error": f"Изменения не сохранены: {', '.join(failed)}."})
+        return 0 if ok else 1
+
+
+# Генератор нагрузки для API сервера: concurrency соединений с keep-alive по кругу запрашивают пути
+LOAD_TEST_PATHS = ('/notes/search?q=note', '/contacts/search?q=an', '/tasks?status=false&limit=20',
+                   '/finance/balance', '/finance/report?start=01-01-2024&end=31-12-2024',
+                   '/finance/top?count=5', '/calc?expr=2*(3%2B4)')
+
+
+async def _load_worker(host, port, paths, count, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for number in range(count):
+            path = paths[number % len(paths)]
+            started = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\n\r\n".encode('latin-1'))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append((path, status))
+    finally:
+        writer.close()
+
+
+async def run_load_test(host='127.0.0.1', port=8765, requests=2000, concurrency=16, paths=LOAD_TEST_PATHS):
+    latencies = []
+    errors = []
+    per_worker = [requests // concurrency + (1 if number < requests % concurrency else 0)
+                  for number in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(_load_worker(host, port, paths, count, latencies, errors)
+                           for count in per_worker if count))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
 
-        tokens = re.findall(r'\d+\.\d+|\d+|[+\-*/()]', expr)
-        if not tokens:
-            raise ValueError("Пустое выражение.")
-        return parse(tokens)
+    def percentile(share):
+        return latencies[min(len(latencies) - 1, max(0, math.ceil(share * len(latencies)) - 1))] * 1000
+
+    print(f"Запросов: {len(latencies)}, соединений: {concurrency}, время: {elapsed:.2f} с")
+    print(f"Пропускная способность: {len(latencies) / elapsed:.0f} запросов/с")
+    print(f"Задержка: p50 {percentile(0.5):.2f} мс, p99 {percentile(0.99):.2f} мс,"
+          f" макс {latencies[-1] * 1000:.2f} мс")
+    if errors:
+        print(f"Ошибочных ответов: {len(errors)} (например, {errors[0][0]} -> {errors[0][1]})")
+    return {"requests": len(latencies), "seconds": elapsed, "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(0.5), "p99_ms": percentile(0.99), "errors": len(errors)}
 
 
 if __name__ == "__main__":
-    app = PersonalAssistantApp()
+    # Метрики и профилирование сеанса: --metrics[=формат[:куда]] и --profile[=файл] перед командой
+    # или PA_METRICS и PA_PROFILE. Без них приложение работает без обёрток и профилировщика
+    settings = {'--metrics': os.environ.get('PA_METRICS'), '--profile': os.environ.get('PA_PROFILE')}
+    while len(sys.argv) > 1 and sys.argv[1].partition('=')[0] in settings:
+        option, _, value = sys.argv.pop(1).partition('=')
+        settings[option] = value or ('json' if option == '--metrics' else 'personal_assistant.prof')
+    if settings['--metrics']:
+        try:
+            metrics_format, metrics_destination = parse_metrics_setting(settings['--metrics'])
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        enable_metrics()
+        # Обработчики atexit выполняются в обратном порядке: метрики выводятся после отложенной записи
+        atexit.register(write_metrics, metrics_format, metrics_destination)
+    if settings['--profile']:
+        start_profiler(settings['--profile'])
+    # Разовое преобразование формата: personal_assistant.py convert <файл> <кодек>
+    if len(sys.argv) == 4 and sys.argv[1] == 'convert':
+        try:
+            count = convert_store(sys.argv[2], sys.argv[3])
+            print(f"Файл {sys.argv[2]} преобразован в {sys.argv[3]}, записей: {count}.")
+        except (ValueError, IOError) as e:
+            print(f"Ошибка преобразования: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    # Нагрузочный тест запущенного сервера: personal_assistant.py loadtest [запросов] [соединений] [порт]
+    if len(sys.argv) >= 2 and sys.argv[1] == 'loadtest':
+        try:
+            options = [int(value) for value in sys.argv[2:5]]
+        except ValueError:
+            options = [0]
+        if len(sys.argv) > 5 or min(options, default=1) <= 0:
+            print("Использование: personal_assistant.py loadtest [запросов] [соединений] [порт]", file=sys.stderr)
+            sys.exit(1)
+        defaults = [2000, 16, 8765]
+        requests, concurrency, port = options + defaults[len(options):]
+        try:
+            asyncio.run(run_load_test(port=port, requests=requests, concurrency=concurrency))
+        except OSError as e:
+            print(f"Ошибка подключения к серверу: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    # Пакетный калькулятор: personal_assistant.py calcfile <вход|-> [выход|-] [workers=N] [chunk=N] [имя=значение ...]
+    if len(sys.argv) >= 3 and sys.argv[1] == 'calcfile':
+        paths = [arg for arg in sys.argv[2:] if '=' not in arg]
+        options = dict(arg.split('=', 1) for arg in sys.argv[2:] if '=' in arg)
+        try:
+            workers = int(options.pop('workers', 0))
+            chunk_size = int(options.pop('chunk', 10000))
+        except ValueError:
+            workers = chunk_size = -1
+        if not 1 <= len(paths) <= 2 or workers < 0 or chunk_size <= 0:
+            print("Использование: personal_assistant.py calcfile <вход|-> [выход|-] [workers=N] [chunk=N] "
+                  "[имя=значение ...]", file=sys.stderr)
+            sys.exit(1)
+        try:
+            workers = workers or None
+            with contextlib.ExitStack() as files:
+                source = sys.stdin if paths[0] == '-' else files.enter_context(open(paths[0], encoding='utf-8'))
+                destination = (sys.stdout if len(paths) < 2 or paths[1] == '-'
+                               else files.enter_context(open(paths[1], 'w', encoding='utf-8')))
+                stats = run_batch_calculator(source, destination, workers, chunk_size, options)
+        except (IOError, ValueError) as e:
+            print(f"Ошибка пакетного вычисления: {e}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(1 if stats["errors"] else 0)
+    # Режим хранения: json (по умолчанию), journal или sqlite; PA_COLUMNAR=1 - колоночные финансы;
+    # PA_PREFETCH=1 - фоновая загрузка всех данных при старте; PA_TIMINGS=1 - время запуска и загрузки;
+    # PA_CODEC - кодек файлов хранилищ, общий или по хранилищам (см. parse_codec_setting);
+    # PA_WRITE_BEHIND - отложенная запись изменений с окном в указанное число секунд;
+    # PA_FINANCE_PARTITIONS=month|year - финансы по секциям за месяц или год (см. PartitionedStorage)
+    app = PersonalAssistantApp(storage_mode=os.environ.get('PA_STORAGE', 'json'),
+                               columnar_finance=os.environ.get('PA_COLUMNAR') == '1',
+                               prefetch=os.environ.get('PA_PREFETCH') == '1',
+                               show_timings=os.environ.get('PA_TIMINGS') == '1',
+                               codecs=parse_codec_setting(os.environ.get('PA_CODEC'), PersonalAssistantApp.STORES),
+                               write_behind=float(os.environ.get('PA_WRITE_BEHIND') or 0),
+                               finance_partitions=os.environ.get('PA_FINANCE_PARTITIONS'))
+    # Сервер без интерфейса: personal_assistant.py serve [порт] - JSON API на 127.0.0.1
+    if len(sys.argv) >= 2 and sys.argv[1] == 'serve':
+        port = sys.argv[2] if len(sys.argv) > 2 else '8765'
+        if len(sys.argv) > 3 or not port.isdigit() or not 0 < int(port) < 65536:
+            print("Использование: personal_assistant.py serve [порт]", file=sys.stderr)
+            app.close()
+            sys.exit(1)
+        server = ApiServer(app, port=int(port))
+        try:
+            asyncio.run(server.serve())
+        except KeyboardInterrupt:
+            print("Сервер остановлен.")
+        finally:
+            server.close()
+            app.close()
+        sys.exit(0)
+    if len(sys.argv) >= 2:
+        code = CommandLine(app).main(sys.argv[1:])
+        # stdout - строки JSON; повторная запись несохранённого при закрытии сообщает об ошибках в stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            app.close()
+        sys.exit(code)
     app.run()
\ No newline at end of file
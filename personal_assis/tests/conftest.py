@@ -0,0 +1,5 @@
+import os
+import sys
+
+# personal_assistant.py - отдельный модуль рядом с каталогом тестов, не пакет
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
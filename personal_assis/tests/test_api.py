@@ -0,0 +1,138 @@
+import asyncio
+import json
+import mmap
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import personal_assistant as pa
+
+BODIES = {
+    'notes': {'title': 'Заметка', 'content': 'текст'},
+    'tasks': {'title': 'Задача', 'priority': 'Высокий', 'due_date': '01-05-2024'},
+    'contacts': {'name': 'Иван', 'phone': '79001234567', 'email': 'ivan@example.com'},
+    'finance': {'amount': -100, 'category': 'еда', 'date': '01-05-2024', 'description': ''},
+}
+MESSAGES = {
+    'notes': 'Заметка успешно создана.',
+    'tasks': 'Задача успешно добавлена.',
+    'contacts': 'Контакт успешно добавлен.',
+    'finance': 'Финансовая запись успешно добавлена.',
+}
+
+
+# Вывод, перехваченный в одном потоке, не попадает в ответ другого, и sys.stdout возвращается на место
+def test_run_captured_keeps_thread_output_apart():
+    commands = pa.AppCommands(None)
+    stdout = sys.stdout
+
+    def handler(manager, query, data, number):
+        print(f"начало {number}")
+        time.sleep(0.01)
+        print(f"конец {number}")
+        return 200, {}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda number: commands.run_captured(handler, None, {}, {}, [number]), range(16)))
+    assert [payload['message'] for _, payload in results] == [f"начало {number}\nконец {number}" for number in range(16)]
+    assert sys.stdout is stdout
+
+
+# Перехват не выстраивает обработчики в очередь: восемь по 0.1 с выполняются вместе
+def test_run_captured_runs_handlers_in_parallel():
+    commands = pa.AppCommands(None)
+
+    def handler(manager, query, data):
+        print("готово")
+        time.sleep(0.1)
+        return 200, {}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: commands.run_captured(handler, None, {}, {}, []), range(8)))
+    assert time.perf_counter() - started < 0.4
+    assert all(payload['message'] == "готово" for _, payload in results)
+
+
+# Вывод потока без перехвата (например, ошибка чтения в запросе GET) не попадает в чужой ответ
+def test_uncaptured_output_stays_out_of_responses(capsys):
+    commands = pa.AppCommands(None)
+    inside = threading.Event()
+    printed = threading.Event()
+
+    def handler(manager, query, data):
+        print("запись")
+        inside.set()
+        printed.wait(1)
+        return 200, {}
+
+    def reader():
+        inside.wait(1)
+        print("чтение")
+        printed.set()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    _, payload = commands.run_captured(handler, None, {}, {}, [])
+    thread.join()
+    assert payload['message'] == "запись"
+    assert "чтение" in capsys.readouterr().out
+
+
+# Тексты заметок читаются из нескольких потоков: пока один поток отображает дописанный файл заново,
+# остальные дочитывают старые ссылки. Медленный mmap расширяет окно гонки
+def test_body_store_parallel_reads_during_remap(tmp_path, monkeypatch):
+    def slow_mmap(*args, **kwargs):
+        time.sleep(0.002)
+        return mmap.mmap(*args, **kwargs)
+
+    monkeypatch.setattr(pa, 'mmap', types.SimpleNamespace(mmap=slow_mmap, ACCESS_READ=mmap.ACCESS_READ))
+    store = pa.BodyStore(str(tmp_path / 'notes.bodies'))
+    texts = [f'текст {number}' for number in range(60)]
+    refs = []
+    errors = []
+
+    def read(positions):
+        try:
+            if positions is None:
+                time.sleep(0.001)
+                positions = [len(refs) - 1]
+            for position in positions:
+                assert store.get(refs[position]) == texts[position]
+        except Exception as e:
+            errors.append(e)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for start in range(0, len(texts), 3):
+            refs.extend(store.put(text) for text in texts[start:start + 3])
+            list(pool.map(read, [list(range(len(refs) - 3)) * 200] * 7 + [None]))
+    store.close()
+    assert not errors, errors[0]
+
+
+# Записи в разные хранилища выполняются в пуле потоков параллельно
+def test_concurrent_writes_to_different_stores(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = pa.PersonalAssistantApp()
+    server = pa.ApiServer(app, workers=8)
+    stdout = sys.stdout
+    stores = [store for _ in range(25) for store in BODIES]
+
+    async def send_all():
+        return await asyncio.gather(*(server._dispatch('POST', f'/{store}', json.dumps(BODIES[store]).encode('utf-8'))
+                                      for store in stores))
+
+    try:
+        responses = asyncio.run(send_all())
+    finally:
+        server.close()
+        app.close()
+    assert sys.stdout is stdout
+    ids = {store: [] for store in BODIES}
+    for store, (status, payload) in zip(stores, responses):
+        assert status == 201, payload
+        assert payload['message'] == MESSAGES[store]
+        ids[store].append(payload['item']['id'])
+    assert all(sorted(store_ids) == list(range(1, 26)) for store_ids in ids.values())
@@ -0,0 +1,50 @@
+import io
+import subprocess
+import sys
+
+import pytest
+
+import personal_assistant as pa
+
+SCRIPT = pa.__file__
+
+
+def calculate(text, workers=1, chunk_size=3, variables=None):
+    destination = io.StringIO()
+    stats = pa.run_batch_calculator(io.StringIO(text), destination, workers, chunk_size, variables)
+    return destination.getvalue().splitlines(), stats
+
+
+# Результаты выводятся в порядке строк входа при любом размере блоков и числе процессов
+@pytest.mark.parametrize('workers', (1, 2))
+def test_results_keep_input_order(workers):
+    lines = [f'{number} * 2 + x' for number in range(50)]
+    output, stats = calculate('\n'.join(lines) + '\n', workers, 7, {'x': '1'})
+    assert [float(line) for line in output] == [number * 2 + 1 for number in range(50)]
+    assert stats['expressions'] == 50 and stats['errors'] == 0
+
+
+def test_error_lines_are_counted():
+    output, stats = calculate('1 / 0\n2 +\n\n3\n')
+    assert output[0].startswith('Ошибка') and output[1].startswith('Ошибка')
+    assert output[3] == '3.0'
+    assert stats['errors'] == 2
+
+
+# Слишком глубокое выражение - ошибка своей строки, остальные строки блока вычисляются
+@pytest.mark.parametrize('text', ('-' * 5000 + '1', '(' * 5000 + '1' + ')' * 5000, '+'.join(['1'] * 5000)),
+                         ids=('unary', 'parentheses', 'sum'))
+def test_deep_expression_is_a_line_error(text):
+    output, stats = calculate(f'1 + 1\n{text}\n2 * 3\n')
+    assert output[0] == '2.0' and output[2] == '6.0'
+    assert output[1].startswith('Ошибка')
+    assert stats['errors'] == 1
+
+
+@pytest.mark.parametrize('args', (['workers=2'], ['chunk=0', '-'], ['-', 'chunk=abc'], ['-', 'workers=-1']))
+def test_calcfile_rejects_bad_arguments(args):
+    result = subprocess.run([sys.executable, SCRIPT, 'calcfile', *args], input='1\n', capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 1
+    assert 'Использование' in result.stderr
+    assert result.stdout == ''
@@ -0,0 +1,62 @@
+import pytest
+
+import personal_assistant as pa
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2 + 3 * 4', 14),
+    ('(2 + 3) * 4', 20),
+    ('-2 ** 2', -4),
+    ('2 ** 3 ** 2', 512),
+    ('2 ** -1', 0.5),
+    ('7 % 3 - -1', 2),
+    ('10 / 4', 2.5),
+])
+def test_precedence(text, expected):
+    assert pa.compile_expression(text).evaluate() == expected
+
+
+@pytest.mark.parametrize('text', ('2 +', '(1 + 2', '1 2', '1 $ 2', '', '()', '(-8) ** 0.5'))
+def test_invalid_expressions(text):
+    with pytest.raises(ValueError):
+        pa.compile_expression(text).evaluate()
+
+
+def test_variables():
+    expression = pa.compile_expression('x * y + x')
+    assert expression.variables == ['x', 'y']
+    assert expression.evaluate({'x': '2', 'y': 3}) == 8
+    with pytest.raises(ValueError, match='Не задано значение переменной: y'):
+        expression.evaluate({'x': 1})
+    with pytest.raises(ValueError, match='должны быть числами'):
+        expression.evaluate({'x': 'abc', 'y': 1})
+
+
+# Поддеревья без переменных свёрнуты при компиляции; ошибка свёртки откладывается до вычисления
+def test_constant_folding():
+    assert pa.CompiledExpression('2 * 3 + x').program[0] == (pa.CALC_CONST, 6)
+    assert len(pa.CompiledExpression('2 * 3 + x').program) == 3
+    expression = pa.CompiledExpression('1 / 0 + x')
+    with pytest.raises(ZeroDivisionError):
+        expression.evaluate({'x': 1})
+
+
+# Вектором и построчно - одинаковые результаты; при ошибке в одном наборе - построчный расчёт с той же ошибкой
+def test_evaluate_many_matches_single():
+    expression = pa.CompiledExpression('x ** 2 / (y + 1)')
+    bindings = [{'x': number, 'y': number % 7} for number in range(200)]
+    assert expression.evaluate_many(bindings) == pytest.approx([expression.evaluate(values) for values in bindings])
+    bindings[150]['y'] = -1
+    with pytest.raises(ZeroDivisionError):
+        expression.evaluate_many(bindings)
+    assert pa.CompiledExpression('1 + 2').evaluate_many([{}, {}]) == [3, 3]
+
+
+# Повторный разбор той же формулы берётся из кеша
+def test_compile_cache():
+    before = pa.calculator_cache_info()
+    first = pa.compile_expression('z * 41 + 1')
+    second = pa.compile_expression('z * 41 + 1')
+    after = pa.calculator_cache_info()
+    assert first is second
+    assert after.hits - before.hits >= 1 and after.misses - before.misses <= 1
@@ -0,0 +1,61 @@
+import pytest
+
+import personal_assistant as pa
+
+ITEMS = [{'id': 1, 'title': 'Купить хлеб', 'done': False, 'amount': -12.5, 'due_date': None},
+         {'id': 2, 'title': 'Оплатить "связь"\n', 'done': True, 'amount': 3, 'due_date': '01-02-2024'}]
+SPECS = [fmt + compression for fmt in pa.Codec.FORMATS for compression in ('', '+gzip', '+lzma')]
+
+
+# Любой кодек читается без указания кодека: формат и сжатие определяются по содержимому
+@pytest.mark.parametrize('spec', SPECS)
+def test_round_trip_and_detection(spec):
+    data = pa.Codec(spec).encode(ITEMS)
+    assert pa.Codec.decode(data) == ITEMS
+    rows = pa.RecordRows(tuple(ITEMS[0]), [tuple(item.values()) for item in ITEMS])
+    assert pa.Codec.decode(pa.Codec(spec).encode(rows)) == ITEMS
+
+
+# Записи с разным набором полей (старые файлы) сохраняются по записи
+def test_marshal_keeps_mixed_records():
+    items = [{'id': 1, 'title': 'a'}, {'id': 2, 'title': 'b', 'extra': 1}]
+    assert pa.Codec.decode(pa.Codec('marshal+gzip').encode(items)) == items
+    assert pa.Codec.decode(pa.Codec('marshal').encode([])) == []
+
+
+def test_bad_data_and_specs():
+    with pytest.raises(IOError):
+        pa.Codec.decode(b'\x1f\x8bnot gzip')
+    with pytest.raises(IOError):
+        pa.Codec.decode(pa.Codec.MARSHAL_MAGIC + b'\x00')
+    for spec in ('yaml', 'json+zip'):
+        with pytest.raises(ValueError):
+            pa.Codec(spec)
+
+
+def test_codec_setting():
+    stores = ('notes', 'finance')
+    assert pa.parse_codec_setting(None, stores) == {'notes': 'json', 'finance': 'json'}
+    assert pa.parse_codec_setting('marshal+gzip', stores) == {'notes': 'marshal+gzip', 'finance': 'marshal+gzip'}
+    assert pa.parse_codec_setting('finance=json-compact', stores) == {'notes': 'json', 'finance': 'json-compact'}
+    with pytest.raises(ValueError):
+        pa.parse_codec_setting('tasks=marshal', stores)
+
+
+# Файл, записанный одним кодеком, открывается хранилищем с другим, и следующая запись - уже в его кодеке
+@pytest.mark.parametrize('mode', ('json', 'journal'))
+def test_storage_switches_codec(tmp_path, mode):
+    path = str(tmp_path / 'tasks.json')
+    tasks = pa.TaskManager(path, pa.make_storage(path, mode, 'marshal+lzma'))
+    tasks.add_task('a', '', 'Средний', '01-02-2024')
+    tasks.close()
+    tasks.storage.save([task.to_dict() for task in tasks.tasks], tasks._meta())
+    with open(path, 'rb') as f:
+        assert f.read().startswith(pa.Codec.LZMA_MAGIC)
+
+    reopened = pa.TaskManager(path, pa.make_storage(path, mode))
+    assert [task.title for task in reopened.tasks] == ['a']
+    reopened.add_task('b', '', 'Средний', None)
+    reopened.storage.save([task.to_dict() for task in reopened.tasks], reopened._meta())
+    with open(path, 'rb') as f:
+        assert f.read().startswith(b'[')
@@ -0,0 +1,56 @@
+import contextlib
+import json
+import sys
+
+import personal_assistant as pa
+
+
+def run(tmp_path, monkeypatch, capsys, argv, script=None):
+    monkeypatch.chdir(tmp_path)
+    if script is not None:
+        (tmp_path / 'script.txt').write_text(script, encoding='utf-8')
+    app = pa.PersonalAssistantApp()
+    code = pa.CommandLine(app).main(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        app.close()
+    captured = capsys.readouterr()
+    return code, [json.loads(line) for line in captured.out.splitlines()], captured.err
+
+
+def test_single_command(tmp_path, monkeypatch, capsys):
+    code, lines, _ = run(tmp_path, monkeypatch, capsys, ['tasks', 'add', 'title=Купить хлеб', 'priority=Высокий'])
+    assert code == 0
+    assert lines == [{"command": "tasks add 'title=Купить хлеб' 'priority=Высокий'", "status": 201,
+                      "item": {"id": 1, "title": "Купить хлеб", "description": "", "done": False,
+                               "priority": "Высокий", "due_date": None},
+                      "message": "Задача успешно добавлена."}]
+
+
+# Все команды сценария - один пакет: задачи записываются одной операцией в конце
+def test_script_writes_each_store_once(tmp_path, monkeypatch, capsys):
+    saves = []
+    original = pa.JsonStorage.save
+    monkeypatch.setattr(pa.JsonStorage, 'save', lambda self, items, meta=None: (saves.append(self.filepath),
+                                                                                original(self, items, meta))[1])
+    script = "# задачи\ntasks add title=a\ntasks add title=b\ntasks done 1\ntasks list\n"
+    code, lines, _ = run(tmp_path, monkeypatch, capsys, ['script', 'script.txt'], script)
+    assert code == 0
+    assert [line["status"] for line in lines] == [201, 201, 200, 200]
+    assert [item["done"] for item in lines[-1]["items"]] == [True, False]
+    assert saves == ['tasks.json']
+
+
+def test_failed_command_sets_exit_code(tmp_path, monkeypatch, capsys):
+    code, lines, _ = run(tmp_path, monkeypatch, capsys, ['script', 'script.txt'], "tasks add title=a\ntasks done 7\n")
+    assert code == 1
+    assert [line["status"] for line in lines] == [201, 404]
+
+
+# Изменения не записались при выходе из пакета: код 1 и последняя строка с ошибкой, хотя команда отчиталась 201
+def test_failed_flush_sets_exit_code(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'tasks.json.tmp').mkdir()
+    code, lines, err = run(tmp_path, monkeypatch, capsys, ['script', 'script.txt'], "tasks add title=a\n")
+    assert code == 1
+    assert lines[0]["status"] == 201
+    assert lines[-1] == {"command": "script script.txt", "status": 500, "error": "Изменения не сохранены: tasks."}
+    assert "Ошибка сохранения задач" in err
@@ -0,0 +1,60 @@
+import pytest
+
+import personal_assistant as pa
+
+CONTACTS = [
+    ('Иван Петров', '+7 (900) 123-45-67', 'ivan@gmail.com'),
+    ('Anna Smith', '89161234500', 'anna@work.org'),
+    ('Пётр', '', 'petr@gmail.com'),
+    ('Мария', '555', ''),
+]
+
+
+def open_contacts(path, mode):
+    contacts = pa.ContactManager(str(path), pa.make_storage(str(path), mode))
+    for name, phone, email in CONTACTS:
+        contacts.add_contact(name, pa.normalize_phone(phone), email)
+    return contacts
+
+
+# Индекс и SQLite находят одно и то же: подстроку имени, цифры телефона и часть email
+@pytest.mark.parametrize('mode', ('json', 'sqlite'))
+@pytest.mark.parametrize('keyword, expected', [
+    ('ан', [1]),
+    ('nn', [2]),
+    ('А', [1, 4]),
+    ('петр', [1]),
+    ('1234', [1, 2]),
+    ('67', [1]),
+    ('+7 900', [1]),
+    ('gmail.com', [1, 3]),
+    ('@gmail.com', [1, 3]),
+    ('@work', [2]),
+    ('petr@', [3]),
+    ('иван петров', [1]),
+    ('xyz', []),
+])
+def test_search_rules(tmp_path, mode, keyword, expected):
+    contacts = open_contacts(tmp_path / 'contacts.json', mode)
+    assert [contact.id for contact in contacts._search_contacts(keyword)] == expected
+
+
+# Запрос из одного-двух символов отвечается из индекса, без перебора всех записей
+def test_short_query_does_not_scan_entries():
+    class NoScan(dict):
+        def __iter__(self):
+            raise AssertionError("перебор всех контактов")
+
+        def values(self):
+            raise AssertionError("перебор всех контактов")
+
+    index = pa.ContactIndex()
+    for number in range(2000):
+        index.add(pa.Contact(id=number, name=f'Контакт {number}', phone=f'7900{number:07d}',
+                             email=f'user{number}@example.com'))
+    index.add(pa.Contact(id=5000, name='Юлия', phone='', email='yu@mail.ru'))
+    index.entries = NoScan(index.entries)
+    assert index.search('юл') == {5000}
+    assert index.search('ю') == {5000}
+    assert index.search('ru') == {5000}
+    assert index.search('mail.ru') == {5000}
@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+import personal_assistant as pa
+
+# Путь, занятый каталогом, на месте файла, который пишет хранилище: запись падает с OSError
+BLOCKED = {'json': 'tasks.json.tmp', 'journal': 'tasks.json.journal'}
+
+
+def open_tasks(path, mode):
+    return pa.TaskManager(str(path), pa.make_storage(str(path), mode))
+
+
+def titles(path, mode):
+    return [task.title for task in open_tasks(path, mode).tasks]
+
+
+# Пакет не записался: изменения остаются отложенными и записываются следующим flush
+@pytest.mark.parametrize('mode', ('json', 'journal'))
+def test_failed_batch_keeps_changes(tmp_path, mode, capsys):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, mode)
+    os.mkdir(tmp_path / BLOCKED[mode])
+    with tasks.batch():
+        tasks.add_task('a', '', 'Средний', None)
+        tasks.add_task('b', '', 'Средний', None)
+        tasks.mark_task_done(1)
+    assert 'Ошибка сохранения задач' in capsys.readouterr().out
+    assert sorted(tasks._pending) == [1, 2]
+
+    os.rmdir(tmp_path / BLOCKED[mode])
+    assert tasks.flush() is True
+    assert not tasks._pending
+    reopened = open_tasks(path, mode)
+    assert [(task.title, task.done) for task in reopened.tasks] == [('a', True), ('b', False)]
+
+
+# Ошибка отложенной записи в потоке таймера не теряет изменения
+def test_failed_write_behind_keeps_changes(tmp_path, capsys):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, 'json')
+    tasks.set_write_behind(0.01)
+    os.mkdir(tmp_path / 'tasks.json.tmp')
+    tasks.add_task('a', '', 'Средний', None)
+    deadline = time.monotonic() + 5
+    while tasks._flush_timer is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'Ошибка сохранения задач' in capsys.readouterr().out
+    assert list(tasks._pending) == [1]
+
+    os.rmdir(tmp_path / 'tasks.json.tmp')
+    tasks.close()
+    assert titles(path, 'json') == ['a']
+
+
+# Неудачная прямая запись повторяется со следующим изменением
+def test_failed_write_is_retried_with_next_change(tmp_path):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, 'journal')
+    os.mkdir(tmp_path / 'tasks.json.journal')
+    tasks.add_task('a', '', 'Средний', None)
+    assert list(tasks._pending) == [1]
+    os.rmdir(tmp_path / 'tasks.json.journal')
+    tasks.add_task('b', '', 'Средний', None)
+    assert not tasks._pending
+    assert titles(path, 'journal') == ['a', 'b']
+
+
+# Изменение, отклонённое из-за конфликта, не остаётся отложенным и не повторяется
+def test_conflicting_change_is_dropped(tmp_path, capsys):
+    path = tmp_path / 'tasks.json'
+    first = open_tasks(path, 'json')
+    first.add_task('a', '', 'Средний', None)
+    second = open_tasks(path, 'json')
+    first.edit_task(1, 'первый', '', 'Средний', None)
+    with second.batch():
+        second.edit_task(1, 'второй', '', 'Средний', None)
+    assert 'Конфликт' in capsys.readouterr().out
+    assert not second._pending
+    assert titles(path, 'json') == ['первый']
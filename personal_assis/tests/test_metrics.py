@@ -0,0 +1,65 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import personal_assistant as pa
+
+
+def test_timed_operations():
+    metrics = pa.Metrics()
+    metrics.enabled = True
+
+    def inner():
+        metrics.add_bytes(read=10)
+
+    def outer(fail=False):
+        metrics.add_bytes(written=5)
+        metrics.timed('inner', inner)()
+        if fail:
+            raise ValueError
+
+    outer = metrics.timed('outer', outer)
+    outer()
+    with pytest.raises(ValueError):
+        outer(fail=True)
+    metrics.add_bytes(read=1)
+    operations = metrics.snapshot()['operations']
+    assert operations['outer']['calls'] == 2 and operations['outer']['errors'] == 1
+    # Байты относятся к самой внутренней измеряемой операции
+    assert (operations['outer']['bytes_written'], operations['outer']['bytes_read']) == (10, 0)
+    assert operations['inner']['bytes_read'] == 20
+    assert operations['other']['bytes_read'] == 1
+    assert sum(operations['inner']['buckets'].values()) == 2
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = pa.Metrics()
+    for seconds in (0.00005, 0.002, 0.002, 2):
+        metrics.observe('op', seconds)
+    lines = metrics.prometheus().splitlines()
+    assert 'pa_operation_seconds_bucket{op="op",le="0.0001"} 1' in lines
+    assert 'pa_operation_seconds_bucket{op="op",le="0.005"} 3' in lines
+    assert 'pa_operation_seconds_bucket{op="op",le="+Inf"} 4' in lines
+    assert 'pa_operation_seconds_count{op="op"} 4' in lines
+    with pytest.raises(ValueError):
+        metrics.render('xml')
+
+
+def test_metrics_setting():
+    assert pa.parse_metrics_setting('') == ('json', 'stderr')
+    assert pa.parse_metrics_setting('prometheus:metrics.prom') == ('prometheus', 'metrics.prom')
+    with pytest.raises(ValueError):
+        pa.parse_metrics_setting('xml')
+
+
+# Метрики включаются только по запросу: обёртки ставятся в отдельном процессе, итог выводится при выходе
+def test_command_with_metrics(tmp_path):
+    result = subprocess.run([sys.executable, pa.__file__, '--metrics=json:metrics.json', 'tasks', 'add', 'title=a'],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    operations = json.loads((tmp_path / 'metrics.json').read_text(encoding='utf-8'))['operations']
+    assert operations['tasks.add']['calls'] == 1
+    assert operations['tasks.save']['bytes_written'] > 0
+    assert not pa.METRICS.enabled
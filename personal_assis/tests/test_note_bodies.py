@@ -0,0 +1,88 @@
+import os
+
+import personal_assistant as pa
+
+
+def open_notes(path):
+    return pa.NoteManager(str(path), pa.make_storage(str(path), 'json'))
+
+
+def contents(notes):
+    return {note.id: notes.get_note_by_id(note.id).content for note in notes.notes}
+
+
+def test_bodies_are_stored_out_of_line(tmp_path):
+    notes = open_notes(tmp_path / 'notes.json')
+    notes.create_note('Первая', 'текст первой заметки')
+    notes.create_note('Вторая', 'текст второй')
+    assert all(note.content is None for note in notes.notes)
+    with open(tmp_path / 'notes.json', encoding='utf-8') as f:
+        assert 'текст' not in f.read()
+    assert contents(open_notes(tmp_path / 'notes.json')) == {1: 'текст первой заметки', 2: 'текст второй'}
+
+
+# Файл текстов переписывается, когда мусора больше, чем живых текстов; старый файл удаляется
+def test_body_file_compaction(tmp_path):
+    notes = open_notes(tmp_path / 'notes.json')
+    notes.BODY_COMPACT_MIN = 100
+    for number in range(10):
+        notes.create_note(f'n{number}', 'старый текст ' * 10)
+    first_file = notes._bodies.path
+    for number in range(1, 11):
+        notes.edit_note(number, f'n{number}', f'новый {number}')
+
+    assert notes._bodies.path != first_file
+    assert not os.path.exists(first_file)
+    assert os.path.getsize(notes._bodies.path) == sum(len(f'новый {number}'.encode()) for number in range(1, 11))
+    expected = {number: f'новый {number}' for number in range(1, 11)}
+    assert contents(notes) == expected
+    assert contents(open_notes(tmp_path / 'notes.json')) == expected
+
+
+# Снимок не записался: старый файл текстов и ссылки на него остаются, тексты не теряются
+def test_failed_compacting_save_keeps_old_bodies(tmp_path, monkeypatch):
+    path = tmp_path / 'notes.json'
+    notes = open_notes(path)
+    for number in range(10):
+        notes.create_note(f'n{number}', 'старый текст ' * 10)
+    for number in range(1, 11):
+        notes.edit_note(number, f'n{number}', f'новый {number}')
+    old_file = notes._bodies.path
+    notes.BODY_COMPACT_MIN = 100
+
+    def failing_save(items, meta=None):
+        raise IOError("нет места на диске")
+
+    monkeypatch.setattr(notes.storage, 'save', failing_save)
+
+    assert notes._save_items() is False
+    assert notes._bodies.path == old_file and os.path.exists(old_file)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.bodies')) == [os.path.basename(old_file)]
+    expected = {number: f'новый {number}' for number in range(1, 11)}
+    assert contents(notes) == expected
+    assert contents(open_notes(path)) == expected
+
+    monkeypatch.undo()
+    assert notes._save_items() is True
+    assert not os.path.exists(old_file)
+    assert contents(open_notes(path)) == expected
+
+
+# Файлы изменены другим процессом: изменения сливаются без уплотнения, ссылки чужих записей остаются верными
+def test_no_compaction_while_merging(tmp_path):
+    path = tmp_path / 'notes.json'
+    notes = open_notes(path)
+    for number in range(5):
+        notes.create_note(f'n{number}', 'старый текст ' * 10)
+    for number in range(1, 6):
+        notes.edit_note(number, f'n{number}', f'новый {number}')
+    other = open_notes(path)
+    other.create_note('чужая', 'текст другого процесса')
+    notes.BODY_COMPACT_MIN = 100
+    old_file = notes._bodies.path
+
+    notes.edit_note(1, 'n1', 'правка')
+    assert os.path.exists(old_file)
+    reopened = open_notes(path)
+    assert reopened.get_note_by_id(6).content == 'текст другого процесса'
+    assert reopened.get_note_by_id(1).content == 'правка'
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+MODES = ('json', 'sqlite')
+
+
+def walk(manager, filter_by, sort, limit=3):
+    walked, cursor = [], None
+    while True:
+        page = manager.filtered_page(filter_by, cursor, limit, sort)
+        walked += [item.id for item in page.items]
+        cursor = page.cursor
+        if cursor is None:
+            return walked
+
+
+@pytest.fixture
+def tasks(tmp_path, request):
+    path = tmp_path / 'tasks.json'
+    tasks = pa.TaskManager(str(path), pa.make_storage(str(path), request.param))
+    rng = random.Random(7)
+    with tasks.batch():
+        for number in range(40):
+            due = None if number % 5 == 0 else f'{rng.randint(1, 28):02d}-0{rng.randint(1, 3)}-2024'
+            tasks.add_task(f't{number}', '', rng.choice(tasks.PRIORITIES), due)
+        for task_id in range(1, 41, 3):
+            tasks.mark_task_done(task_id)
+    return tasks
+
+
+# Страницы с фильтром проходят ровно отфильтрованные задачи в порядке сортировки
+@pytest.mark.parametrize('tasks', MODES, indirect=True)
+@pytest.mark.parametrize('filter_by', [('status', False), [('priority', 'Высокий'), ('due_from', '10-02-2024')]])
+@pytest.mark.parametrize('sort', ('id', 'due'))
+def test_filtered_pages_walk_filtered_tasks(tasks, filter_by, sort):
+    expected = sorted(tasks._filter_tasks(filter_by), key=tasks.SORT_KEYS[sort][1])
+    assert walk(tasks, filter_by, sort) == [task.id for task in expected]
+
+
+# В SQLite фильтр, курсор и LIMIT уходят в один запрос: отфильтрованный набор целиком не читается
+@pytest.mark.parametrize('tasks', ['sqlite'], indirect=True)
+def test_sqlite_filtered_page_pushes_down_cursor_and_limit(tasks, monkeypatch):
+    queries = []
+    select = tasks.storage.select
+
+    def recording(conditions=(), order_by='id', limit=None):
+        queries.append((list(conditions), order_by, limit))
+        return select(conditions, order_by, limit)
+
+    monkeypatch.setattr(tasks.storage, 'select', recording)
+    first = tasks.filtered_page(('status', False), None, 4, 'due')
+    second = tasks.filtered_page(('status', False), first.cursor, 4, 'due')
+    assert [limit for _, _, limit in queries] == [5, 5]
+    assert queries[0][0] == [('done', '=', False), ('due_key', '>', 0)]
+    assert queries[1][0] == [('done', '=', False), [('due_key', '>', first.cursor[0]), ('id', '>', first.cursor[1])],
+                             ('due_key', '>=', first.cursor[0])]
+    assert not set(task.id for task in first.items) & set(task.id for task in second.items)
+
+
+# Отложенные в пакете изменения видны на странице с фильтром в ленивом хранилище
+@pytest.mark.parametrize('tasks', ['sqlite'], indirect=True)
+def test_filtered_page_sees_pending_changes(tasks):
+    with tasks.batch():
+        task = tasks.add_task('новая', '', 'Высокий', None)
+        tasks.mark_task_done(2)
+        ids = walk(tasks, ('status', False), 'id', 5)
+    assert task.id in ids and 2 not in ids
+    assert ids == [found.id for found in tasks._filter_tasks(('status', False))]
+
+
+@pytest.mark.parametrize('partitions', (None, 'month'))
+def test_filtered_finance_pages(tmp_path, monkeypatch, partitions):
+    monkeypatch.chdir(tmp_path)
+    app = pa.PersonalAssistantApp(storage_mode='sqlite', finance_partitions=partitions)
+    finance = app.finance_manager
+    rng = random.Random(3)
+    with finance.batch():
+        for number in range(60):
+            finance.add_record(rng.choice((-5, 7)), rng.choice(('еда', 'Транспорт')),
+                               f'{rng.randint(1, 3):02d}-{rng.randint(1, 6):02d}-2024', '')
+    try:
+        for filter_by in (('category', 'транспорт'), ('date', '02-03-2024')):
+            for sort in ('id', 'date'):
+                expected = sorted(finance._filter_records(filter_by), key=finance.SORT_KEYS[sort][1])
+                assert walk(finance, filter_by, sort, 4) == [record.id for record in expected]
+    finally:
+        app.close()
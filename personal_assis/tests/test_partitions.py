@@ -0,0 +1,124 @@
+import json
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+
+def record(record_id, day, month, year=2024, amount=-10, category='еда'):
+    return {'id': record_id, 'amount': amount, 'category': category,
+            'date': f'{day:02d}-{month:02d}-{year}' if day else None, 'description': ''}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = pa.PartitionedStorage(str(tmp_path / 'finance.json'), 'month')
+    storage.bind(pa.FinanceManager.sql_table, pa.FinanceManager.sql_columns)
+    return storage
+
+
+# Чтение секций с диска: имена секций по порядку чтения
+@pytest.fixture
+def reads(monkeypatch):
+    names = []
+    original = pa.JournalStorage.load
+
+    def load(self):
+        names.append(self.filepath.rsplit('/', 1)[-1])
+        return original(self)
+
+    monkeypatch.setattr(pa.JournalStorage, 'load', load)
+    return names
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def brute(items, conditions, order_by, limit=None):
+    match = pa.condition_matcher(conditions, lambda data, column: data['id'] if column == 'id'
+                                 else pa.FinanceManager.sql_columns[column](data))
+    found = sorted((data for data in items if match(data)),
+                   key=pa.order_key(order_by, lambda data, column: data['id'] if column == 'id'
+                                    else pa.FinanceManager.sql_columns[column](data)))
+    return ids(found[:limit])
+
+
+# Выборки совпадают с перебором после добавлений, удалений и переноса записей между секциями
+def test_select_and_count_match_scan(storage):
+    rng = random.Random(5)
+    items = {}
+    for record_id in range(1, 301):
+        items[record_id] = record(record_id, rng.randint(0, 28), rng.randint(1, 12), rng.choice((2023, 2024)),
+                                  category=rng.choice('ab'))
+    storage.save(list(items.values()))
+    for record_id in rng.sample(range(1, 301), 40):
+        del items[record_id]
+        storage.append([('delete', record_id)])
+    for record_id in rng.sample(sorted(items), 40):
+        items[record_id] = record(record_id, rng.randint(1, 28), rng.randint(1, 12), 2025)
+        storage.append([('put', items[record_id])])
+
+    low, high = pa.date_to_ordinal('10-03-2023'), pa.date_to_ordinal('20-02-2024')
+    queries = [
+        ([], 'id', None),
+        ([], 'id', 7),
+        ([('id', '>', 150)], 'id', 10),
+        ([('date_ord', '>=', low), ('date_ord', '<=', high)], 'date_ord, id', 15),
+        ([('date_ord', '>=', low), ('category_key', '=', 'a')], 'date_ord, id', None),
+        ([[('category_key', '=', 'b'), ('id', '<', 20)]], 'amount, id', 5),
+    ]
+    for conditions, order_by, limit in queries:
+        assert ids(storage.select(conditions, order_by, limit)) == brute(items.values(), conditions, order_by, limit)
+        assert storage.count(conditions) == len(brute(items.values(), conditions, order_by))
+    assert all(storage.get(record_id) == data for record_id, data in items.items())
+
+
+# Страница по дате читает только первые секции, страница по ID после курсора - только секции с большими ID
+def test_select_with_limit_reads_few_partitions(storage, reads):
+    storage.save([record(month * 100 + day, day, month) for month in range(1, 13) for day in range(1, 29)])
+    storage._cache.clear()
+    assert ids(storage.select((), 'date_ord, id', 30)) == [101 + day for day in range(28)] + [201, 202]
+    assert reads == ['2024-01.json', '2024-02.json']
+
+    reads.clear()
+    storage._cache.clear()
+    assert ids(storage.select([('id', '>', 1000)], 'id', 5)) == [1001, 1002, 1003, 1004, 1005]
+    assert reads == ['2024-10.json']
+
+
+# Запись по ID повторно не распаковывается, а дописанная в секцию запись видна сразу
+def test_get_reuses_decoded_partition(storage, reads):
+    storage.save([record(record_id, 1, 1, 2020) for record_id in range(1, 50)]
+                 + [record(100 + month, 1, month) for month in range(1, 6)])
+    assert storage._manifest()['partitions']['2020-01']['cold']
+    reads.clear()
+    assert storage.get(7)['id'] == 7 and storage.get(8)['id'] == 8 and storage.get(49)['id'] == 49
+    assert reads == ['2020-01.json']
+    storage.append([('put', dict(record(50, 2, 1, 2020), description='новая'))])
+    assert storage.get(50)['description'] == 'новая'
+
+
+# Диапазон дат, покрывающий секции целиком, считается по оглавлению
+def test_count_uses_manifest_for_whole_partitions(storage, reads):
+    storage.save([record(month * 100 + day, day, month) for month in range(1, 13) for day in range(1, 29)])
+    storage._cache.clear()
+    reads.clear()
+    conditions = [('date_ord', '>=', pa.date_to_ordinal('01-03-2024')), ('date_ord', '<=', pa.date_to_ordinal('15-06-2024'))]
+    assert storage.count(conditions) == 3 * 28 + 15
+    assert reads == ['2024-06.json']
+
+
+# Оглавление без диапазонов ID (записанное до их появления) читается: такие секции просто не отсеиваются
+def test_manifest_without_id_ranges(storage):
+    storage.save([record(record_id, 1, record_id % 12 + 1) for record_id in range(1, 61)])
+    with open(storage.manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    for info in manifest['partitions'].values():
+        del info['ids']
+    with open(storage.manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    storage.append([('put', record(61, 5, 5))])
+    assert ids(storage.select([('id', '>', 55)], 'id', 3)) == [56, 57, 58]
+    assert storage.get(61)['id'] == 61
@@ -0,0 +1,197 @@
+import json
+import os
+
+import pytest
+
+import personal_assistant as pa
+
+MODES = ('json', 'journal', 'sqlite')
+
+
+def open_tasks(path, mode):
+    return pa.TaskManager(str(path), pa.make_storage(str(path), mode))
+
+
+def test_journal_replay(tmp_path):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, 'journal')
+    for title in ('a', 'b', 'c'):
+        tasks.add_task(title, '', 'Средний', '01-02-2024')
+    tasks.edit_task(2, 'b2', 'описание', 'Высокий', None)
+    tasks.delete_task(3)
+    assert os.path.exists(tasks.storage.journal_path)
+
+    reopened = open_tasks(path, 'journal')
+    assert [task.to_dict() for task in reopened.tasks] == [task.to_dict() for task in tasks.tasks]
+    assert reopened.get_task_by_id(3) is None
+
+
+# Недописанная после сбоя строка журнала отбрасывается и обрезается
+def test_journal_drops_torn_line(tmp_path):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, 'journal')
+    tasks.add_task('a', '', 'Средний', None)
+    with open(tasks.storage.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "put", "data": {"id": 2')
+    reopened = open_tasks(path, 'journal')
+    assert [task.id for task in reopened.tasks] == [1]
+    with open(reopened.storage.journal_path, encoding='utf-8') as f:
+        assert all(json.loads(line) for line in f)
+
+
+def test_journal_compaction(tmp_path):
+    path = tmp_path / 'tasks.json'
+    tasks = pa.TaskManager(str(path), pa.JournalStorage(str(path), compact_threshold=5))
+    for number in range(4):
+        tasks.add_task(f't{number}', '', 'Низкий', None)
+    assert tasks.storage.journal_size == 4
+    tasks.add_task('t4', '', 'Низкий', None)
+    assert not os.path.exists(tasks.storage.journal_path)
+    assert tasks.storage.journal_size == 0
+
+    reopened = open_tasks(path, 'journal')
+    assert [task.title for task in reopened.tasks] == [f't{number}' for number in range(5)]
+    assert reopened._next_id == 6
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_next_id_survives_delete(tmp_path, mode):
+    path = tmp_path / 'tasks.json'
+    tasks = open_tasks(path, mode)
+    for title in ('a', 'b', 'c'):
+        tasks.add_task(title, '', 'Средний', None)
+    for task_id in (1, 2, 3):
+        tasks.delete_task(task_id)
+    tasks.close()
+
+    reopened = open_tasks(path, mode)
+    assert reopened.add_task('d', '', 'Средний', None).id == 4
+
+
+# Два процесса добавляют запись с одним и тем же ID: второй получает следующий свободный
+@pytest.mark.parametrize('mode', MODES)
+def test_merge_renumbers_new_record(tmp_path, mode, capsys):
+    path = tmp_path / 'tasks.json'
+    first = open_tasks(path, mode)
+    second = open_tasks(path, mode)
+    first.add_task('a', '', 'Высокий', None)
+    task = second.add_task('b', '', 'Низкий', None)
+    assert 'сохранена с ID 2' in capsys.readouterr().out
+    assert task.id == 2
+    assert second.get_task_by_id(2).title == 'b'
+    assert second.get_task_by_id(1).title == 'a'
+    if not second.storage.lazy:
+        assert [found.id for found in second._filter_tasks(('priority', 'Низкий'))] == [2]
+    assert [found.title for found in open_tasks(path, mode).tasks] == ['a', 'b']
+
+
+# Изменение записи, которую после прочтения поменял другой процесс, не записывается.
+# В SQLite запись перед изменением читается с диска, поэтому устаревшей копии там не бывает
+@pytest.mark.parametrize('mode', ('json', 'journal'))
+def test_merge_conflict_rejects_stale_edit(tmp_path, mode, capsys):
+    path = tmp_path / 'contacts.json'
+    first = pa.ContactManager(str(path), pa.make_storage(str(path), mode))
+    first.add_contact('Анна', '111', '')
+    second = pa.ContactManager(str(path), pa.make_storage(str(path), mode))
+    first.edit_contact(1, 'Анна Петрова', '222', '')
+    capsys.readouterr()
+
+    assert second.edit_contact(1, 'Аня', '333', '') is None
+    output = capsys.readouterr().out
+    assert 'Конфликт' in output and 'успешно' not in output
+    assert second.delete_contact(1) is not None
+    assert pa.ContactManager(str(path), pa.make_storage(str(path), mode)).get_contact_by_id(1) is None
+
+
+def test_merge_conflict_rejects_stale_delete(tmp_path, capsys):
+    path = tmp_path / 'finance.json'
+    first = pa.FinanceManager(str(path), pa.make_storage(str(path), 'journal'))
+    first.add_record(-10, 'еда', '01-02-2024', '')
+    second = pa.FinanceManager(str(path), pa.make_storage(str(path), 'journal'))
+    first.delete_record(1)
+    capsys.readouterr()
+    assert second.delete_record(1) is None
+    output = capsys.readouterr().out
+    assert 'Конфликт' in output and 'удалена' not in output
+    assert second._aggregates.balance() == 0
+
+
+# Индексы в памяти после добавления, изменения и удаления совпадают с перебором записей
+def test_task_indexes_follow_changes(tmp_path):
+    tasks = open_tasks(tmp_path / 'tasks.json', 'json')
+    for number in range(30):
+        due = None if number % 4 == 0 else f'{number % 28 + 1:02d}-03-2024'
+        tasks.add_task(f't{number}', '', tasks.PRIORITIES[number % 3], due)
+    for task_id in range(1, 31, 5):
+        tasks.edit_task(task_id, 'изменена', '', 'Низкий', '15-03-2024', done=True)
+    for task_id in range(3, 31, 7):
+        tasks.mark_task_done(task_id)
+    for task_id in range(2, 31, 6):
+        tasks.delete_task(task_id)
+
+    every = list(tasks.tasks)
+    filters = [
+        [('status', True)],
+        [('status', False), ('priority', 'Низкий')],
+        [('due_date', '15-03-2024')],
+        [('due_from', '10-03-2024'), ('due_by', '20-03-2024')],
+    ]
+    expected = [
+        [task for task in every if task.done],
+        [task for task in every if not task.done and task.priority == 'Низкий'],
+        [task for task in every if task.due_date == '15-03-2024'],
+        [task for task in every if task.due_date and pa.date_to_ordinal('10-03-2024')
+         <= pa.date_to_ordinal(task.due_date) <= pa.date_to_ordinal('20-03-2024')],
+    ]
+    for conditions, wanted in zip(filters, expected):
+        assert [task.id for task in tasks._filter_tasks(conditions)] == [task.id for task in wanted]
+
+    pending = sorted((task for task in every if not task.done and task.due_date),
+                     key=lambda task: (pa.date_to_ordinal(task.due_date), task.id))
+    assert [task.id for task in tasks._due_tasks()] == [task.id for task in pending]
+
+    walked, cursor = [], None
+    while True:
+        page = tasks.page(cursor, 4, 'due')
+        walked += [task.id for task in page.items]
+        cursor = page.cursor
+        if cursor is None:
+            break
+    assert walked == [task.id for task in sorted(every, key=tasks.SORT_KEYS['due'][1])]
+
+
+@pytest.mark.parametrize('columnar', (False, True))
+def test_finance_indexes_follow_changes(tmp_path, columnar):
+    path = tmp_path / 'finance.json'
+    finance = pa.FinanceManager(str(path), pa.make_storage(str(path), 'json'), columnar=columnar)
+    for number in range(20):
+        finance.add_record(number - 10 or 1, 'ab'[number % 2], f'{number % 5 + 1:02d}-04-2024', '')
+    for record_id in range(1, 21, 3):
+        finance.delete_record(record_id)
+
+    every = list(finance.records)
+    assert ([record.id for record in finance._filter_records(('date', '2-4-2024'))]
+            == [record.id for record in every if record.date == '02-04-2024'])
+    assert finance._aggregates.balance() == sum(record.amount for record in every)
+    assert ([record.id for record in finance.page(None, 100, 'date').items]
+            == [record.id for record in sorted(every, key=lambda record: (pa.date_to_ordinal(record.date), record.id))])
+
+
+def test_contact_index_follows_changes(tmp_path):
+    contacts = pa.ContactManager(str(tmp_path / 'contacts.json'), pa.make_storage(str(tmp_path / 'contacts.json'), 'json'))
+    contacts.add_contact('Иван Петров', '79001234567', 'ivan@example.com')
+    contacts.add_contact('Пётр Иванов', '79007654321', 'petr@example.com')
+    contacts.add_contact('Мария', '', '')
+    contacts.edit_contact(1, 'Иван Сидоров', '79005550000', 'sidorov@example.com')
+    contacts.delete_contact(3)
+
+    def found(keyword):
+        return [contact.id for contact in contacts._search_contacts(keyword)]
+
+    assert found('петров') == []
+    assert found('сидоров') == [1]
+    assert found('иван') == [1, 2]
+    assert found('555') == [1]
+    assert found('1234') == []
+    assert found('petr@') == [2]
+    assert found('мар') == []
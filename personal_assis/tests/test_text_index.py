@@ -0,0 +1,65 @@
+import json
+
+import personal_assistant as pa
+
+
+def ranked(index, query):
+    return [doc_id for doc_id, _ in index.search(query)]
+
+
+def test_title_and_rare_terms_rank_higher():
+    index = pa.TextIndex()
+    index.add(1, 'Покупки', 'молоко хлеб сыр')
+    index.add(2, 'Молоко', 'купить в магазине')
+    index.add(3, 'Дела', 'позвонить маме, купить молоко')
+    assert ranked(index, 'молоко') == [2, 1, 3]
+    # Редкое слово весит больше частого: документ со "сыр" выше документов только с "молоко"
+    assert ranked(index, 'молоко сыр')[0] == 1
+    assert ranked(index, 'нет такого') == []
+
+
+def test_stemming_matches_word_forms():
+    index = pa.TextIndex()
+    index.add(1, 'Заметки по работе', '')
+    assert ranked(index, 'заметка') == [1]
+    assert ranked(pa.TextIndex(stem=False), 'заметка') == []
+
+
+# Удаление и замена документа убирают его старые термины и длину
+def test_remove_and_replace():
+    index = pa.TextIndex()
+    index.add(1, 'альфа', 'бета')
+    index.add(2, 'гамма', 'бета')
+    index.add(1, 'дельта', '')
+    assert ranked(index, 'альфа') == []
+    assert ranked(index, 'дельта') == [1]
+    index.remove(2)
+    assert ranked(index, 'бета') == []
+    assert set(index.postings) == {'дельт'} and index.total_length == sum(index.lengths.values())
+
+
+def test_round_trip_keeps_scores():
+    index = pa.TextIndex()
+    for number, text in enumerate(('первая заметка о доме', 'вторая заметка о работе', 'список дел по дому'), 1):
+        index.add(number, f'заметка {number}', text)
+    index.generation = 7
+    restored = pa.TextIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+    assert restored.generation == 7
+    assert restored.search('заметка дом') == index.search('заметка дом')
+    restored.remove(1)
+    assert ranked(restored, 'первая') == []
+
+
+# Индекс менеджера заметок следует за изменениями и сохраняется между запусками
+def test_note_search_follows_changes(tmp_path, capsys):
+    path = str(tmp_path / 'notes.json')
+    notes = pa.NoteManager(path, pa.make_storage(path, 'json'))
+    notes.create_note('Отпуск', 'билеты на море')
+    notes.create_note('Работа', 'отчёт до пятницы')
+    notes.edit_note(2, 'Работа', 'купить билеты на поезд')
+    notes.delete_note(1)
+    notes.close()
+    reopened = pa.NoteManager(path, pa.make_storage(path, 'json'))
+    results = reopened.search_notes('билеты', 10)
+    assert [note.id for note, _, _ in results] == [2]
+    assert 'билеты' in results[0][2]